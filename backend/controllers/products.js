@@ -104,6 +104,40 @@ exports.getProductById = async (req, res, next) => {
   }
 };
 
+// Получение похожих по составу продуктов (списки заранее рассчитывает product_similarity.py)
+exports.getSimilarProducts = async (req, res, next) => {
+  try {
+    const { id } = req.params;
+    
+    const query = `
+      SELECT 
+        p.id, p.name, p.proteins, p.fats, p.carbs, p.calories, p.water, 
+        p.serving_size, p.image_url, p.description,
+        c.id as category_id, c.name as category_name, c.slug as category_slug,
+        s.distance
+      FROM 
+        product_similar s
+      JOIN 
+        products p ON s.similar_id = p.id
+      JOIN 
+        product_categories c ON p.category_id = c.id
+      WHERE 
+        s.product_id = $1 AND p.is_active = true
+      ORDER BY 
+        s.rank
+    `;
+    
+    const result = await pool.query(query, [id]);
+    
+    res.status(200).json({
+      success: true,
+      data: result.rows
+    });
+  } catch (error) {
+    next(error);
+  }
+};
+
 // Получение всех категорий
 exports.getAllCategories = async (req, res, next) => {
   try {
@@ -212,7 +246,120 @@ exports.getProductsByCategory = async (req, res, next) => {
   }
 };
 
-// Поиск продуктов
+// Поля продукта в результатах поиска
+const searchColumns = `
+  p.id, p.name, p.proteins, p.fats, p.carbs, p.calories, p.water,
+  p.serving_size, p.image_url, p.description,
+  c.id as category_id, c.name as category_name, c.slug as category_slug
+`;
+
+// Символы, которые в шаблоне LIKE нужно экранировать
+const likeSpecialRe = /([\\%_])/g;
+
+// Установлено ли расширение pg_trgm (проверяется один раз при первом поиске)
+let trigramAvailable = null;
+
+const hasTrigram = async () => {
+  if (trigramAvailable === null) {
+    const result = await pool.query("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'");
+    trigramAvailable = result.rows.length > 0;
+  }
+  return trigramAvailable;
+};
+
+// Слова поискового запроса (буквы и цифры любого алфавита)
+const queryTokens = (text) => text.toLowerCase().match(/[\p{L}\p{N}_]+/gu) || [];
+
+// Выражение tsquery для поиска по префиксам всех слов: каждое слово ищется как префикс
+// и без стемминга ('simple'), и после русского стеммера ("кур" находит "курица").
+// Параметры слов начинаются с номера firstParam
+const buildTsquery = (tokens, firstParam) => {
+  const parts = tokens.map((token, i) =>
+    `(to_tsquery('simple', $${firstParam + i}) || to_tsquery('russian', $${firstParam + i}))`
+  );
+  return {
+    tsquery: `(${parts.join(' && ')})`,
+    params: tokens.map((token) => `${token}:*`)
+  };
+};
+
+const likePattern = (text) => `%${text.toLowerCase().replace(likeSpecialRe, '\\$1')}%`;
+
+// Запросы стратегии поиска: страница результатов и общее количество найденных продуктов
+const searchQueries = (strategy, text, limit, offset) => {
+  if (strategy === 'full_text') {
+    // Совпадения в названии (веса A и B) идут раньше совпадений только в описании (вес C)
+    const tokens = queryTokens(text);
+    const { tsquery, params } = buildTsquery(tokens, 3);
+    const count = buildTsquery(tokens, 1);
+    return {
+      searchQuery: `
+        SELECT ${searchColumns}, ts_rank(p.search_vector, ${tsquery}) as rank
+        FROM products p
+        JOIN product_categories c ON p.category_id = c.id
+        WHERE p.is_active = true AND p.search_vector @@ ${tsquery}
+        ORDER BY ts_filter(p.search_vector, '{a,b}') @@ ${tsquery} DESC, rank DESC, p.name
+        LIMIT $1 OFFSET $2
+      `,
+      searchParams: [limit, offset, ...params],
+      countQuery: `SELECT COUNT(*) as total FROM products p WHERE p.is_active = true AND p.search_vector @@ ${count.tsquery}`,
+      countParams: count.params
+    };
+  }
+
+  const normalized = text.toLowerCase().trim();
+  if (strategy === 'trigram') {
+    // Поиск с опечатками и по подстроке через триграммный индекс idx_products_name_trgm
+    const where = 'p.is_active = true AND ($1::text <% lower(p.name) OR lower(p.name) LIKE $2)';
+    return {
+      searchQuery: `
+        SELECT ${searchColumns}, word_similarity($1::text, lower(p.name)) as rank
+        FROM products p
+        JOIN product_categories c ON p.category_id = c.id
+        WHERE ${where}
+        ORDER BY rank DESC, p.name
+        LIMIT $3 OFFSET $4
+      `,
+      searchParams: [normalized, likePattern(normalized), limit, offset],
+      countQuery: `SELECT COUNT(*) as total FROM products p WHERE ${where}`,
+      countParams: [normalized, likePattern(normalized)]
+    };
+  }
+
+  // Поиск по подстроке без расширения pg_trgm: короткие названия идут первыми
+  const where = 'p.is_active = true AND lower(p.name) LIKE $1';
+  return {
+    searchQuery: `
+      SELECT ${searchColumns}, 0.0 as rank
+      FROM products p
+      JOIN product_categories c ON p.category_id = c.id
+      WHERE ${where}
+      ORDER BY length(p.name), p.name
+      LIMIT $2 OFFSET $3
+    `,
+    searchParams: [likePattern(normalized), limit, offset],
+    countQuery: `SELECT COUNT(*) as total FROM products p WHERE ${where}`,
+    countParams: [likePattern(normalized)]
+  };
+};
+
+// Выполнение стратегии поиска: оба запроса параллельно
+const runSearch = async (strategy, text, limit, offset) => {
+  const { searchQuery, searchParams, countQuery, countParams } = searchQueries(strategy, text, limit, offset);
+  const [productsResult, countResult] = await Promise.all([
+    pool.query(searchQuery, searchParams),
+    pool.query(countQuery, countParams)
+  ]);
+  return {
+    products: productsResult.rows,
+    total: parseInt(countResult.rows[0].total)
+  };
+};
+
+// Поиск продуктов: ранжированный полнотекстовый поиск по префиксам слов по хранимому
+// поисковому вектору (столбец search_vector и его GIN-индекс создает db_init).
+// Если он ничего не нашел, запрос считается опечаткой или частью слова и выполняется
+// поиск по сходству триграмм (нужен pg_trgm) или по подстроке названия
 exports.searchProducts = async (req, res, next) => {
   try {
     const { query } = req.query;
@@ -228,42 +375,17 @@ exports.searchProducts = async (req, res, next) => {
     const limit = parseInt(req.query.limit) || 20;
     const offset = (page - 1) * limit;
     
-    // Поиск с использованием полнотекстового поиска PostgreSQL
-    const searchQuery = `
-      SELECT 
-        p.id, p.name, p.proteins, p.fats, p.carbs, p.calories, p.water, 
-        p.serving_size, p.image_url, p.description,
-        c.id as category_id, c.name as category_name, c.slug as category_slug,
-        ts_rank(to_tsvector('russian', p.name), plainto_tsquery('russian', $1)) as rank
-      FROM 
-        products p
-      JOIN 
-        product_categories c ON p.category_id = c.id
-      WHERE 
-        to_tsvector('russian', p.name) @@ plainto_tsquery('russian', $1)
-        AND p.is_active = true
-      ORDER BY 
-        rank DESC
-      LIMIT $2 OFFSET $3
-    `;
-    
-    // Запрос на получение общего количества найденных продуктов
-    const countQuery = `
-      SELECT COUNT(*) as total 
-      FROM products p
-      WHERE 
-        to_tsvector('russian', p.name) @@ plainto_tsquery('russian', $1)
-        AND p.is_active = true
-    `;
-    
-    // Выполняем оба запроса параллельно
-    const [productsResult, countResult] = await Promise.all([
-      pool.query(searchQuery, [query, limit, offset]),
-      pool.query(countQuery, [query])
-    ]);
+    let match = 'full_text';
+    let result = { products: [], total: 0 };
+    if (queryTokens(query).length > 0) {
+      result = await runSearch(match, query, limit, offset);
+      if (result.total === 0) {
+        match = (await hasTrigram()) ? 'trigram' : 'substring';
+        result = await runSearch(match, query, limit, offset);
+      }
+    }
     
-    const products = productsResult.rows;
-    const total = parseInt(countResult.rows[0].total);
+    const { products, total } = result;
     
     // Формируем мета-информацию для пагинации
     const totalPages = Math.ceil(total / limit);
@@ -280,7 +402,8 @@ exports.searchProducts = async (req, res, next) => {
         totalPages,
         hasNextPage,
         hasPrevPage,
-        query
+        query,
+        match
       }
     });
   } catch (error) {
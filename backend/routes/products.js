@@ -3,16 +3,22 @@ const router = express.Router();
 const productsController = require('../controllers/products');
 const authMiddleware = require('../middleware/auth');
 
+// Маршруты с постоянным путем регистрируются раньше '/:id', иначе '/search'
+// и '/favorites' обрабатывались бы как получение продукта с id 'search'
+
 // Публичные маршруты
 router.get('/', productsController.getAllProducts);
 router.get('/categories', productsController.getAllCategories);
 router.get('/category/:slug', productsController.getProductsByCategory);
-router.get('/:id', productsController.getProductById);
 router.get('/search', productsController.searchProducts);
 
 // Защищенные маршруты (требуют аутентификации)
+router.get('/favorites', authMiddleware.verifyToken, productsController.getFavorites);
 router.post('/favorite/:id', authMiddleware.verifyToken, productsController.addToFavorites);
 router.delete('/favorite/:id', authMiddleware.verifyToken, productsController.removeFromFavorites);
-router.get('/favorites', authMiddleware.verifyToken, productsController.getFavorites);
+
+// Публичные маршруты продукта по id
+router.get('/:id', productsController.getProductById);
+router.get('/:id/similar', productsController.getSimilarProducts);
 
 module.exports = router;
\ No newline at end of file
@@ -0,0 +1,324 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import importlib.util
+from datetime import datetime, timezone
+
+from columnar_file import read_columnar_table
+
+# Директория со скриптами парсера и загрузчика
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Размеры синтетических HTML-таблиц и каталогов по умолчанию
+DEFAULT_TABLE_SIZES = [1000, 10000, 100000]
+DEFAULT_CATALOG_SIZES = [10000, 100000]
+DEFAULT_DB_CATALOG_SIZE = 10000
+
+# Допустимое снижение скорости относительно базового прогона (доля)
+DEFAULT_TOLERANCE = 0.2
+
+# Загрузчики продуктов db_init, которые измеряются на локальном PostgreSQL
+DB_LOADERS = ['insert_data_from_json', 'bulk_insert_data_from_json', 'sync_products_from_json']
+
+
+# Загрузка скрипта по пути к файлу: parser.py нельзя импортировать по имени,
+# на Python 3.9 оно совпадает со стандартным модулем parser
+def load_script(module_name, file_name):
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(BASE_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Синтетическое название продукта из ключевых слов категорий
+def synthetic_name(rng, words, idx):
+    return f"{rng.choice(words).capitalize()} {rng.choice(words)} {idx}"
+
+
+# Синтетическая страница с таблицей на rows_count строк данных.
+# Кроме продуктов в таблицу попадают строки-разделители и строки без значения,
+# которые парсер должен отбросить
+def synthetic_html(rows_count, words, seed=0):
+    rng = random.Random(seed)
+    parts = ['<html><head><title>Таблица</title></head><body><table class="table">',
+             '<thead><tr><th>Продукт</th><th>Значение, г</th></tr></thead><tbody>']
+    for idx in range(rows_count):
+        kind = rng.random()
+        if kind < 0.02:
+            parts.append(f'<tr><td>ГРУППА {idx}</td><td></td></tr>')
+        elif kind < 0.04:
+            parts.append(f'<tr><td>{synthetic_name(rng, words, idx)}</td><td>—</td></tr>')
+        else:
+            value = f"{rng.uniform(0, 900):.1f}".replace('.', ',') if kind < 0.5 else f"{rng.randint(0, 900)}"
+            parts.append(f'<tr><td><a href="#">{synthetic_name(rng, words, idx)}</a></td><td>{value}&nbsp;г</td></tr>')
+    parts.append('</tbody></table></body></html>')
+    return ''.join(parts)
+
+
+# Синтетический каталог продуктов в формате результата парсера
+def synthetic_catalog(size, words, categories, nutrient_types, seed=0):
+    rng = random.Random(seed)
+    catalog = []
+    for idx in range(size):
+        product = {'name': synthetic_name(rng, words, idx), 'category': rng.choice(categories)}
+        for nutrient_type in nutrient_types:
+            product[nutrient_type] = round(rng.uniform(0, 900), 1) if rng.random() > 0.2 else None
+        catalog.append(product)
+    catalog.sort(key=lambda x: x['name'])
+    return catalog
+
+
+# Замер одного сценария: лучшее время из repeat повторов и пиковая память отдельного прогона.
+# setup выполняется перед каждым прогоном и в замер не входит
+def measure(func, rows, repeat, setup=None):
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    # Память измеряется отдельно: tracemalloc замедляет выполнение
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'rows': rows,
+        'seconds': best,
+        'rows_per_sec': rows / best if best else None,
+        'peak_memory_bytes': peak
+    }
+
+
+# Сценарии парсера: извлечение таблиц, классификация, генерация SQL-скрипта, запись и чтение
+# каталога в JSON и столбцовых форматах. Размеры файлов каталога записываются в file_sizes
+def parser_benchmarks(parser_module, table_sizes, catalog_sizes, backends, columnar_formats=(), file_sizes=None):
+    words = [keyword for keywords in parser_module.category_keywords.values() for keyword in keywords]
+    categories = list(parser_module.category_names)
+    nutrient_types = parser_module.nutrient_types
+
+    for size in table_sizes:
+        html = synthetic_html(size, words, seed=size)
+        for backend in backends:
+            yield (
+                f"extract_table_data[{backend}, {size}]",
+                size,
+                lambda html=html, backend=backend: parser_module.extract_table_data('http://localhost/bench', 'proteins', html, backend),
+                parser_module.all_products.clear
+            )
+
+    for size in catalog_sizes:
+        catalog = synthetic_catalog(size, words, categories, nutrient_types, seed=size)
+        names = [product['name'] for product in catalog]
+        yield (
+            f"determine_category[{size}]",
+            size,
+            lambda names=names: [parser_module.determine_category(name) for name in names],
+            None
+        )
+        for sql_format in parser_module.SQL_FORMATS:
+            yield (
+                f"generate_sql_script[{sql_format}, {size}]",
+                size,
+                lambda catalog=catalog, sql_format=sql_format: parser_module.generate_sql_script(catalog, sql_format),
+                None
+            )
+
+        json_file = parser_module.save_data_to_json(catalog)
+        if file_sizes is not None:
+            file_sizes[f"json[{size}]"] = os.path.getsize(json_file)
+        yield (
+            f"save_data_to_json[{size}]",
+            size,
+            lambda catalog=catalog: parser_module.save_data_to_json(catalog),
+            None
+        )
+        yield f"read_json[{size}]", size, lambda json_file=json_file: read_json(json_file), None
+
+        for fmt in columnar_formats:
+            columnar_file = parser_module.save_data_to_columnar(catalog, fmt)
+            if file_sizes is not None:
+                file_sizes[f"{fmt}[{size}]"] = os.path.getsize(columnar_file)
+            yield (
+                f"save_data_to_columnar[{fmt}, {size}]",
+                size,
+                lambda catalog=catalog, fmt=fmt: parser_module.save_data_to_columnar(catalog, fmt),
+                None
+            )
+            yield (
+                f"read_columnar[{fmt}, {size}]",
+                size,
+                lambda columnar_file=columnar_file: read_columnar_table(columnar_file),
+                None
+            )
+
+
+# Чтение каталога из JSON, как его читают сервисы-потребители
+def read_json(json_file):
+    with open(json_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Сценарии загрузчика на локальном PostgreSQL. Перед каждым прогоном таблицы продуктов очищаются
+def db_benchmarks(parser_module, args, work_dir):
+    db_init = load_script('db_init_script', 'db_init.py')
+    connection = (args.host, args.port, args.user, args.password, args.database)
+
+    if not db_init.create_database(*connection, recreate=True):
+        raise RuntimeError(f"Не удалось создать базу данных {args.database}")
+    if not db_init.create_tables(*connection):
+        raise RuntimeError("Не удалось создать таблицы")
+
+    words = [keyword for keywords in parser_module.category_keywords.values() for keyword in keywords]
+    catalog = synthetic_catalog(args.db_catalog_size, words, list(parser_module.category_names), parser_module.nutrient_types)
+    json_file = os.path.join(work_dir, 'benchmark_catalog.json')
+    with open(json_file, 'w', encoding='utf-8') as f:
+        json.dump(catalog, f, ensure_ascii=False)
+
+    def truncate():
+        db_init.run_in_transaction(
+            *connection,
+            lambda cursor: cursor.execute("TRUNCATE products, product_categories RESTART IDENTITY CASCADE")
+        )
+
+    for loader_name in DB_LOADERS:
+        loader = getattr(db_init, loader_name)
+
+        def run(loader=loader, loader_name=loader_name):
+            if not loader(*connection, json_file):
+                raise RuntimeError(f"Ошибка загрузки в {loader_name}")
+
+        yield f"{loader_name}[{args.db_catalog_size}]", args.db_catalog_size, run, truncate
+
+
+# Сравнение с базовым прогоном: сценарий считается регрессией,
+# если скорость упала больше чем на tolerance
+def compare_with_baseline(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base.get('rows_per_sec') or not result.get('rows_per_sec'):
+            continue
+        ratio = result['rows_per_sec'] / base['rows_per_sec']
+        result['baseline_ratio'] = ratio
+        if ratio < 1 - tolerance:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарки парсера и загрузчика на синтетических данных')
+    parser.add_argument('--table-sizes', type=int, nargs='+', default=DEFAULT_TABLE_SIZES, help='Размеры синтетических HTML-таблиц (строк)')
+    parser.add_argument('--catalog-sizes', type=int, nargs='+', default=DEFAULT_CATALOG_SIZES, help='Размеры синтетических каталогов продуктов')
+    parser.add_argument('--backends', nargs='+', default=None, help='Бэкенды извлечения строк таблиц (по умолчанию все доступные)')
+    parser.add_argument('--repeat', type=int, default=3, help='Количество повторов каждого сценария')
+    parser.add_argument('--only', default=None, help='Запускать только сценарии, имя которых содержит эту строку')
+    parser.add_argument('--output', default='benchmark_results.json', help='Файл с результатами в формате JSON')
+    parser.add_argument('--baseline', default=None, help='JSON-файл базового прогона для сравнения')
+    parser.add_argument('--update-baseline', action='store_true', help='Записать результаты в файл --baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='Допустимое снижение скорости относительно базового прогона')
+    parser.add_argument('--db', action='store_true', help='Запустить сценарии загрузки на локальном PostgreSQL')
+    parser.add_argument('--host', default='localhost', help='Хост PostgreSQL')
+    parser.add_argument('--port', type=int, default=5432, help='Порт PostgreSQL')
+    parser.add_argument('--user', default='postgres', help='Имя пользователя PostgreSQL')
+    parser.add_argument('--password', default='postgres', help='Пароль пользователя PostgreSQL')
+    parser.add_argument('--database', default='fitbeast_benchmark', help='База данных для бенчмарков (пересоздается)')
+    parser.add_argument('--db-catalog-size', type=int, default=DEFAULT_DB_CATALOG_SIZE, help='Размер каталога для сценариев загрузки')
+
+    args = parser.parse_args(argv)
+    if args.update_baseline and not args.baseline:
+        parser.error('--update-baseline требует --baseline')
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    output_file = os.path.abspath(args.output)
+    baseline_file = os.path.abspath(args.baseline) if args.baseline else None
+
+    results = {}
+    file_sizes = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        try:
+            parser_module = load_script('parser_script', 'parser.py')
+            parser_module.output_dir = work_dir
+            logging.disable(logging.INFO)
+
+            backends = args.backends or sorted(parser_module.EXTRACTION_BACKENDS)
+            if 'bs4' in backends and importlib.util.find_spec('bs4') is None:
+                print("BeautifulSoup не установлен, бэкенд bs4 пропущен")
+                backends = [backend for backend in backends if backend != 'bs4']
+
+            columnar_formats = sorted(parser_module.COLUMNAR_FORMATS)
+            if importlib.util.find_spec('pyarrow') is None:
+                print("pyarrow не установлен, сценарии Arrow и Parquet пропущены")
+                columnar_formats = []
+
+            scenarios = parser_benchmarks(parser_module, args.table_sizes, args.catalog_sizes, backends, columnar_formats, file_sizes)
+            for name, rows, func, setup in scenarios:
+                if args.only and args.only not in name:
+                    continue
+                results[name] = measure(func, rows, args.repeat, setup)
+                print(f"{name:45} {results[name]['rows_per_sec']:12.0f} строк/с  "
+                      f"{results[name]['peak_memory_bytes'] / 1024 / 1024:8.1f} МБ")
+
+            if args.db:
+                for name, rows, func, setup in db_benchmarks(parser_module, args, work_dir):
+                    if args.only and args.only not in name:
+                        continue
+                    results[name] = measure(func, rows, args.repeat, setup)
+                    print(f"{name:45} {results[name]['rows_per_sec']:12.0f} строк/с  "
+                          f"{results[name]['peak_memory_bytes'] / 1024 / 1024:8.1f} МБ")
+            for name, file_bytes in file_sizes.items():
+                print(f"Размер каталога {name:31} {file_bytes / 1024 / 1024:12.1f} МБ")
+        finally:
+            logging.disable(logging.NOTSET)
+
+    regressions = []
+    if baseline_file and not args.update_baseline:
+        if os.path.exists(baseline_file):
+            with open(baseline_file, 'r', encoding='utf-8') as f:
+                regressions = compare_with_baseline(results, json.load(f)['results'], args.tolerance)
+            for name, ratio in regressions:
+                print(f"РЕГРЕССИЯ: {name}: {ratio:.2f} от скорости базового прогона")
+        else:
+            print(f"Базовый прогон {baseline_file} не найден, сравнение пропущено")
+
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': results,
+        'file_sizes': file_sizes,
+        'regressions': [name for name, _ratio in regressions]
+    }
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {output_file}")
+
+    if args.update_baseline:
+        with open(baseline_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Базовый прогон обновлен: {baseline_file}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
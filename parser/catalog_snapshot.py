@@ -0,0 +1,223 @@
+import os
+import mmap
+import time
+import struct
+import numpy as np
+
+# Заголовок снимка: сигнатура, версия формата, размер записи, количество продуктов и категорий,
+# смещения разделов (записи, индекс названий, таблица категорий, таблица строк), размер таблицы
+# строк и время создания
+SNAPSHOT_MAGIC = b'NCS1'
+SNAPSHOT_VERSION = 1
+HEADER = struct.Struct('<4sHHIIQQQQQd')
+
+# Питательные вещества в порядке столбцов записи
+NUTRIENTS = ['proteins', 'fats', 'carbs', 'calories', 'water']
+
+# Запись продукта фиксированной длины: положение названия в таблице строк, код категории
+# и значения на 100 г (NaN - значение неизвестно)
+RECORD_DTYPE = np.dtype({
+    'names': ['name_offset', 'name_length', 'category'] + NUTRIENTS,
+    'formats': ['<u4', '<u4', '<u2'] + ['<f8'] * len(NUTRIENTS),
+    'offsets': [0, 4, 8] + [16 + 8 * i for i in range(len(NUTRIENTS))],
+    'itemsize': 16 + 8 * len(NUTRIENTS)
+})
+
+# Строка таблицы категорий: положение slug категории в таблице строк, номер строки - код категории
+CATEGORY_DTYPE = np.dtype([('offset', '<u4'), ('length', '<u4')])
+
+# Индекс названий: номера записей в порядке названий (байтов UTF-8, что совпадает с порядком строк Python)
+INDEX_DTYPE = np.dtype('<u4')
+
+# Выравнивание разделов снимка, байт
+SECTION_ALIGNMENT = 8
+
+
+def aligned(offset):
+    return -(-offset // SECTION_ALIGNMENT) * SECTION_ALIGNMENT
+
+
+def write_snapshot(products, path):
+    """Запись снимка каталога по итерируемым продуктам; возвращает количество продуктов.
+
+    Для повторяющегося названия сохраняется первый продукт, как при загрузке
+    в базу данных.
+    """
+    strings = bytearray()
+    names = []
+    seen = set()
+    name_offsets = []
+    name_lengths = []
+    categories = []
+    values = []
+    for product in products:
+        if product['name'] in seen:
+            continue
+        seen.add(product['name'])
+        encoded = product['name'].encode('utf-8')
+        names.append(product['name'])
+        name_offsets.append(len(strings))
+        name_lengths.append(len(encoded))
+        strings += encoded
+        categories.append(product['category'])
+        values.append([np.nan if product.get(nutrient) is None else product[nutrient] for nutrient in NUTRIENTS])
+
+    category_slugs = sorted(set(categories))
+    codes = {slug: code for code, slug in enumerate(category_slugs)}
+    category_table = np.zeros(len(category_slugs), dtype=CATEGORY_DTYPE)
+    for code, slug in enumerate(category_slugs):
+        encoded = slug.encode('utf-8')
+        category_table[code] = (len(strings), len(encoded))
+        strings += encoded
+    if len(strings) > np.iinfo(np.uint32).max:
+        raise ValueError(f"Таблица строк снимка превышает 4 ГБ: {len(strings)} байт")
+
+    records = np.zeros(len(names), dtype=RECORD_DTYPE)
+    records['name_offset'] = name_offsets
+    records['name_length'] = name_lengths
+    records['category'] = [codes[slug] for slug in categories]
+    nutrient_values = np.array(values, dtype=np.float64).reshape(-1, len(NUTRIENTS))
+    for column, nutrient in enumerate(NUTRIENTS):
+        records[nutrient] = nutrient_values[:, column]
+    index = np.array(sorted(range(len(names)), key=names.__getitem__), dtype=INDEX_DTYPE)
+
+    records_offset = aligned(HEADER.size)
+    index_offset = aligned(records_offset + records.nbytes)
+    categories_offset = aligned(index_offset + index.nbytes)
+    strings_offset = aligned(categories_offset + category_table.nbytes)
+    header = HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_VERSION, RECORD_DTYPE.itemsize, len(records), len(category_slugs),
+        records_offset, index_offset, categories_offset, strings_offset, len(strings), time.time()
+    )
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        for offset, data in ((0, header), (records_offset, records.tobytes()), (index_offset, index.tobytes()),
+                             (categories_offset, category_table.tobytes()), (strings_offset, bytes(strings))):
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(data)
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+class CatalogSnapshot:
+    """Снимок каталога, отображенный в память.
+
+    Столбцы (records, column(), categories) - представления NumPy поверх
+    файла без копирования, названия декодируются только при обращении.
+    find() ищет продукт по точному названию двоичным поиском по индексу
+    названий. Представления остаются действительными, пока на них есть
+    ссылки, даже после close().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._map_sections()
+        except ValueError:
+            self.close()
+            raise
+
+    def _map_sections(self):
+        if len(self.mmap) < HEADER.size:
+            raise ValueError(f"Файл {self.path} не является снимком каталога")
+        (magic, version, record_size, count, category_count, records_offset, index_offset,
+         categories_offset, strings_offset, strings_size, created_at) = HEADER.unpack_from(self.mmap)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"Файл {self.path} не является снимком каталога")
+        if version != SNAPSHOT_VERSION or record_size != RECORD_DTYPE.itemsize:
+            raise ValueError(f"Неподдерживаемая версия снимка каталога {self.path}: {version}")
+        if strings_offset + strings_size > len(self.mmap):
+            raise ValueError(f"Снимок каталога {self.path} обрезан")
+
+        self.created_at = created_at
+        self.records = np.frombuffer(self.mmap, dtype=RECORD_DTYPE, count=count, offset=records_offset)
+        self.index = np.frombuffer(self.mmap, dtype=INDEX_DTYPE, count=count, offset=index_offset)
+        self.name_offsets = self.records['name_offset']
+        self.name_lengths = self.records['name_length']
+        self.strings = memoryview(self.mmap)[strings_offset:strings_offset + strings_size]
+        category_table = np.frombuffer(self.mmap, dtype=CATEGORY_DTYPE, count=category_count, offset=categories_offset)
+        self.category_slugs = [self._string(offset, length) for offset, length in category_table.tolist()]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, name):
+        return self.find(name) is not None
+
+    @property
+    def categories(self):
+        """Коды категорий продуктов (номера в category_slugs)"""
+        return self.records['category']
+
+    def column(self, nutrient):
+        """Значения питательного вещества на 100 г, NaN - значение неизвестно"""
+        if nutrient not in NUTRIENTS:
+            raise KeyError(nutrient)
+        return self.records[nutrient]
+
+    def _string(self, offset, length):
+        return str(self.strings[offset:offset + length], 'utf-8')
+
+    def _name_bytes(self, position):
+        offset = int(self.name_offsets[position])
+        return self.strings[offset:offset + int(self.name_lengths[position])].tobytes()
+
+    def name(self, position):
+        return self._name_bytes(position).decode('utf-8')
+
+    def find(self, name):
+        """Номер записи продукта с названием name или None"""
+        key = name.encode('utf-8')
+        low, high = 0, len(self.index)
+        while low < high:
+            middle = (low + high) // 2
+            if self._name_bytes(self.index[middle]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.index) and self._name_bytes(self.index[low]) == key:
+            return int(self.index[low])
+        return None
+
+    def product(self, position):
+        """Продукт в виде словаря, как в nutrition_data.json"""
+        record = self.records[position]
+        product = {'name': self.name(position), 'category': self.category_slugs[record['category']]}
+        for nutrient in NUTRIENTS:
+            value = float(record[nutrient])
+            product[nutrient] = None if value != value else value
+        return product
+
+    def get(self, name):
+        """Продукт по точному названию или None"""
+        position = self.find(name)
+        return None if position is None else self.product(position)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self.product(position)
+
+    def close(self):
+        self.records = None
+        self.index = None
+        self.name_offsets = None
+        self.name_lengths = None
+        if getattr(self, 'strings', None) is not None:
+            self.strings.release()
+            self.strings = None
+        if self.mmap is not None:
+            try:
+                self.mmap.close()
+            except BufferError:
+                # На отображение ссылаются выданные столбцы: файл закроется вместе с ними
+                pass
+            self.mmap = None
@@ -0,0 +1,86 @@
+from collections import deque
+
+
+class CategoryMatcher:
+    """Автомат Ахо-Корасик для определения категории продукта по ключевым словам.
+
+    Строится один раз по словарю {категория: [ключевые слова]}. Для строки
+    возвращает первую по порядку словаря категорию, любое ключевое слово
+    которой входит в строку, - так же, как вложенный перебор категорий и
+    ключевых слов, но за один проход по строке.
+    """
+
+    def __init__(self, category_keywords, default='other'):
+        self.categories = list(category_keywords)
+        self.default = default
+
+        # Переходы, ссылки на суффиксы и лучший (минимальный) индекс категории для каждого состояния
+        self.transitions = [{}]
+        self.fail = [0]
+        self.best = [None]
+        # Пустое ключевое слово входит в любую строку
+        self.always = None
+
+        for priority, category in enumerate(self.categories):
+            for keyword in category_keywords[category]:
+                if not keyword:
+                    if self.always is None:
+                        self.always = priority
+                    continue
+                state = 0
+                for char in keyword:
+                    next_state = self.transitions[state].get(char)
+                    if next_state is None:
+                        next_state = len(self.transitions)
+                        self.transitions[state][char] = next_state
+                        self.transitions.append({})
+                        self.fail.append(0)
+                        self.best.append(None)
+                    state = next_state
+                if self.best[state] is None or priority < self.best[state]:
+                    self.best[state] = priority
+
+        # Обход в ширину: ссылки на суффиксы и наследование совпадений по ним
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            fail_best = self.best[self.fail[state]]
+            if fail_best is not None and (self.best[state] is None or fail_best < self.best[state]):
+                self.best[state] = fail_best
+
+            for char, next_state in self.transitions[state].items():
+                fallback = self.fail[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.transitions[fallback].get(char, 0)
+                queue.append(next_state)
+
+    def classify(self, product_name):
+        """Категория продукта по его названию"""
+        transitions = self.transitions
+        fail = self.fail
+        best = self.best
+
+        found = self.always
+        if found == 0:
+            return self.categories[0]
+
+        state = 0
+        for char in product_name.lower():
+            while state and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+
+            priority = best[state]
+            if priority is not None and (found is None or priority < found):
+                found = priority
+                # Первая категория имеет наивысший приоритет - дальше искать незачем
+                if found == 0:
+                    break
+
+        return self.categories[found] if found is not None else self.default
+
+    def classify_many(self, product_names):
+        """Категории для последовательности названий, в том же порядке"""
+        classify = self.classify
+        return [classify(name) for name in product_names]
@@ -0,0 +1,119 @@
+import os
+
+# Столбцовые форматы выгрузки продуктов и расширения их файлов
+COLUMNAR_FORMATS = {
+    'arrow': '.arrow',
+    'parquet': '.parquet'
+}
+
+# Питательные вещества в порядке столбцов
+NUTRIENTS = ['proteins', 'fats', 'carbs', 'calories', 'water']
+
+# Количество продуктов в одном пакете записей (record batch)
+DEFAULT_BATCH_SIZE = 65536
+
+
+def import_pyarrow():
+    """pyarrow импортируется только при работе со столбцовыми файлами"""
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("Для файлов Arrow и Parquet нужен пакет pyarrow (pip install pyarrow)") from None
+    return pyarrow
+
+
+def product_schema(pa):
+    """Схема продуктов: категория хранится словарем, значения - float64 (null - значение неизвестно)"""
+    return pa.schema(
+        [pa.field('name', pa.string(), nullable=False),
+         pa.field('category', pa.dictionary(pa.int16(), pa.string()), nullable=False)]
+        + [pa.field(nutrient, pa.float64()) for nutrient in NUTRIENTS]
+    )
+
+
+def columnar_format(path):
+    """Столбцовый формат файла по расширению или None"""
+    extension = os.path.splitext(path)[1].lower()
+    for fmt, fmt_extension in COLUMNAR_FORMATS.items():
+        if extension == fmt_extension:
+            return fmt
+    return None
+
+
+def iter_record_batches(products, batch_size=DEFAULT_BATCH_SIZE):
+    """Пакеты записей из итерируемых продуктов.
+
+    Словарь категорий общий для всех пакетов и только дополняется, поэтому
+    в файл Arrow он записывается один раз и дальше приращениями.
+    """
+    pa = import_pyarrow()
+    schema = product_schema(pa)
+    codes = {}
+
+    def make_batch(names, categories, values):
+        dictionary = pa.array(list(codes), type=pa.string())
+        columns = [
+            pa.array(names, type=pa.string()),
+            pa.DictionaryArray.from_arrays(pa.array(categories, type=pa.int16()), dictionary)
+        ]
+        columns += [pa.array(column, type=pa.float64()) for column in values]
+        return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+    names, categories, values = [], [], [[] for _ in NUTRIENTS]
+    for product in products:
+        names.append(product['name'])
+        categories.append(codes.setdefault(product['category'], len(codes)))
+        for column, nutrient in zip(values, NUTRIENTS):
+            column.append(product.get(nutrient))
+        if len(names) >= batch_size:
+            yield make_batch(names, categories, values)
+            names, categories, values = [], [], [[] for _ in NUTRIENTS]
+    if names:
+        yield make_batch(names, categories, values)
+
+
+def write_columnar(products, path, fmt=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Запись продуктов в файл Arrow IPC или Parquet; возвращает количество продуктов"""
+    pa = import_pyarrow()
+    fmt = fmt or columnar_format(path)
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"Неизвестный столбцовый формат: {fmt}")
+
+    count = 0
+    tmp_path = path + '.tmp'
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(tmp_path, product_schema(pa))
+    else:
+        writer = pa.ipc.new_file(tmp_path, product_schema(pa), options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+    with writer:
+        for batch in iter_record_batches(products, batch_size):
+            writer.write_batch(batch)
+            count += batch.num_rows
+    os.replace(tmp_path, path)
+    return count
+
+
+def read_record_batches(path, batch_size=DEFAULT_BATCH_SIZE):
+    """Пакеты записей из файла Arrow IPC (отображается в память) или Parquet"""
+    pa = import_pyarrow()
+    if columnar_format(path) == 'parquet':
+        import pyarrow.parquet as pq
+        yield from pq.ParquetFile(path).iter_batches(batch_size=batch_size)
+        return
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        for position in range(reader.num_record_batches):
+            yield reader.get_batch(position)
+
+
+def read_columnar_table(path):
+    """Файл целиком в виде таблицы pyarrow для расчетов по столбцам"""
+    pa = import_pyarrow()
+    return pa.Table.from_batches(list(read_record_batches(path)), schema=product_schema(pa))
+
+
+def iter_columnar_products(path):
+    """Продукты из столбцового файла в виде словарей, как в nutrition_data.json"""
+    for batch in read_record_batches(path):
+        yield from batch.to_pylist()
@@ -1,19 +1,23 @@
 import os
+import io
+import re
+import csv
 import json
+import time
 import logging
 import argparse
-import psycopg2
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("db_init.log"),
-        logging.StreamHandler()
-    ]
-)
+from collections import deque
+from contextlib import contextmanager
+
+from instrumentation import db_metrics, configure_logging
+from delta_state import product_fingerprints, snapshot_id
+from columnar_file import NUTRIENTS, columnar_format, iter_columnar_products, read_record_batches
+
+# Модуль можно импортировать как библиотеку: при импорте не настраивается логирование и не открываются
+# файлы, а psycopg2 и модули с NumPy (похожие продукты, синтетические данные) загружаются при первом использовании
+
+# Файл лога запуска из командной строки
+LOG_FILE = "db_init.log"
 
 # Параметры подключения к PostgreSQL по умолчанию
 DEFAULT_DB_CONFIG = {
@@ -57,8 +61,121 @@ CREATE TABLE IF NOT EXISTS products (
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
--- Создание индекса для улучшения поиска по имени продукта
-CREATE INDEX IF NOT EXISTS idx_products_name ON products USING gin(to_tsvector('russian', name));
+-- Поисковый вектор продукта хранится в таблице: слова названия с весом A (русская морфология)
+-- и B (без стемминга, для поиска по префиксу), описание - с весом C
+ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(name, '')), 'B') ||
+        setweight(to_tsvector('russian', coalesce(description, '')), 'C')
+    ) STORED;
+
+-- Полнотекстовый индекс по хранимому вектору заменяет индекс по выражению to_tsvector(name)
+CREATE INDEX IF NOT EXISTS idx_products_search_vector ON products USING gin(search_vector);
+DROP INDEX IF EXISTS idx_products_name;
+
+-- Триграммный индекс для поиска по подстроке (ILIKE) и по сходству с опечатками
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING gin(lower(name) gin_trgm_ops);
+    ELSE
+        RAISE WARNING 'Расширение pg_trgm недоступно, триграммный индекс по названию продукта не создан';
+    END IF;
+END $$;
+
+-- Частичные индексы для списков активных продуктов: сортировка по каждому столбцу
+-- с LIMIT/OFFSET (в обе стороны) и подсчет активных продуктов (всего и по категории)
+-- через index-only scan. Сортировку по названию обслуживает idx_products_name_unique.
+-- Запросы backend и бюджеты задержки проверяет query_plans.py
+CREATE INDEX IF NOT EXISTS idx_products_active_proteins ON products (proteins) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS idx_products_active_fats ON products (fats) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS idx_products_active_carbs ON products (carbs) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS idx_products_active_calories ON products (calories) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS idx_products_active_water ON products (water) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS idx_products_active_category ON products (category_id) WHERE is_active = true;
+
+-- Составные частичные индексы для списка продуктов категории: строки одной категории
+-- читаются уже в порядке сортировки, без узла Sort по всем продуктам категории
+CREATE INDEX IF NOT EXISTS idx_products_active_category_name ON products (category_id, name) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS idx_products_active_category_proteins ON products (category_id, proteins) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS idx_products_active_category_fats ON products (category_id, fats) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS idx_products_active_category_carbs ON products (category_id, carbs) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS idx_products_active_category_calories ON products (category_id, calories) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS idx_products_active_category_water ON products (category_id, water) WHERE is_active = true;
+
+-- Уникальный индекс по имени продукта (поиск по точному совпадению и INSERT ... ON CONFLICT).
+-- Дубликаты, оставшиеся от повторных запусков SQL-скрипта, сводятся к самой ранней записи.
+-- Перед удалением дубликата ссылки на него переносятся на сохраняемую запись: избранное
+-- пользователей (иначе его удалил бы ON DELETE CASCADE) и списки похожих продуктов
+DO $$
+DECLARE
+    duplicate_names TEXT;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_products_name_unique') THEN
+        CREATE TEMP TABLE product_duplicates ON COMMIT DROP AS
+        SELECT d.id AS duplicate_id, k.keep_id, d.name
+        FROM products d
+        JOIN (SELECT name, min(id) AS keep_id FROM products GROUP BY name HAVING count(*) > 1) k ON k.name = d.name
+        WHERE d.id <> k.keep_id;
+
+        SELECT string_agg(DISTINCT name, ', ') INTO duplicate_names FROM product_duplicates;
+        IF duplicate_names IS NOT NULL THEN
+            IF to_regclass('user_favorite_products') IS NOT NULL THEN
+                INSERT INTO user_favorite_products (user_id, product_id, created_at)
+                SELECT f.user_id, d.keep_id, f.created_at
+                FROM user_favorite_products f
+                JOIN product_duplicates d ON d.duplicate_id = f.product_id
+                ON CONFLICT DO NOTHING;
+                DELETE FROM user_favorite_products f USING product_duplicates d WHERE f.product_id = d.duplicate_id;
+            END IF;
+
+            -- Списки самих дубликатов не нужны: у сохраняемой записи есть свой
+            IF to_regclass('product_similar') IS NOT NULL THEN
+                DELETE FROM product_similar s USING product_duplicates d WHERE s.product_id = d.duplicate_id;
+                UPDATE product_similar s SET similar_id = d.keep_id FROM product_duplicates d WHERE s.similar_id = d.duplicate_id;
+                DELETE FROM product_similar WHERE product_id = similar_id;
+            END IF;
+
+            DELETE FROM products p USING product_duplicates d WHERE p.id = d.duplicate_id;
+            RAISE WARNING 'Дубликаты продуктов сведены к самой ранней записи перед созданием уникального индекса: %', duplicate_names;
+        END IF;
+        DROP TABLE product_duplicates;
+
+        CREATE UNIQUE INDEX idx_products_name_unique ON products (name);
+    END IF;
+END $$;
+
+-- Похожие по составу продукты: k ближайших соседей в пространстве БЖУ, калорий и воды на 100 г.
+-- Заполняется product_similarity.py (или db_init.py --refresh-similar), список продукта читается по первичному ключу.
+-- Внешних ключей нет: их проверка для миллионов строк замедляет полный пересчет в 15 раз.
+-- Списки удаленных и деактивированных продуктов убирает следующий пересчет
+CREATE TABLE IF NOT EXISTS product_similar (
+    product_id INTEGER NOT NULL,
+    similar_id INTEGER NOT NULL,
+    rank SMALLINT NOT NULL, -- место в списке, начиная с 1
+    distance REAL NOT NULL,
+    PRIMARY KEY (product_id, rank)
+);
+
+-- Поиск списков, в которых встречается измененный продукт, при инкрементальном пересчете
+CREATE INDEX IF NOT EXISTS idx_product_similar_similar_id ON product_similar (similar_id);
+
+-- Параметры последнего пересчета похожих продуктов (одна строка)
+CREATE TABLE IF NOT EXISTS product_similar_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    neighbours SMALLINT NOT NULL,
+    refreshed_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- Набор продуктов, загруженный последней синхронизацией с файлом парсера (одна строка).
+-- Файл изменений (db_init.py --delta) применяется, только если построен от этого набора
+CREATE TABLE IF NOT EXISTS products_snapshot (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    snapshot VARCHAR(64) NOT NULL,
+    loaded_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
 
 -- Таблица жанров музыки
 CREATE TABLE IF NOT EXISTS music_genres (
@@ -178,6 +295,146 @@ DROP TRIGGER IF EXISTS update_user_settings_modtime ON user_settings;
 CREATE TRIGGER update_user_settings_modtime 
 BEFORE UPDATE ON user_settings 
 FOR EACH ROW EXECUTE PROCEDURE update_modified_column();
+
+-- Версия каталога продуктов: увеличивается при любом изменении продуктов или категорий.
+-- По ней кэши каталога (macro_recommender.py) узнают о перезагрузке данных
+CREATE TABLE IF NOT EXISTS products_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+INSERT INTO products_version (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_products_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Версия растет, только если оператор изменил хотя бы одну строку (TRUNCATE - всегда):
+    -- повторная синхронизация неизменного каталога не сбрасывает кэши
+    IF TG_OP = 'DELETE' THEN
+        IF NOT EXISTS (SELECT 1 FROM old_rows) THEN
+            RETURN NULL;
+        END IF;
+    ELSIF TG_OP <> 'TRUNCATE' THEN
+        IF NOT EXISTS (SELECT 1 FROM new_rows) THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+    UPDATE products_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Триггеры уровня оператора: одно обновление версии на загрузку, а не на каждую строку.
+-- Таблицы переходов можно задать только у триггера на одно событие, поэтому триггеров четыре
+DO $$
+DECLARE
+    target TEXT;
+BEGIN
+    FOREACH target IN ARRAY ARRAY['products', 'product_categories'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS bump_products_version ON %I', target);
+        EXECUTE format('DROP TRIGGER IF EXISTS bump_products_version_insert ON %I', target);
+        EXECUTE format('DROP TRIGGER IF EXISTS bump_products_version_update ON %I', target);
+        EXECUTE format('DROP TRIGGER IF EXISTS bump_products_version_delete ON %I', target);
+        EXECUTE format('DROP TRIGGER IF EXISTS bump_products_version_truncate ON %I', target);
+        EXECUTE format('CREATE TRIGGER bump_products_version_insert AFTER INSERT ON %I '
+                       'REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE bump_products_version()', target);
+        EXECUTE format('CREATE TRIGGER bump_products_version_update AFTER UPDATE ON %I '
+                       'REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE bump_products_version()', target);
+        EXECUTE format('CREATE TRIGGER bump_products_version_delete AFTER DELETE ON %I '
+                       'REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE bump_products_version()', target);
+        EXECUTE format('CREATE TRIGGER bump_products_version_truncate AFTER TRUNCATE ON %I '
+                       'FOR EACH STATEMENT EXECUTE PROCEDURE bump_products_version()', target);
+    END LOOP;
+END $$;
+"""
+
+# Начало блока COPY ... FROM stdin в SQL файле
+COPY_FROM_STDIN_RE = re.compile(r'^\s*COPY\s.+\sFROM\s+stdin\s*;\s*$', re.IGNORECASE)
+
+# Названия категорий продуктов
+CATEGORY_NAMES = {
+    'meat': 'Мясо',
+    'poultry': 'Птица',
+    'fish': 'Рыба и морепродукты',
+    'dairy': 'Молочные продукты',
+    'eggs': 'Яйца',
+    'grains': 'Злаки и крупы',
+    'bread': 'Хлеб и выпечка',
+    'pasta': 'Макароны и паста',
+    'vegetables': 'Овощи',
+    'fruits': 'Фрукты',
+    'berries': 'Ягоды',
+    'nuts': 'Орехи и семена',
+    'legumes': 'Бобовые',
+    'sweets': 'Сладости',
+    'beverages': 'Напитки',
+    'other': 'Другое'
+}
+
+# Промежуточная таблица для массовой загрузки продуктов через COPY
+CREATE_PRODUCTS_STAGING_SQL = """
+CREATE TEMP TABLE products_staging (
+    position BIGINT,
+    name VARCHAR(255),
+    category_slug VARCHAR(100),
+    proteins DECIMAL(5,1),
+    fats DECIMAL(5,1),
+    carbs DECIMAL(5,1),
+    calories DECIMAL(6,1),
+    water DECIMAL(5,1)
+) ON COMMIT DROP;
+"""
+
+# Загрузка продуктов в промежуточную таблицу: строки CSV, пустое поле - NULL
+COPY_PRODUCTS_STAGING_SQL = "COPY products_staging (position, name, category_slug, proteins, fats, carbs, calories, water) FROM STDIN WITH (FORMAT csv)"
+
+# Перенос продуктов из промежуточной таблицы одним запросом:
+# категория определяется через JOIN, существующие имена и повторы во входных данных пропускаются
+MERGE_PRODUCTS_STAGING_SQL = """
+INSERT INTO products (name, category_id, proteins, fats, carbs, calories, water, serving_size)
+SELECT DISTINCT ON (s.name)
+    s.name, c.id, s.proteins, s.fats, s.carbs, s.calories, s.water, 100
+FROM products_staging s
+JOIN product_categories c ON c.slug = s.category_slug
+WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.name = s.name)
+ORDER BY s.name, s.position;
+"""
+
+# Инкрементальная синхронизация каталога: новые продукты добавляются, у существующих
+# обновляются только изменившиеся значения, неактивные продукты снова активируются.
+# (xmax = 0) истинно для вставленных строк и ложно для обновленных
+UPSERT_PRODUCTS_STAGING_SQL = """
+INSERT INTO products (name, category_id, proteins, fats, carbs, calories, water, serving_size, is_active)
+SELECT DISTINCT ON (s.name)
+    s.name, c.id, s.proteins, s.fats, s.carbs, s.calories, s.water, 100, TRUE
+FROM products_staging s
+JOIN product_categories c ON c.slug = s.category_slug
+ORDER BY s.name, s.position
+ON CONFLICT (name) DO UPDATE SET
+    category_id = EXCLUDED.category_id,
+    proteins = EXCLUDED.proteins,
+    fats = EXCLUDED.fats,
+    carbs = EXCLUDED.carbs,
+    calories = EXCLUDED.calories,
+    water = EXCLUDED.water,
+    is_active = TRUE
+WHERE (products.category_id, products.proteins, products.fats, products.carbs, products.calories, products.water, products.is_active)
+    IS DISTINCT FROM
+    (EXCLUDED.category_id, EXCLUDED.proteins, EXCLUDED.fats, EXCLUDED.carbs, EXCLUDED.calories, EXCLUDED.water, TRUE)
+RETURNING (xmax = 0) AS inserted;
+"""
+
+# Деактивация продуктов, которых больше нет в каталоге
+DEACTIVATE_MISSING_PRODUCTS_SQL = """
+UPDATE products p SET is_active = FALSE
+WHERE p.is_active
+AND NOT EXISTS (SELECT 1 FROM products_staging s WHERE s.name = p.name);
+"""
+
+# Запоминание набора продуктов после синхронизации или применения файла изменений
+UPSERT_PRODUCTS_SNAPSHOT_SQL = """
+INSERT INTO products_snapshot (id, snapshot, loaded_at) VALUES (TRUE, %s, CURRENT_TIMESTAMP)
+ON CONFLICT (id) DO UPDATE SET snapshot = EXCLUDED.snapshot, loaded_at = EXCLUDED.loaded_at;
 """
 
 # SQL для заполнения жанров музыки
@@ -192,12 +449,15 @@ INSERT INTO music_genres (name, slug, description) VALUES
 ('Драм-н-бейс', 'drum-and-bass', 'Быстрая электронная музыка с тяжелыми басами'),
 ('Трэп', 'trap', 'Стиль хип-хопа с тяжелыми битами и быстрыми хай-хэтами'),
 ('Техно', 'techno', 'Ритмичная электронная музыка с минималистичным звучанием'),
-('Хаус', 'house', 'Танцевальная электронная музыка с четким ритмом');
+('Хаус', 'house', 'Танцевальная электронная музыка с четким ритмом')
+ON CONFLICT (slug) DO NOTHING;
 """
 
 # SQL для добавления примерных плейлистов
 INSERT_SAMPLE_PLAYLISTS_SQL = """
-INSERT INTO playlists (name, genre_id, description, bpm, workout_type, intensity, image_url) VALUES
+INSERT INTO playlists (name, genre_id, description, bpm, workout_type, intensity, image_url)
+SELECT v.name, v.genre_id, v.description, v.bpm, v.workout_type, v.intensity, v.image_url
+FROM (VALUES
 ('Интенсивная кардио-тренировка', (SELECT id FROM music_genres WHERE slug = 'edm'), 'Энергичные треки для максимальной кардио нагрузки', 145, 'кардио', 'высокая', '/images/playlists/cardio.jpg'),
 ('Силовая тренировка', (SELECT id FROM music_genres WHERE slug = 'rock'), 'Мощные рок-хиты для силовых упражнений', 120, 'силовая', 'высокая', '/images/playlists/strength.jpg'),
 ('Утренняя растяжка', (SELECT id FROM music_genres WHERE slug = 'electronic'), 'Спокойные электронные треки для растяжки и разминки', 90, 'растяжка', 'низкая', '/images/playlists/stretch.jpg'),
@@ -205,25 +465,51 @@ INSERT INTO playlists (name, genre_id, description, bpm, workout_type, intensity
 ('Йога и медитация', (SELECT id FROM music_genres WHERE slug = 'electronic'), 'Успокаивающие треки для расслабления и концентрации', 60, 'йога', 'низкая', '/images/playlists/yoga.jpg'),
 ('Бег на выносливость', (SELECT id FROM music_genres WHERE slug = 'drum-and-bass'), 'Ритмичные треки для поддержания оптимального темпа бега', 170, 'бег', 'средняя', '/images/playlists/running.jpg'),
 ('Функциональный тренинг', (SELECT id FROM music_genres WHERE slug = 'trap'), 'Динамичные треки для функциональных тренировок', 130, 'функциональная', 'средняя', '/images/playlists/functional.jpg'),
-('Восстановление и релаксация', (SELECT id FROM music_genres WHERE slug = 'electronic'), 'Мелодичные треки для периода восстановления после тренировки', 75, 'восстановление', 'низкая', '/images/playlists/recovery.jpg');
+('Восстановление и релаксация', (SELECT id FROM music_genres WHERE slug = 'electronic'), 'Мелодичные треки для периода восстановления после тренировки', 75, 'восстановление', 'низкая', '/images/playlists/recovery.jpg')
+) AS v (name, genre_id, description, bpm, workout_type, intensity, image_url)
+-- Повторный запуск не создает дубликаты плейлистов
+WHERE NOT EXISTS (SELECT 1 FROM playlists p WHERE p.name = v.name);
 """
 
-def parse_arguments():
+def parse_arguments(argv=None):
     parser = argparse.ArgumentParser(description='Инициализация базы данных для FitBeast')
     parser.add_argument('--host', default=DEFAULT_DB_CONFIG['host'], help='Хост базы данных')
     parser.add_argument('--port', type=int, default=DEFAULT_DB_CONFIG['port'], help='Порт базы данных')
     parser.add_argument('--user', default=DEFAULT_DB_CONFIG['user'], help='Имя пользователя базы данных')
     parser.add_argument('--password', default=DEFAULT_DB_CONFIG['password'], help='Пароль пользователя базы данных')
     parser.add_argument('--database', default=DEFAULT_DB_CONFIG['database'], help='Имя базы данных')
-    parser.add_argument('--data-file', default='parsed_data/nutrition_data.json', help='Путь к JSON-файлу с данными о продуктах')
+    parser.add_argument('--data-file', default='parsed_data/nutrition_data.json', help='Путь к файлу с данными о продуктах: JSON, NDJSON (.ndjson), Arrow (.arrow) или Parquet (.parquet)')
     parser.add_argument('--sql-file', default='parsed_data/insert_data.sql', help='Путь к SQL-файлу с данными для вставки')
     parser.add_argument('--recreate-db', action='store_true', help='Пересоздать базу данных, если она существует')
     parser.add_argument('--sample-data', action='store_true', help='Добавить примерные данные для плейлистов')
+    parser.add_argument('--bulk', action='store_true', help='Загружать продукты из файла данных массово через COPY')
+    parser.add_argument('--sync', action='store_true', help='Синхронизировать каталог продуктов с JSON-файлом (добавление, обновление, деактивация)')
+    parser.add_argument('--delta', default=None, help='Применить файл изменений каталога от парсера (nutrition_delta.json) вместо полной загрузки')
+    parser.add_argument('--refresh-similar', action='store_true', help='Пересчитать похожие по составу продукты (product_similar) после загрузки')
+    parser.add_argument('--similar-neighbours', type=int, default=None, help='Количество похожих продуктов для каждого продукта (по умолчанию product_similarity.DEFAULT_NEIGHBOURS)')
+    parser.add_argument('--synthetic-users', type=int, default=0, help='Сгенерировать указанное количество пользователей с избранными продуктами и плейлистами')
+    parser.add_argument('--synthetic-products', type=int, default=0, help='Сгенерировать указанное количество продуктов')
+    parser.add_argument('--synthetic-tracks', type=int, default=0, help='Сгенерировать указанное количество треков')
+    parser.add_argument('--synthetic-playlists', type=int, default=0, help='Сгенерировать указанное количество плейлистов с треками')
+    parser.add_argument('--synthetic-seed', type=int, default=0, help='Зерно генератора синтетических данных')
+    parser.add_argument('--synthetic-workers', type=int, default=os.cpu_count() or 1, help='Количество процессов, загружающих синтетические данные')
+    parser.add_argument('--metrics-file', default=None, help='Записать отчет о запуске с метриками этапов в JSON-файл')
+    parser.add_argument('--prometheus-file', default=None, help='Записать метрики запуска в текстовом формате Prometheus')
     
-    return parser.parse_args()
+    args = parser.parse_args(argv)
+    # Явно выбранный способ загрузки без файла - ошибка, а не загрузка SQL-файла вместо него
+    if args.delta and not os.path.exists(args.delta):
+        parser.error(f"файл изменений каталога не найден: {args.delta}")
+    if (args.sync or args.bulk) and not os.path.exists(args.data_file):
+        option = '--sync' if args.sync else '--bulk'
+        parser.error(f"{option}: файл с данными не найден: {args.data_file}")
+    return args
 
 def connect_to_postgres(host, port, user, password, database=None):
     """Подключение к PostgreSQL серверу"""
+    import psycopg2
+    from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+    
     try:
         conn = psycopg2.connect(
             host=host,
@@ -280,23 +566,401 @@ def create_database(host, port, user, password, database, recreate=False):
         logging.error(f"Ошибка при создании базы данных: {e}")
         return False
 
-def create_tables(host, port, user, password, database):
-    """Создание таблиц в базе данных"""
+def run_in_transaction(host, port, user, password, database, stage, *stage_args):
+    """Выполнение одного этапа в отдельном подключении и транзакции"""
+    conn = connect_to_postgres(host, port, user, password, database)
+    if not conn:
+        raise RuntimeError("Не удалось подключиться к базе данных")
+    
     try:
-        conn = connect_to_postgres(host, port, user, password, database)
-        if not conn:
-            return False
-            
+        conn.autocommit = False
         cursor = conn.cursor()
-        
-        # Выполняем SQL скрипт для создания таблиц
-        cursor.execute(CREATE_TABLES_SQL)
+        result = stage(cursor, *stage_args)
         conn.commit()
-        
-        logging.info("Таблицы успешно созданы")
-        
         cursor.close()
+        return result
+    finally:
         conn.close()
+
+@contextmanager
+def run_stage(cursor, name, timings):
+    """Этап инициализации внутри общей транзакции: точка сохранения и замер времени"""
+    cursor.execute(f"SAVEPOINT stage_{name}")
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        cursor.execute(f"ROLLBACK TO SAVEPOINT stage_{name}")
+        raise
+    else:
+        cursor.execute(f"RELEASE SAVEPOINT stage_{name}")
+    finally:
+        timings[name] = time.perf_counter() - started
+
+def apply_schema(cursor):
+    """Создание таблиц, индексов и триггеров.
+    
+    Предупреждения схемы (RAISE WARNING: сведенные дубликаты продуктов,
+    недоступное расширение pg_trgm) выводятся в лог.
+    """
+    # psycopg2 хранит в списке notices только последние 50 сообщений, а схема
+    # выдает больше (NOTICE о пропущенных IF NOT EXISTS), поэтому они собираются в deque
+    connection = cursor.connection
+    saved_notices, connection.notices = connection.notices, deque()
+    try:
+        cursor.execute(CREATE_TABLES_SQL)
+    finally:
+        notices, connection.notices = connection.notices, saved_notices
+    for notice in notices:
+        if notice.startswith('WARNING'):
+            logging.warning(notice.strip())
+        else:
+            logging.debug(notice.strip())
+    logging.info("Таблицы успешно созданы")
+
+def execute_sql_chunk(cursor, sql_lines):
+    """Выполнение накопленных SQL-запросов, если среди строк есть что-то кроме комментариев"""
+    if any(line.strip() and not line.strip().startswith('--') for line in sql_lines):
+        cursor.execute(''.join(sql_lines))
+        return True
+    return False
+
+def copy_data_lines(f):
+    """Строки данных блока COPY ... FROM stdin до завершающей строки \\."""
+    for line in f:
+        if line.rstrip('\r\n') == '\\.':
+            return
+        yield line
+
+def load_sql_file(cursor, sql_file):
+    """Выполнение SQL файла с данными.
+    
+    Блоки COPY ... FROM stdin (как в psql) передаются в базу через copy_expert
+    потоком, без загрузки данных в память.
+    """
+    executed = False
+    sql_lines = []
+    
+    with open(sql_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if COPY_FROM_STDIN_RE.match(line):
+                executed = execute_sql_chunk(cursor, sql_lines) or executed
+                sql_lines = []
+                cursor.copy_expert(line.strip().rstrip(';'), IteratorFile(copy_data_lines(f)))
+                executed = True
+            else:
+                sql_lines.append(line)
+    
+    executed = execute_sql_chunk(cursor, sql_lines) or executed
+    
+    # Файл может содержать только комментарии, если парсер не нашел продуктов
+    if not executed:
+        logging.warning(f"SQL файл {sql_file} не содержит запросов")
+        return
+    
+    logging.info(f"Данные из файла {sql_file} успешно добавлены в базу данных")
+
+def iter_products_file(json_file):
+    """Продукты из файла по одному.
+    
+    NDJSON (.ndjson) читается построчно без загрузки всего файла в память,
+    Arrow (.arrow) и Parquet (.parquet) - по пакетам записей, обычный
+    JSON-массив загружается целиком.
+    """
+    if columnar_format(json_file) is not None:
+        yield from iter_columnar_products(json_file)
+        return
+    with open(json_file, 'r', encoding='utf-8') as f:
+        if json_file.endswith('.ndjson'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+def load_products_from_json(cursor, json_file):
+    """Построчная вставка продуктов из JSON файла"""
+    started = time.perf_counter()
+    
+    # Словарь для хранения id категорий
+    category_ids = {}
+    
+    # Вставляем данные о продуктах
+    processed = 0
+    for product in iter_products_file(json_file):
+        processed += 1
+        name = product['name']
+        category = product['category']
+        proteins = product['proteins']
+        fats = product['fats']
+        carbs = product['carbs']
+        calories = product['calories']
+        water = product['water']
+        
+        # Вставляем категорию при первой встрече и сохраняем ее id
+        if category not in category_ids:
+            category_name = CATEGORY_NAMES.get(category, 'Другое')
+            
+            # Проверяем, существует ли категория
+            cursor.execute("SELECT id FROM product_categories WHERE slug = %s", (category,))
+            result = cursor.fetchone()
+            
+            if result:
+                category_ids[category] = result[0]
+            else:
+                cursor.execute(
+                    "INSERT INTO product_categories (name, slug, description) VALUES (%s, %s, %s) RETURNING id",
+                    (category_name, category, category_name)
+                )
+                category_ids[category] = cursor.fetchone()[0]
+        
+        # Проверяем, существует ли продукт
+        cursor.execute("SELECT id FROM products WHERE name = %s", (name,))
+        if not cursor.fetchone():
+            cursor.execute(
+                """
+                INSERT INTO products 
+                (name, category_id, proteins, fats, carbs, calories, water, serving_size) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """,
+                (name, category_ids[category], proteins, fats, carbs, calories, water, 100)
+            )
+    
+    # Получаем количество добавленных продуктов
+    cursor.execute("SELECT COUNT(*) FROM products")
+    products_count = cursor.fetchone()[0]
+    
+    record_load_rate('json', processed, time.perf_counter() - started)
+    logging.info(f"Данные из файла {json_file} успешно добавлены в базу данных. Всего продуктов: {products_count}")
+
+class IteratorFile(io.TextIOBase):
+    """Файловый объект для COPY, читающий строки из итератора по мере необходимости"""
+
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.buffer = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.lines)
+            except StopIteration:
+                break
+        if size < 0:
+            chunk, self.buffer = self.buffer, ''
+        else:
+            chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+def csv_lines(rows):
+    """Строки в формате CSV для COPY: None записывается как пустое поле (NULL)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+def ensure_categories(cursor, categories):
+    """Добавление недостающих категорий продуктов одним запросом"""
+    values = [(CATEGORY_NAMES.get(category, 'Другое'), category, CATEGORY_NAMES.get(category, 'Другое')) for category in sorted(categories)]
+    if not values:
+        return
+    cursor.execute(
+        "INSERT INTO product_categories (name, slug, description) SELECT * FROM unnest(%s::varchar[], %s::varchar[], %s::text[]) "
+        "ON CONFLICT (slug) DO NOTHING",
+        ([v[0] for v in values], [v[1] for v in values], [v[2] for v in values])
+    )
+
+def copy_products_to_staging(cursor, products):
+    """Загрузка продуктов во временную таблицу products_staging через COPY.
+    
+    Продукты читаются из итератора по мере отправки. Возвращает количество
+    продуктов и множество встреченных категорий.
+    """
+    stats = {'count': 0, 'categories': set()}
+    
+    def rows():
+        for position, product in enumerate(products):
+            stats['count'] += 1
+            stats['categories'].add(product['category'])
+            yield (position, product['name'], product['category'], product['proteins'], product['fats'],
+                   product['carbs'], product['calories'], product['water'])
+    
+    cursor.execute(CREATE_PRODUCTS_STAGING_SQL)
+    cursor.copy_expert(COPY_PRODUCTS_STAGING_SQL, IteratorFile(csv_lines(rows())))
+    cursor.execute("ANALYZE products_staging")
+    return stats['count'], stats['categories']
+
+def columnar_csv_chunks(batches, stats):
+    """Пакеты записей столбцового файла в виде блоков CSV для COPY.
+    
+    Пакет целиком переводится в CSV средствами pyarrow, без словарей
+    Python на каждый продукт. Количество продуктов и категории
+    накапливаются в stats.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    
+    options = pa_csv.WriteOptions(include_header=False)
+    for batch in batches:
+        categories = batch.column('category')
+        stats['categories'].update(pc.unique(categories).to_pylist())
+        positions = pa.array(range(stats['count'], stats['count'] + batch.num_rows), type=pa.int64())
+        table = pa.Table.from_arrays(
+            [positions, batch.column('name'), categories.cast(pa.string())] + [batch.column(nutrient) for nutrient in NUTRIENTS],
+            names=['position', 'name', 'category_slug'] + NUTRIENTS
+        )
+        sink = pa.BufferOutputStream()
+        pa_csv.write_csv(table, sink, options)
+        stats['count'] += batch.num_rows
+        yield sink.getvalue().to_pybytes().decode('utf-8')
+
+def copy_file_to_staging(cursor, data_file):
+    """Загрузка файла продуктов в products_staging.
+    
+    Файлы Arrow и Parquet передаются в COPY по пакетам записей, JSON и
+    NDJSON - по продуктам. Возвращает количество продуктов и множество
+    встреченных категорий.
+    """
+    if columnar_format(data_file) is None:
+        return copy_products_to_staging(cursor, iter_products_file(data_file))
+    
+    stats = {'count': 0, 'categories': set()}
+    cursor.execute(CREATE_PRODUCTS_STAGING_SQL)
+    cursor.copy_expert(COPY_PRODUCTS_STAGING_SQL, IteratorFile(columnar_csv_chunks(read_record_batches(data_file), stats)))
+    cursor.execute("ANALYZE products_staging")
+    return stats['count'], stats['categories']
+
+def record_load_rate(loader, rows, elapsed):
+    """Метрики загрузки продуктов: количество строк и скорость"""
+    db_metrics.inc('rows_loaded', rows, loader=loader)
+    db_metrics.set('rows_per_second', rows / elapsed if elapsed else 0, loader=loader)
+
+def bulk_load_products(cursor, json_file):
+    """Массовая вставка продуктов из JSON файла через COPY во временную таблицу"""
+    started = time.perf_counter()
+    
+    count, categories = copy_file_to_staging(cursor, json_file)
+    ensure_categories(cursor, categories)
+    
+    cursor.execute(MERGE_PRODUCTS_STAGING_SQL)
+    inserted = cursor.rowcount
+    
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed else 0
+    record_load_rate('bulk', count, elapsed)
+    db_metrics.inc('products_changed', inserted, action='inserted')
+    logging.info(
+        f"Данные из файла {json_file} загружены через COPY: обработано {count}, "
+        f"добавлено {inserted} продуктов за {elapsed:.2f} с ({rate:.0f} строк/с)"
+    )
+
+def sync_products(cursor, json_file):
+    """Инкрементальная синхронизация каталога продуктов с JSON файлом"""
+    started = time.perf_counter()
+    
+    count, categories = copy_file_to_staging(cursor, json_file)
+    ensure_categories(cursor, categories)
+    
+    cursor.execute("SELECT COUNT(DISTINCT name) FROM products_staging")
+    total = cursor.fetchone()[0]
+    
+    cursor.execute(UPSERT_PRODUCTS_STAGING_SQL)
+    changes = cursor.fetchall()
+    inserted = sum(1 for (is_inserted,) in changes if is_inserted)
+    updated = len(changes) - inserted
+    
+    cursor.execute(DEACTIVATE_MISSING_PRODUCTS_SQL)
+    deactivated = cursor.rowcount
+    
+    # После полной синхронизации каталог совпадает с файлом: от этого набора строятся файлы изменений
+    cursor.execute(UPSERT_PRODUCTS_SNAPSHOT_SQL, (snapshot_id(product_fingerprints(iter_products_file(json_file))),))
+    
+    elapsed = time.perf_counter() - started
+    record_load_rate('sync', count, elapsed)
+    db_metrics.inc('products_changed', inserted, action='inserted')
+    db_metrics.inc('products_changed', updated, action='updated')
+    db_metrics.inc('products_changed', deactivated, action='deactivated')
+    logging.info(
+        f"Синхронизация с файлом {json_file} завершена за {elapsed:.2f} с: "
+        f"добавлено {inserted}, обновлено {updated}, без изменений {total - inserted - updated}, "
+        f"деактивировано {deactivated}"
+    )
+
+def apply_products_delta(cursor, delta_file):
+    """Применение файла изменений каталога от парсера.
+    
+    Добавленные и измененные продукты загружаются как при синхронизации,
+    удаленные деактивируются. Файл применяется, только если он построен от
+    набора, загруженного в базу последним (или это первый файл, а набор
+    в базе еще не записан); иначе нужна полная синхронизация (--sync).
+    """
+    started = time.perf_counter()
+    with open(delta_file, 'r', encoding='utf-8') as f:
+        delta = json.load(f)
+    
+    cursor.execute("SELECT snapshot FROM products_snapshot WHERE id")
+    row = cursor.fetchone()
+    current = row[0] if row else None
+    if current == delta['snapshot']:
+        logging.info(f"Изменения из файла {delta_file} уже применены, каталог не изменился")
+        return
+    if current is not None and current != delta['base_snapshot']:
+        raise RuntimeError(
+            f"Файл изменений {delta_file} построен не от загруженного каталога, "
+            f"выполните полную синхронизацию (--sync) с файлом продуктов"
+        )
+    
+    products = delta['added'] + delta['changed']
+    inserted = updated = 0
+    if products:
+        count, categories = copy_products_to_staging(cursor, iter(products))
+        ensure_categories(cursor, categories)
+        cursor.execute(UPSERT_PRODUCTS_STAGING_SQL)
+        changes = cursor.fetchall()
+        inserted = sum(1 for (is_inserted,) in changes if is_inserted)
+        updated = len(changes) - inserted
+    
+    deactivated = 0
+    if delta['removed']:
+        cursor.execute("UPDATE products SET is_active = FALSE WHERE is_active AND name = ANY(%s)", (delta['removed'],))
+        deactivated = cursor.rowcount
+    
+    cursor.execute(UPSERT_PRODUCTS_SNAPSHOT_SQL, (delta['snapshot'],))
+    
+    elapsed = time.perf_counter() - started
+    record_load_rate('delta', len(products) + len(delta['removed']), elapsed)
+    db_metrics.inc('products_changed', inserted, action='inserted')
+    db_metrics.inc('products_changed', updated, action='updated')
+    db_metrics.inc('products_changed', deactivated, action='deactivated')
+    logging.info(
+        f"Изменения из файла {delta_file} применены за {elapsed:.2f} с: "
+        f"добавлено {inserted}, обновлено {updated}, деактивировано {deactivated}"
+    )
+
+def load_sample_data(cursor):
+    """Вставка примерных данных для плейлистов"""
+    # Вставляем жанры музыки
+    cursor.execute(INSERT_MUSIC_GENRES_SQL)
+    
+    # Вставляем плейлисты
+    cursor.execute(INSERT_SAMPLE_PLAYLISTS_SQL)
+    
+    logging.info("Примерные данные для плейлистов успешно добавлены")
+
+def create_tables(host, port, user, password, database):
+    """Создание таблиц в базе данных"""
+    try:
+        run_in_transaction(host, port, user, password, database, apply_schema)
         return True
     except Exception as e:
         logging.error(f"Ошибка при создании таблиц: {e}")
@@ -309,23 +973,7 @@ def insert_data_from_sql_file(host, port, user, password, database, sql_file):
         return False
         
     try:
-        with open(sql_file, 'r', encoding='utf-8') as f:
-            sql_content = f.read()
-            
-        conn = connect_to_postgres(host, port, user, password, database)
-        if not conn:
-            return False
-            
-        cursor = conn.cursor()
-        
-        # Выполняем SQL запросы из файла
-        cursor.execute(sql_content)
-        conn.commit()
-        
-        logging.info(f"Данные из файла {sql_file} успешно добавлены в базу данных")
-        
-        cursor.close()
-        conn.close()
+        run_in_transaction(host, port, user, password, database, load_sql_file, sql_file)
         return True
     except Exception as e:
         logging.error(f"Ошибка при вставке данных из SQL файла: {e}")
@@ -338,142 +986,177 @@ def insert_data_from_json(host, port, user, password, database, json_file):
         return False
         
     try:
-        with open(json_file, 'r', encoding='utf-8') as f:
-            products_data = json.load(f)
-            
-        conn = connect_to_postgres(host, port, user, password, database)
-        if not conn:
-            return False
-            
-        cursor = conn.cursor()
-        
-        # Получаем все категории продуктов
-        categories = set(product['category'] for product in products_data)
-        
-        # Словарь для хранения id категорий
-        category_ids = {}
-        
-        # Вставляем категории и сохраняем их id
-        for category in categories:
-            category_name = {
-                'meat': 'Мясо',
-                'poultry': 'Птица',
-                'fish': 'Рыба и морепродукты',
-                'dairy': 'Молочные продукты',
-                'eggs': 'Яйца',
-                'grains': 'Злаки и крупы',
-                'bread': 'Хлеб и выпечка',
-                'pasta': 'Макароны и паста',
-                'vegetables': 'Овощи',
-                'fruits': 'Фрукты',
-                'berries': 'Ягоды',
-                'nuts': 'Орехи и семена',
-                'legumes': 'Бобовые',
-                'sweets': 'Сладости',
-                'beverages': 'Напитки',
-                'other': 'Другое'
-            }.get(category, 'Другое')
-            
-            # Проверяем, существует ли категория
-            cursor.execute("SELECT id FROM product_categories WHERE slug = %s", (category,))
-            result = cursor.fetchone()
-            
-            if result:
-                category_ids[category] = result[0]
-            else:
-                cursor.execute(
-                    "INSERT INTO product_categories (name, slug, description) VALUES (%s, %s, %s) RETURNING id",
-                    (category_name, category, category_name)
-                )
-                category_ids[category] = cursor.fetchone()[0]
-        
-        # Вставляем данные о продуктах
-        for product in products_data:
-            name = product['name']
-            category = product['category']
-            proteins = product['proteins']
-            fats = product['fats']
-            carbs = product['carbs']
-            calories = product['calories']
-            water = product['water']
-            
-            # Проверяем, существует ли продукт
-            cursor.execute("SELECT id FROM products WHERE name = %s", (name,))
-            if not cursor.fetchone():
-                cursor.execute(
-                    """
-                    INSERT INTO products 
-                    (name, category_id, proteins, fats, carbs, calories, water, serving_size) 
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    """,
-                    (name, category_ids[category], proteins, fats, carbs, calories, water, 100)
-                )
-        
-        conn.commit()
-        
-        # Получаем количество добавленных продуктов
-        cursor.execute("SELECT COUNT(*) FROM products")
-        products_count = cursor.fetchone()[0]
+        run_in_transaction(host, port, user, password, database, load_products_from_json, json_file)
+        return True
+    except Exception as e:
+        logging.error(f"Ошибка при вставке данных из JSON файла: {e}")
+        return False
+
+def bulk_insert_data_from_json(host, port, user, password, database, json_file):
+    """Массовая вставка данных из JSON файла через COPY во временную таблицу"""
+    if not os.path.exists(json_file):
+        logging.error(f"JSON файл {json_file} не найден")
+        return False
         
-        logging.info(f"Данные из файла {json_file} успешно добавлены в базу данных. Всего продуктов: {products_count}")
+    try:
+        run_in_transaction(host, port, user, password, database, bulk_load_products, json_file)
+        return True
+    except Exception as e:
+        logging.error(f"Ошибка при массовой вставке данных из JSON файла: {e}")
+        return False
+
+def sync_products_from_json(host, port, user, password, database, json_file):
+    """Инкрементальная синхронизация каталога продуктов с JSON файлом"""
+    if not os.path.exists(json_file):
+        logging.error(f"JSON файл {json_file} не найден")
+        return False
         
-        cursor.close()
-        conn.close()
+    try:
+        run_in_transaction(host, port, user, password, database, sync_products, json_file)
         return True
     except Exception as e:
-        logging.error(f"Ошибка при вставке данных из JSON файла: {e}")
+        logging.error(f"Ошибка при синхронизации данных из JSON файла: {e}")
         return False
 
 def insert_sample_data(host, port, user, password, database):
     """Вставка примерных данных для плейлистов и треков"""
     try:
-        conn = connect_to_postgres(host, port, user, password, database)
-        if not conn:
-            return False
-            
-        cursor = conn.cursor()
-        
-        # Вставляем жанры музыки
-        cursor.execute(INSERT_MUSIC_GENRES_SQL)
-        
-        # Вставляем плейлисты
-        cursor.execute(INSERT_SAMPLE_PLAYLISTS_SQL)
-        
-        conn.commit()
-        
-        logging.info("Примерные данные для плейлистов успешно добавлены")
-        
-        cursor.close()
-        conn.close()
+        run_in_transaction(host, port, user, password, database, load_sample_data)
         return True
     except Exception as e:
         logging.error(f"Ошибка при вставке примерных данных: {e}")
         return False
 
-def main():
-    args = parse_arguments()
+def insert_synthetic_data(args):
+    """Генерация синтетических данных для нагрузочного тестирования в отдельных подключениях"""
+    counts = {
+        'users': args.synthetic_users, 'products': args.synthetic_products,
+        'tracks': args.synthetic_tracks, 'playlists': args.synthetic_playlists
+    }
+    started = time.perf_counter()
+    try:
+        from synthetic_data import generate_synthetic_data
+        loaded = generate_synthetic_data(
+            (args.host, args.port, args.user, args.password, args.database),
+            counts, args.synthetic_seed, max(1, args.synthetic_workers)
+        )
+    except Exception as e:
+        logging.error(f"Ошибка при генерации синтетических данных: {e}")
+        return False
+    
+    elapsed = time.perf_counter() - started
+    record_load_rate('synthetic', sum(loaded.values()), elapsed)
+    db_metrics.observe('stage_seconds', elapsed, stage='synthetic_data')
+    return True
+
+def select_products_loader(args):
+    """Выбор способа загрузки продуктов по аргументам командной строки.
+    
+    Файлы явно выбранных способов (--delta, --sync, --bulk) проверяет
+    parse_arguments; без них загружается SQL-файл или JSON-файл, если есть.
+    """
+    if args.delta:
+        return apply_products_delta, args.delta
+    if args.sync:
+        return sync_products, args.data_file
+    if args.bulk:
+        return bulk_load_products, args.data_file
+    if os.path.exists(args.sql_file):
+        return load_sql_file, args.sql_file
+    if os.path.exists(args.data_file):
+        return load_products_from_json, args.data_file
+    return None, None
+
+def initialize_database(args):
+    """Инициализация базы данных в одном подключении и одной транзакции.
     
-    # Создаем базу данных
+    Схема и данные загружаются атомарно: при ошибке обязательного этапа
+    откатываются все изменения. Ошибка вставки примерных данных откатывает
+    только этот этап. Время каждого этапа выводится в лог.
+    """
+    timings = {}
+    
+    started = time.perf_counter()
     if not create_database(args.host, args.port, args.user, args.password, args.database, args.recreate_db):
-        return
+        return False
+    timings['database'] = time.perf_counter() - started
     
-    # Создаем таблицы
-    if not create_tables(args.host, args.port, args.user, args.password, args.database):
-        return
+    started = time.perf_counter()
+    conn = connect_to_postgres(args.host, args.port, args.user, args.password, args.database)
+    if not conn:
+        return False
+    timings['connect'] = time.perf_counter() - started
     
-    # Вставляем данные
-    if os.path.exists(args.sql_file):
-        insert_data_from_sql_file(args.host, args.port, args.user, args.password, args.database, args.sql_file)
-    elif os.path.exists(args.data_file):
-        insert_data_from_json(args.host, args.port, args.user, args.password, args.database, args.data_file)
-    else:
-        logging.warning("Файлы с данными не найдены. База данных создана без данных о продуктах.")
+    success = False
+    try:
+        conn.autocommit = False
+        cursor = conn.cursor()
+        
+        # Создаем таблицы
+        with run_stage(cursor, 'schema', timings):
+            apply_schema(cursor)
+        
+        # Вставляем данные
+        loader, data_file = select_products_loader(args)
+        if loader is None:
+            logging.warning("Файлы с данными не найдены. База данных создана без данных о продуктах.")
+        else:
+            with run_stage(cursor, 'products', timings):
+                loader(cursor, data_file)
+        
+        # Пересчитываем похожие продукты
+        if args.refresh_similar:
+            with run_stage(cursor, 'similar_products', timings):
+                from product_similarity import refresh_similar_products, DEFAULT_NEIGHBOURS
+                neighbours = DEFAULT_NEIGHBOURS if args.similar_neighbours is None else args.similar_neighbours
+                refresh_similar_products(cursor, neighbours)
+        
+        # Вставляем примерные данные для плейлистов
+        if args.sample_data:
+            try:
+                with run_stage(cursor, 'sample_data', timings):
+                    load_sample_data(cursor)
+            except Exception as e:
+                logging.error(f"Ошибка при вставке примерных данных: {e}")
+        
+        started = time.perf_counter()
+        conn.commit()
+        timings['commit'] = time.perf_counter() - started
+        
+        cursor.close()
+        success = True
+    except Exception as e:
+        conn.rollback()
+        logging.error(f"Ошибка при инициализации базы данных, изменения отменены: {e}")
+    finally:
+        conn.close()
+        
+        for name, elapsed in timings.items():
+            logging.info(f"Этап {name}: {elapsed:.3f} с")
+            db_metrics.observe('stage_seconds', elapsed, stage=name)
     
-    # Вставляем примерные данные для плейлистов
-    if args.sample_data:
-        insert_sample_data(args.host, args.port, args.user, args.password, args.database)
+    return success
+
+def main(argv=None):
+    """Запуск из командной строки: логирование настраивается только здесь"""
+    args = parse_arguments(argv)
+    configure_logging(LOG_FILE)
+    
+    # Метрики собираются, только если запрошен хотя бы один отчет
+    if args.metrics_file or args.prometheus_file:
+        db_metrics.enable()
     
-    logging.info("Инициализация базы данных успешно завершена")
+    success = False
+    try:
+        success = initialize_database(args)
+        # Синтетические данные загружаются параллельно из нескольких подключений,
+        # поэтому не входят в общую транзакцию инициализации
+        if success and any((args.synthetic_users, args.synthetic_products, args.synthetic_tracks, args.synthetic_playlists)):
+            success = insert_synthetic_data(args)
+        if success:
+            logging.info("Инициализация базы данных успешно завершена")
+    finally:
+        db_metrics.write_reports(args.metrics_file, args.prometheus_file, success=success)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
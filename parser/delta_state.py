@@ -0,0 +1,159 @@
+import os
+import re
+import json
+import logging
+
+from http_cache import body_hash
+
+# Открывающий или закрывающий тег таблицы
+TABLE_TAG_RE = re.compile(r'<(/?)table\b[^>]*>', re.IGNORECASE)
+
+# Поля продукта, по которым определяется, изменился ли он
+FINGERPRINT_FIELDS = ['category', 'proteins', 'fats', 'carbs', 'calories', 'water']
+
+
+def split_tables(html):
+    """Таблицы верхнего уровня страницы в виде фрагментов HTML.
+
+    Строки извлекаются только из таблиц, поэтому разбор фрагментов по
+    отдельности дает те же строки, что и разбор всей страницы. Возвращает
+    None, если теги таблиц не сбалансированы: такую страницу нужно разбирать
+    целиком.
+    """
+    fragments = []
+    depth = 0
+    start = 0
+    for match in TABLE_TAG_RE.finditer(html):
+        if match.group(1):
+            if depth == 0:
+                return None
+            depth -= 1
+            if depth == 0:
+                fragments.append(html[start:match.end()])
+        else:
+            if depth == 0:
+                start = match.start()
+            depth += 1
+    return fragments if depth == 0 else None
+
+
+def product_fingerprint(product):
+    """Отпечаток значений продукта (без названия)"""
+    values = [product.get(field) for field in FINGERPRINT_FIELDS]
+    return body_hash(json.dumps(values))[:16]
+
+
+def snapshot_id(fingerprints):
+    """Идентификатор набора продуктов по словарю {название: отпечаток}"""
+    return body_hash(''.join(f"{name}\t{fingerprints[name]}\n" for name in sorted(fingerprints)))
+
+
+def product_fingerprints(products):
+    """Отпечатки продуктов; при повторе названия действует первый продукт"""
+    fingerprints = {}
+    for product in products:
+        fingerprints.setdefault(product['name'], product_fingerprint(product))
+    return fingerprints
+
+
+class ScrapeState:
+    """Состояние прошлого запуска парсера для разбора и выгрузки только изменений.
+
+    Хранит хэши страниц и их таблиц, строки каждой таблицы по ее хэшу и
+    отпечатки выгруженных продуктов по названию. rules - версия правил
+    разбора: при ее смене сохраненные строки таблиц не используются.
+    """
+
+    def __init__(self, path, rules=None):
+        self.path = path
+        self.rules = rules
+        self.pages = {}
+        self.tables = {}
+        self.products = None
+        self.snapshot = None
+        self.used_tables = set()
+
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Не удалось прочитать состояние парсера {path}: {e}")
+            return
+        if state.get('rules') == rules:
+            self.pages = state.get('pages', {})
+            self.tables = state.get('tables', {})
+        else:
+            logging.info("Правила разбора изменились, все таблицы будут разобраны заново")
+        self.products = state.get('products')
+        self.snapshot = state.get('snapshot')
+
+    def page_rows(self, url, html):
+        """Строки страницы, если она не изменилась с прошлого запуска, иначе None"""
+        entry = self.pages.get(url)
+        if entry is None or entry['hash'] != body_hash(html) or any(h not in self.tables for h in entry['tables']):
+            return None
+        self.used_tables.update(entry['tables'])
+        return [tuple(row) for table_hash in entry['tables'] for row in self.tables[table_hash]]
+
+    def table_rows(self, table_hash):
+        """Строки таблицы с таким же хэшем из прошлого запуска или None"""
+        rows = self.tables.get(table_hash)
+        if rows is None:
+            return None
+        self.used_tables.add(table_hash)
+        return [tuple(row) for row in rows]
+
+    def store_page(self, url, html, tables):
+        """Запоминание страницы: tables - список (хэш таблицы, строки таблицы)"""
+        self.pages[url] = {'hash': body_hash(html), 'tables': [table_hash for table_hash, _rows in tables]}
+        for table_hash, rows in tables:
+            self.tables[table_hash] = [list(row) for row in rows]
+            self.used_tables.add(table_hash)
+
+    def diff(self, products):
+        """Изменения продуктов относительно прошлого запуска.
+
+        Возвращает словарь с добавленными, измененными и удаленными продуктами
+        и идентификаторами наборов до и после; новые отпечатки запоминаются.
+        """
+        previous = self.products or {}
+        fingerprints = {}
+        added = []
+        changed = []
+        for product in products:
+            if product['name'] in fingerprints:
+                continue
+            fingerprint = product_fingerprint(product)
+            fingerprints[product['name']] = fingerprint
+            if product['name'] not in previous:
+                added.append(product)
+            elif previous[product['name']] != fingerprint:
+                changed.append(product)
+        removed = sorted(name for name in previous if name not in fingerprints)
+
+        delta = {
+            'base_snapshot': self.snapshot,
+            'snapshot': snapshot_id(fingerprints),
+            'added': added,
+            'changed': changed,
+            'removed': removed
+        }
+        self.products = fingerprints
+        self.snapshot = delta['snapshot']
+        return delta
+
+    def save(self):
+        """Запись состояния; строки таблиц, не встретившихся в этом запуске, удаляются"""
+        state = {
+            'rules': self.rules,
+            'pages': self.pages,
+            'tables': {table_hash: rows for table_hash, rows in self.tables.items() if table_hash in self.used_tables},
+            'products': self.products,
+            'snapshot': self.snapshot
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,125 @@
+import time
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+# Результат загрузки одной страницы
+FetchResult = namedtuple('FetchResult', ['key', 'url', 'status_code', 'text', 'headers', 'elapsed', 'error'])
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов по алгоритму token bucket"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Блокирует поток, пока в корзине не появится токен"""
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """Набор token bucket'ов, по одному на каждый хост"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(self.rate, self.burst)
+        bucket.acquire()
+
+
+def create_session(headers=None, pool_size=10):
+    """Создание HTTP-сессии с общим пулом соединений"""
+    import requests
+    
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def fetch_page(session, key, url, limiter=None, timeout=30, cache=None):
+    """Загрузка одной страницы с учетом ограничения частоты запросов.
+
+    При переданном кэше отправляется условный запрос, а на ответ 304
+    тело страницы берется из кэша.
+    """
+    if limiter is not None:
+        limiter.acquire(url)
+
+    request_headers = cache.conditional_headers(url) if cache is not None else {}
+
+    started = time.perf_counter()
+    try:
+        response = session.get(url, headers=request_headers, timeout=timeout)
+        elapsed = time.perf_counter() - started
+        text = response.text
+        if response.status_code == 304 and cache is not None:
+            text = cache.get_body(url)
+        return FetchResult(key, url, response.status_code, text, dict(response.headers), elapsed, None)
+    except Exception as e:
+        elapsed = time.perf_counter() - started
+        return FetchResult(key, url, None, None, None, elapsed, e)
+
+
+def fetch_all(urls, headers=None, max_workers=8, rate=2.0, burst=5, timeout=30, session=None, cache=None):
+    """Параллельная загрузка страниц.
+
+    urls - словарь {ключ: url}. Возвращает словарь {ключ: FetchResult}
+    в том же порядке, что и входной словарь.
+    """
+    limiter = HostRateLimiter(rate, burst)
+    own_session = session is None
+    if own_session:
+        session = create_session(headers, pool_size=max_workers)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {
+                key: executor.submit(fetch_page, session, key, url, limiter, timeout, cache)
+                for key, url in urls.items()
+            }
+            results = {key: future.result() for key, future in futures.items()}
+    finally:
+        if own_session:
+            session.close()
+
+    for result in results.values():
+        if result.error is not None:
+            logging.error(f"Ошибка при загрузке {result.url}: {result.error} ({result.elapsed:.3f} с)")
+        else:
+            logging.info(f"Загружено {result.url}: статус {result.status_code}, {result.elapsed:.3f} с")
+
+    return results
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import hashlib
+import logging
+
+
+def body_hash(text):
+    """SHA-256 от тела ответа"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class HttpCache:
+    """Дисковый кэш HTTP-ответов с ревалидацией по ETag/Last-Modified.
+
+    Для каждого URL хранится тело страницы, заголовки ETag и Last-Modified,
+    хэш тела и уже извлеченные из страницы строки, чтобы при неизменной
+    странице не разбирать HTML повторно. Строки действительны только для
+    той версии правил разбора (rules_version), которой они извлечены.
+    """
+
+    def __init__(self, directory, max_size=100 * 1024 * 1024, max_age=30 * 24 * 3600, rules_version=None):
+        self.directory = directory
+        self.rules_version = rules_version
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url, suffix):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + suffix)
+
+    def _load(self, url):
+        meta_path = self._path(url, '.json')
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Не удалось прочитать запись кэша для {url}: {e}")
+            return None
+        if entry.get('url') != url:
+            return None
+        if self.max_age and time.time() - entry.get('stored_at', 0) > self.max_age:
+            return None
+        return entry
+
+    def _write_atomic(self, path, data):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def conditional_headers(self, url):
+        """Заголовки условного запроса для URL, если он есть в кэше"""
+        entry = self._load(url)
+        if not entry:
+            return {}
+        conditional = {}
+        if entry.get('etag'):
+            conditional['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            conditional['If-Modified-Since'] = entry['last_modified']
+        return conditional
+
+    def get_body(self, url):
+        """Тело страницы из кэша или None"""
+        body_path = self._path(url, '.html')
+        if not self._load(url) or not os.path.exists(body_path):
+            return None
+        with open(body_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def get_rows(self, url, status_code, text):
+        """Строки, извлеченные из страницы ранее, если страница не изменилась.
+
+        Попадание в кэш - ответ 304 или ответ 200 с тем же хэшем тела,
+        если строки извлечены той же версией правил разбора.
+        """
+        entry = self._load(url)
+        if entry is not None and entry.get('rows') is not None and entry.get('rules_version') == self.rules_version:
+            if status_code == 304 or (status_code == 200 and text is not None and body_hash(text) == entry.get('body_hash')):
+                self.hits += 1
+                # Обновляем время обращения для вытеснения давно не использованных записей
+                os.utime(self._path(url, '.json'))
+                return [tuple(row) for row in entry['rows']]
+        self.misses += 1
+        return None
+
+    def store(self, url, text, response_headers, rows):
+        """Сохранение ответа и извлеченных из него строк"""
+        response_headers = {name.lower(): value for name, value in (response_headers or {}).items()}
+        entry = {
+            'url': url,
+            'etag': response_headers.get('etag'),
+            'last_modified': response_headers.get('last-modified'),
+            'body_hash': body_hash(text),
+            'rules_version': self.rules_version,
+            'stored_at': time.time(),
+            'rows': [list(row) for row in rows]
+        }
+        try:
+            self._write_atomic(self._path(url, '.html'), text.encode('utf-8'))
+            self._write_atomic(self._path(url, '.json'), json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+        except OSError as e:
+            logging.warning(f"Не удалось сохранить ответ {url} в кэш: {e}")
+
+    def evict(self):
+        """Удаление устаревших записей и давно не использованных записей сверх лимита размера"""
+        now = time.time()
+        entries = []
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith('.json'):
+                continue
+            key = file_name[:-len('.json')]
+            meta_path = os.path.join(self.directory, file_name)
+            body_path = os.path.join(self.directory, key + '.html')
+            try:
+                size = os.path.getsize(meta_path)
+                if os.path.exists(body_path):
+                    size += os.path.getsize(body_path)
+                accessed_at = os.path.getmtime(meta_path)
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    stored_at = json.load(f).get('stored_at', 0)
+            except (OSError, ValueError):
+                stored_at = 0
+                accessed_at = 0
+                size = 0
+            entries.append((accessed_at, stored_at, size, meta_path, body_path))
+
+        removed = 0
+        total_size = sum(entry[2] for entry in entries)
+        # Самые давно использованные записи - первыми
+        entries.sort()
+        for accessed_at, stored_at, size, meta_path, body_path in entries:
+            expired = self.max_age and now - stored_at > self.max_age
+            oversized = self.max_size and total_size > self.max_size
+            if not expired and not oversized:
+                continue
+            for path in (meta_path, body_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            total_size -= size
+            removed += 1
+
+        if removed:
+            logging.info(f"Из HTTP-кэша удалено записей: {removed}")
+        return removed
+
+    def log_stats(self):
+        logging.info(f"HTTP-кэш: попаданий {self.hits}, промахов {self.misses}")
@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import logging
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+# Формат строк лога скриптов
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Границы корзин гистограмм длительностей, в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Общий контекст для выключенных таймеров, чтобы не создавать объект на каждый вызов
+NULL_TIMER = nullcontext()
+
+
+def configure_logging(log_file=None, level=logging.INFO):
+    """Настройка логирования при запуске скрипта из командной строки.
+
+    Сообщения выводятся в консоль и, если задан log_file, дописываются в файл.
+    Повторный вызов ничего не меняет, поэтому при нескольких запусках в одном
+    процессе обработчики не дублируются.
+    """
+    if logging.getLogger().handlers:
+        return
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.insert(0, logging.FileHandler(log_file))
+    logging.basicConfig(level=level, format=LOG_FORMAT, handlers=handlers)
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Histogram:
+    """Гистограмма значений с фиксированными границами корзин"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[idx] += 1
+                break
+
+    def cumulative_counts(self):
+        total = 0
+        for count in self.counts:
+            total += count
+            yield total
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'buckets': dict(zip((str(bound) for bound in self.buckets), self.cumulative_counts()))
+        }
+
+
+class Metrics:
+    """Счетчики, показатели и гистограммы одного запуска.
+
+    Пока сбор выключен, все методы сразу возвращаются, поэтому вызовы можно
+    оставлять в коде. В горячих циклах вызовы не размещаются: там данные
+    накапливаются в локальных структурах и передаются сюда пачкой.
+    """
+
+    def __init__(self, namespace, enabled=False):
+        self.namespace = namespace
+        self.enabled = enabled
+        self.started_at = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def enable(self):
+        self.enabled = True
+        self.started_at = time.time()
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        series = self.counters.setdefault(name, {})
+        key = label_key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        if not self.enabled:
+            return
+        self.gauges.setdefault(name, {})[label_key(labels)] = value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        series = self.histograms.setdefault(name, {})
+        key = label_key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    def timer(self, name, **labels):
+        """Контекстный менеджер, записывающий длительность блока в гистограмму name"""
+        if not self.enabled:
+            return NULL_TIMER
+        return self._timer(name, labels)
+
+    @contextmanager
+    def _timer(self, name, labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def report(self, **info):
+        """Отчет о запуске в виде словаря"""
+        def series(metric):
+            return [dict(dict(key), value=value) for key, value in metric.items()]
+
+        finished_at = time.time()
+        return {
+            'namespace': self.namespace,
+            'started_at': datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+            'finished_at': datetime.fromtimestamp(finished_at, timezone.utc).isoformat(),
+            'duration_seconds': finished_at - self.started_at,
+            **info,
+            'counters': {name: series(metric) for name, metric in self.counters.items()},
+            'gauges': {name: series(metric) for name, metric in self.gauges.items()},
+            'histograms': {
+                name: [dict(dict(key), **histogram.to_dict()) for key, histogram in metric.items()]
+                for name, metric in self.histograms.items()
+            }
+        }
+
+    def write_json(self, path, **info):
+        write_atomic(path, json.dumps(self.report(**info), ensure_ascii=False, indent=2))
+
+    def write_prometheus(self, path, **info):
+        """Запись метрик в текстовом формате Prometheus (для textfile collector node_exporter)"""
+        lines = []
+        prefix = self.namespace + '_'
+
+        for name, metric in self.counters.items():
+            lines.append(f"# TYPE {prefix}{name}_total counter")
+            for key, value in metric.items():
+                lines.append(f"{prefix}{name}_total{format_labels(key)} {value}")
+
+        gauges = dict(self.gauges)
+        # Время завершения и признак успеха запуска - для оповещений о сбоях и устаревших данных
+        gauges['last_run_timestamp_seconds'] = {(): time.time()}
+        gauges['last_run_duration_seconds'] = {(): time.time() - self.started_at}
+        if 'success' in info:
+            gauges['last_run_success'] = {(): 1 if info['success'] else 0}
+        for name, metric in gauges.items():
+            lines.append(f"# TYPE {prefix}{name} gauge")
+            for key, value in metric.items():
+                lines.append(f"{prefix}{name}{format_labels(key)} {value}")
+
+        for name, metric in self.histograms.items():
+            lines.append(f"# TYPE {prefix}{name} histogram")
+            for key, histogram in metric.items():
+                for bound, count in zip(histogram.buckets, histogram.cumulative_counts()):
+                    lines.append(f"{prefix}{name}_bucket{format_labels(key + (('le', str(bound)),))} {count}")
+                lines.append(f"{prefix}{name}_bucket{format_labels(key + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{prefix}{name}_sum{format_labels(key)} {histogram.sum}")
+                lines.append(f"{prefix}{name}_count{format_labels(key)} {histogram.count}")
+
+        write_atomic(path, '\n'.join(lines) + '\n')
+
+    def write_reports(self, json_path=None, prometheus_path=None, **info):
+        """Запись запрошенных отчетов; ошибка записи не прерывает запуск"""
+        if not self.enabled:
+            return
+        try:
+            if json_path:
+                self.write_json(json_path, **info)
+                logging.info(f"Отчет о запуске сохранен в {json_path}")
+            if prometheus_path:
+                self.write_prometheus(prometheus_path, **info)
+                logging.info(f"Метрики Prometheus сохранены в {prometheus_path}")
+        except OSError as e:
+            logging.error(f"Не удалось сохранить метрики запуска: {e}")
+
+
+def format_labels(key):
+    if not key:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in key
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def write_atomic(path, text):
+    """Запись файла через временный файл, чтобы читатель не увидел его частично записанным"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# Метрики запусков парсера и инициализации базы данных
+parser_metrics = Metrics('fitbeast_parser')
+db_metrics = Metrics('fitbeast_db_init')
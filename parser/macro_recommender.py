@@ -0,0 +1,406 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import statistics
+import numpy as np
+
+from instrumentation import configure_logging
+
+# Питательные вещества, по которым задаются цели, и столбец калорий в матрице каталога
+TARGET_NUTRIENTS = ['proteins', 'fats', 'carbs']
+CALORIES = 3
+
+# Максимальная масса одного продукта в рекомендации, г
+DEFAULT_MAX_GRAMS = 500
+
+# Минимальная масса продукта в сочетании, г: сочетание с меньшей массой повторяет меньший набор
+MIN_GRAMS = 5
+
+# Сколько продуктов-кандидатов по каждому признаку участвует в сочетаниях из двух и из трех продуктов
+PAIR_POOL_SIZE = 30
+TRIPLE_POOL_SIZE = 10
+
+# Как часто кэш проверяет версию каталога в базе данных, с
+DEFAULT_CHECK_INTERVAL = 1.0
+
+# Активные продукты со всеми значениями БЖУ и калорий на 100 г
+SELECT_CATALOG_SQL = """
+SELECT p.id, p.name, c.slug, p.proteins::float8, p.fats::float8, p.carbs::float8, p.calories::float8,
+       coalesce(nullif(p.serving_size, 0), 100)
+FROM products p
+JOIN product_categories c ON p.category_id = c.id
+WHERE p.is_active = true
+  AND p.proteins IS NOT NULL AND p.fats IS NOT NULL AND p.carbs IS NOT NULL AND p.calories IS NOT NULL
+ORDER BY p.id
+"""
+
+
+class ProductCatalog:
+    """Каталог продуктов в виде массивов NumPy.
+
+    nutrients - матрица n x 4 (белки, жиры, углеводы, калории) на 1 г продукта,
+    categories - коды категорий (номера в category_slugs), version - версия
+    каталога в базе данных, из которой он загружен.
+    """
+
+    def __init__(self, ids, names, category_slugs, categories, nutrients, serving_sizes, version=None):
+        self.ids = ids
+        self.names = names
+        self.category_slugs = list(category_slugs)
+        self.category_codes = {slug: code for code, slug in enumerate(self.category_slugs)}
+        self.categories = categories
+        self.nutrients = nutrients
+        self.serving_sizes = serving_sizes
+        self.version = version
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_rows(cls, rows, version=None):
+        """Каталог из строк (id, название, категория, белки, жиры, углеводы, калории на 100 г, порция)"""
+        slugs = sorted({row[2] for row in rows})
+        codes = {slug: code for code, slug in enumerate(slugs)}
+        values = np.array([row[3:8] for row in rows], dtype=np.float64).reshape(-1, 5)
+        return cls(
+            ids=np.array([row[0] for row in rows], dtype=np.int64),
+            names=np.array([row[1] for row in rows], dtype=str),
+            category_slugs=slugs,
+            categories=np.array([codes[row[2]] for row in rows], dtype=np.uint16),
+            nutrients=values[:, :4] / 100,
+            serving_sizes=values[:, 4],
+            version=version
+        )
+
+    @classmethod
+    def from_database(cls, cursor):
+        # Версия и каталог читаются в одной транзакции, поэтому соответствуют друг другу
+        cursor.execute("SELECT version FROM products_version WHERE id")
+        version = cursor.fetchone()[0]
+        cursor.execute(SELECT_CATALOG_SQL)
+        return cls.from_rows(cursor.fetchall(), version)
+
+    def save(self, path):
+        """Сохранение каталога в файл .npz (без pickle)"""
+        tmp_path = path + '.tmp.npz'
+        np.savez(
+            tmp_path, ids=self.ids, names=self.names, category_slugs=np.array(self.category_slugs, dtype=str),
+            categories=self.categories, nutrients=self.nutrients, serving_sizes=self.serving_sizes,
+            version=np.array(-1 if self.version is None else self.version)
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data['version'])
+            return cls(
+                data['ids'], data['names'], data['category_slugs'].tolist(), data['categories'],
+                data['nutrients'], data['serving_sizes'], None if version < 0 else version
+            )
+
+    def category_mask(self, slugs):
+        """Маска продуктов из категорий slugs; неизвестные категории пропускаются"""
+        codes = [self.category_codes[slug] for slug in slugs if slug in self.category_codes]
+        return np.isin(self.categories, np.array(codes, dtype=self.categories.dtype))
+
+
+class CatalogCache:
+    """Каталог в памяти процесса с проверкой версии в базе данных.
+
+    Версия проверяется не чаще раза в check_interval секунд одним чтением
+    строки products_version. Если db_init перезагрузил или синхронизировал
+    продукты, версия меняется и каталог загружается заново. Файл cache_file
+    ускоряет запуск процесса: если версия в нем совпадает с версией в базе,
+    каталог читается из файла.
+    """
+
+    def __init__(self, connect, cache_file=None, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.connect = connect
+        self.cache_file = cache_file
+        self.check_interval = check_interval
+        self.conn = None
+        self.catalog = None
+        self.checked_at = 0.0
+
+    def cursor(self):
+        if self.conn is None or self.conn.closed:
+            self.conn = self.connect()
+            if self.conn is None:
+                raise RuntimeError("Не удалось подключиться к базе данных")
+        return self.conn.cursor()
+
+    def current_version(self):
+        cursor = self.cursor()
+        cursor.execute("SELECT version FROM products_version WHERE id")
+        return cursor.fetchone()[0]
+
+    def get(self):
+        """Актуальный каталог"""
+        now = time.monotonic()
+        if self.catalog is not None and now - self.checked_at < self.check_interval:
+            return self.catalog
+
+        version = self.current_version()
+        self.checked_at = now
+        if self.catalog is not None and self.catalog.version == version:
+            return self.catalog
+
+        if self.cache_file and os.path.exists(self.cache_file):
+            catalog = ProductCatalog.load(self.cache_file)
+            if catalog.version == version:
+                self.catalog = catalog
+                logging.info(f"Каталог версии {version} загружен из {self.cache_file}: {len(catalog)} продуктов")
+                return catalog
+
+        started = time.perf_counter()
+        self.conn.autocommit = False
+        try:
+            catalog = ProductCatalog.from_database(self.conn.cursor())
+        finally:
+            self.conn.rollback()
+            self.conn.autocommit = True
+        logging.info(f"Каталог версии {catalog.version} загружен из базы данных: "
+                     f"{len(catalog)} продуктов за {time.perf_counter() - started:.2f} с")
+        if self.cache_file:
+            catalog.save(self.cache_file)
+        self.catalog = catalog
+        return catalog
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def target_vector(proteins=None, fats=None, carbs=None):
+    """Номера столбцов и значения заданных целей"""
+    targets = [(column, value) for column, value in enumerate((proteins, fats, carbs)) if value is not None]
+    if not targets or any(value <= 0 for _column, value in targets):
+        raise ValueError("Нужна хотя бы одна положительная цель по белкам, жирам или углеводам")
+    columns, values = zip(*targets)
+    return np.array(columns), np.array(values, dtype=np.float64)
+
+
+def combination_indices(count, size):
+    """Все сочетания из count по size в виде массива (сочетания, size) без цикла Python"""
+    grid = np.indices((count,) * size).reshape(size, -1)
+    increasing = np.all(grid[1:] > grid[:-1], axis=0)
+    return grid[:, increasing].T
+
+
+def fit_single_amounts(vectors, calories, target, max_grams, max_calories):
+    """Массы одиночных продуктов и отклонение от цели (формула вместо системы уравнений)"""
+    weights = 1 / target ** 2
+    weighted = vectors * weights
+    denominator = np.einsum('nt,nt->n', weighted, vectors)
+    amounts = np.divide(weighted @ target, denominator, out=np.zeros(len(vectors)), where=denominator > 0)
+    np.clip(amounts, 0, max_grams, out=amounts)
+    if max_calories is not None:
+        np.minimum(amounts, max_calories / np.maximum(calories, 1e-9), out=amounts)
+    deviation = (vectors * amounts[:, None] - target) / target
+    return amounts, np.einsum('nt,nt->n', deviation, deviation)
+
+
+def fit_amounts(vectors, calories, target, max_grams, max_calories):
+    """Массы продуктов для пачки наборов и отклонение от цели.
+
+    vectors - массив (наборы, продукты в наборе, цели) с содержанием веществ
+    в 1 г. Массы подбираются взвешенным методом наименьших квадратов
+    (вес - квадрат обратной цели, то есть минимизируется сумма квадратов
+    относительных отклонений), отрицательные обнуляются, большие ограничиваются
+    max_grams, а при превышении max_calories все массы набора уменьшаются
+    пропорционально.
+    """
+    weights = 1 / target ** 2
+    weighted = vectors * weights
+    gram = np.einsum('bit,bjt->bij', weighted, vectors)
+    moment = np.einsum('bit,t->bi', weighted, target)
+    size = vectors.shape[1]
+    # Небольшая регуляризация для наборов с линейно зависимыми продуктами
+    ridge = 1e-9 * np.trace(gram, axis1=1, axis2=2)[:, None, None] * np.eye(size) + 1e-12 * np.eye(size)
+    amounts = np.linalg.solve(gram + ridge, moment[..., None])[..., 0]
+    np.clip(amounts, 0, max_grams, out=amounts)
+
+    if max_calories is not None:
+        total_calories = (amounts * calories).sum(axis=1)
+        over = total_calories > max_calories
+        amounts[over] *= (max_calories / total_calories[over])[:, None]
+
+    achieved = np.einsum('bi,bit->bt', amounts, vectors)
+    scores = (((achieved - target) / target) ** 2).sum(axis=1)
+    return amounts, scores
+
+
+class MacroRecommender:
+    """Подбор продуктов и их сочетаний под цели по БЖУ и ограничение калорий.
+
+    Каждый продукт оценивается векторно по всему каталогу. Сочетания из
+    двух и трех продуктов строятся только из ограниченного набора кандидатов:
+    лучших одиночных продуктов и продуктов с наибольшей плотностью каждого
+    целевого вещества (на калорию при ограничении калорий, иначе на грамм).
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def recommend(self, proteins=None, fats=None, carbs=None, max_calories=None, categories=None,
+                  limit=10, max_items=2, max_grams=DEFAULT_MAX_GRAMS):
+        """Лучшие наборы продуктов (до max_items в наборе) по возрастанию отклонения от цели"""
+        columns, target = target_vector(proteins, fats, carbs)
+        if max_calories is not None and max_calories <= 0:
+            raise ValueError("Ограничение калорий должно быть положительным")
+        catalog = self.catalog
+
+        if categories:
+            rows = np.flatnonzero(catalog.category_mask(categories))
+            if not len(rows):
+                return []
+            nutrients = catalog.nutrients[rows]
+        else:
+            rows = np.arange(len(catalog))
+            nutrients = catalog.nutrients
+        vectors = nutrients[:, columns]
+        calories = nutrients[:, CALORIES]
+
+        amounts, scores = fit_single_amounts(vectors, calories, target, max_grams, max_calories)
+        # Продукт без целевых веществ в рекомендацию не попадает
+        scores[amounts <= 0] = np.inf
+        results = [(rows[:, None], amounts[:, None], scores)]
+
+        for size, pool_size in ((2, PAIR_POOL_SIZE), (3, TRIPLE_POOL_SIZE)):
+            if size > max_items:
+                break
+            pool = self.candidate_pool(vectors, calories, scores, pool_size, max_calories is not None)
+            if len(pool) < size:
+                break
+            sets = pool[combination_indices(len(pool), size)]
+            set_amounts, set_scores = fit_amounts(vectors[sets], calories[sets], target, max_grams, max_calories)
+            useful = (set_amounts >= MIN_GRAMS).all(axis=1)
+            results.append((rows[sets[useful]], set_amounts[useful], set_scores[useful]))
+
+        return self.top_results(results, columns, limit)
+
+    @staticmethod
+    def candidate_pool(vectors, calories, scores, pool_size, per_calorie):
+        """Номера строк-кандидатов для сочетаний"""
+        pool_size = min(pool_size, len(scores))
+        pool = [np.argpartition(scores, pool_size - 1)[:pool_size]]
+        pool[0] = pool[0][np.isfinite(scores[pool[0]])]
+        density = vectors / np.maximum(calories, 1)[:, None] if per_calorie else vectors
+        for column in range(vectors.shape[1]):
+            pool.append(np.argpartition(-density[:, column], pool_size - 1)[:pool_size])
+        return np.unique(np.concatenate(pool))
+
+    def top_results(self, results, columns, limit):
+        catalog = self.catalog
+        candidates = []
+        for sets, amounts, scores in results:
+            if not len(scores):
+                continue
+            count = min(limit, len(scores))
+            best = np.argpartition(scores, count - 1)[:count]
+            candidates.extend((float(scores[i]), sets[i], amounts[i]) for i in best if np.isfinite(scores[i]))
+        # При равном отклонении выше набор из меньшего числа продуктов
+        candidates.sort(key=lambda item: (round(item[0], 9), len(item[1])))
+
+        recommendations = []
+        for score, product_rows, amounts in candidates[:limit]:
+            totals = (catalog.nutrients[product_rows] * amounts[:, None]).sum(axis=0)
+            recommendations.append({
+                'score': score,
+                'items': [
+                    {
+                        'id': int(catalog.ids[row]),
+                        'name': str(catalog.names[row]),
+                        'category': catalog.category_slugs[catalog.categories[row]],
+                        'grams': round(float(grams), 1)
+                    }
+                    for row, grams in zip(product_rows.tolist(), amounts.tolist())
+                ],
+                'totals': {
+                    name: round(float(value), 1)
+                    for name, value in zip(TARGET_NUTRIENTS + ['calories'], totals)
+                }
+            })
+        return recommendations
+
+
+# Синтетический каталог для замера скорости без базы данных
+def synthetic_catalog(size, seed=0):
+    rng = np.random.default_rng(seed)
+    macros = rng.dirichlet([0.6, 0.4, 0.8, 2.0], size)[:, :3] * 100
+    calories = 4 * macros[:, 0] + 9 * macros[:, 1] + 4 * macros[:, 2]
+    slugs = ['meat', 'dairy', 'grains', 'vegetables', 'fruits', 'nuts', 'sweets', 'other']
+    rows = [
+        (idx + 1, f"Продукт {idx + 1}", slugs[idx % len(slugs)], *macros[idx].round(1).tolist(), round(float(calories[idx]), 1), 100)
+        for idx in range(size)
+    ]
+    return ProductCatalog.from_rows(rows, version=0)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Подбор продуктов под цели по БЖУ и калориям')
+    parser.add_argument('--proteins', type=float, default=None, help='Цель по белкам, г')
+    parser.add_argument('--fats', type=float, default=None, help='Цель по жирам, г')
+    parser.add_argument('--carbs', type=float, default=None, help='Цель по углеводам, г')
+    parser.add_argument('--max-calories', type=float, default=None, help='Ограничение калорий, ккал')
+    parser.add_argument('--categories', nargs='+', default=None, help='Категории продуктов (slug)')
+    parser.add_argument('--limit', type=int, default=10, help='Количество рекомендаций')
+    parser.add_argument('--max-items', type=int, choices=[1, 2, 3], default=2, help='Максимальное число продуктов в наборе')
+    parser.add_argument('--synthetic', type=int, default=None, help='Использовать синтетический каталог указанного размера вместо базы данных')
+    parser.add_argument('--repeat', type=int, default=1, help='Повторить запрос и вывести задержку')
+    parser.add_argument('--cache-file', default=None, help='Файл .npz для кэша каталога между запусками')
+    parser.add_argument('--host', default='localhost', help='Хост базы данных')
+    parser.add_argument('--port', type=int, default=5432, help='Порт базы данных')
+    parser.add_argument('--user', default='postgres', help='Имя пользователя базы данных')
+    parser.add_argument('--password', default='postgres', help='Пароль пользователя базы данных')
+    parser.add_argument('--database', default='fitbeast', help='Имя базы данных')
+    return parser.parse_args(argv)
+
+
+# Пример: 40 г белка и 20 г углеводов не больше чем на 400 ккал
+#   python macro_recommender.py --proteins 40 --carbs 20 --max-calories 400
+def main(argv=None):
+    args = parse_arguments(argv)
+    configure_logging()
+
+    cache = None
+    if args.synthetic:
+        catalog = synthetic_catalog(args.synthetic)
+    else:
+        import db_init
+        connection = (args.host, args.port, args.user, args.password, args.database)
+        cache = CatalogCache(lambda: db_init.connect_to_postgres(*connection), args.cache_file)
+        catalog = cache.get()
+
+    recommender = MacroRecommender(catalog)
+    timings = []
+    try:
+        for _ in range(max(1, args.repeat)):
+            started = time.perf_counter()
+            recommendations = recommender.recommend(
+                args.proteins, args.fats, args.carbs, args.max_calories, args.categories, args.limit, args.max_items
+            )
+            timings.append((time.perf_counter() - started) * 1000)
+    except ValueError as e:
+        logging.error(str(e))
+        return 1
+    finally:
+        if cache is not None:
+            cache.close()
+
+    for recommendation in recommendations:
+        items = ', '.join(f"{item['name']} ({item['category']}) {item['grams']} г" for item in recommendation['items'])
+        totals = recommendation['totals']
+        print(f"{recommendation['score']:.4f}  {items}  -> Б {totals['proteins']} Ж {totals['fats']} "
+              f"У {totals['carbs']} ккал {totals['calories']}")
+    print(f"Продуктов в каталоге: {len(catalog)}, запрос: медиана {statistics.median(timings):.2f} мс, "
+          f"максимум {max(timings):.2f} мс")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
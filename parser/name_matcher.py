@@ -0,0 +1,245 @@
+import re
+import json
+from difflib import SequenceMatcher
+
+# Скобки с одним количеством или единицей измерения: "Яйцо куриное (1 шт.)", "Сыр [на 100 г]".
+# Такие уточнения не меняют продукт и удаляются. Остальные уточнения в скобках ("(белок)",
+# "(сухое)") различают продукты и остаются частью названия. Количество без скобок
+# ("Сыр 30 г") тоже остается: его число должно совпадать точно
+UNIT_PARENTHESES_RE = re.compile(
+    r'[(\[]\s*(?:на\s+)?(?:\d+(?:[.,]\d+)?\s*)?(?:шт|штука|штук|гр|г|грамм|кг|мл|л)?\.?\s*[)\]]'
+)
+
+# Слова и числа (проценты жирности сохраняются: "молоко 3,2%" и "молоко 1,5%" - разные продукты)
+TOKEN_RE = re.compile(r'[a-zа-я]+|\d+(?:[.,]\d+)?(?:\s*%)?')
+
+# Единицы измерения без числа
+UNIT_WORDS = {'шт', 'штука', 'штук', 'г', 'гр', 'грамм', 'кг', 'мл', 'л'}
+
+# Порог сходства канонических названий для нечеткого объединения по умолчанию
+DEFAULT_THRESHOLD = 0.95
+
+# Минимальная длина слова, в котором допускается опечатка
+MIN_TYPO_WORD_LENGTH = 5
+
+# Отрицательная приставка: "жирный" и "нежирный" - разные продукты
+NEGATION_PREFIX = 'не'
+
+# Списки индекса длиннее этого не просматриваются при поиске кандидатов
+DEFAULT_MAX_BLOCK_SIZE = 200
+
+# Сколько кандидатов с наибольшим числом общих токенов сравнивается для одного названия
+MAX_CANDIDATES = 20
+
+
+def canonical_tokens(product_name):
+    """Отсортированные токены названия без регистра и уточнений количества в скобках"""
+    text = product_name.lower().replace('ё', 'е')
+    text = UNIT_PARENTHESES_RE.sub(' ', text)
+    tokens = {re.sub(r'\s+', '', token).replace(',', '.') for token in TOKEN_RE.findall(text) if token not in UNIT_WORDS}
+    return tuple(sorted(tokens))
+
+
+def number_tokens(tokens):
+    return frozenset(token for token in tokens if token[0].isdigit())
+
+
+def is_typo(word, other):
+    """Слова отличаются опечаткой: одной вставленной или пропущенной буквой либо
+    перестановкой соседних букв.
+
+    Замена буквы опечаткой не считается: "вареная" и "жареная", "сырой" и
+    "сухой" - разные продукты. Слова с отрицательной приставкой и короткие
+    слова не сравниваются.
+    """
+    if word == other:
+        return True
+    if word.isdigit() or other.isdigit() or min(len(word), len(other)) < MIN_TYPO_WORD_LENGTH:
+        return False
+    if word[0] != other[0]:
+        return False
+    if word.startswith(NEGATION_PREFIX) != other.startswith(NEGATION_PREFIX):
+        return False
+    if len(word) == len(other):
+        diff = [idx for idx, (a, b) in enumerate(zip(word, other)) if a != b]
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and word[diff[0]] == other[diff[1]] and word[diff[1]] == other[diff[0]]
+    shorter, longer = sorted((word, other), key=len)
+    if len(longer) - len(shorter) != 1:
+        return False
+    idx = 0
+    while idx < len(shorter) and shorter[idx] == longer[idx]:
+        idx += 1
+    return shorter[idx:] == longer[idx + 1:]
+
+
+class NameReconciler:
+    """Сопоставление вариантов названия одного продукта на разных страницах.
+
+    Названия с одинаковым каноническим видом (регистр, порядок слов и
+    количество в скобках не учитываются) объединяются сразу. При fuzzy=True
+    остальные сравниваются с кандидатами из инвертированного индекса токенов:
+    набор слов должен совпадать, кроме одного слова с опечаткой (is_typo),
+    а сходство названий должно быть не ниже порога. Названия из одной
+    таблицы никогда не объединяются: на одной странице это разные продукты.
+    Представителем группы становится первое встреченное название, поэтому
+    результат определяется порядком страниц и строк.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, max_block_size=DEFAULT_MAX_BLOCK_SIZE, fuzzy=False):
+        self.threshold = threshold
+        self.max_block_size = max_block_size
+        self.fuzzy = fuzzy
+        # Исходное название -> название-представитель
+        self.resolved = {}
+        # Канонический ключ -> название-представитель
+        self.representatives = {}
+        # Токен -> канонические ключи представителей, содержащие его
+        self.index = {}
+        # Канонический ключ представителя -> (множество токенов, множество чисел)
+        self.key_tokens = {}
+        self.merges = []
+
+    def resolve(self, product_name, excluded=None):
+        """Название-представитель для исходного названия.
+
+        excluded - представители, с которыми название объединять нельзя
+        (названия той же таблицы); при совпадении с ними название остается
+        отдельным продуктом.
+        """
+        representative = self.resolved.get(product_name)
+        if representative is not None:
+            if representative == product_name or excluded is None or representative not in excluded:
+                return representative
+            return self.separate(product_name)
+
+        tokens = canonical_tokens(product_name)
+        # Название без слов и чисел сравнивается только целиком
+        key = ' '.join(tokens) if tokens else product_name
+        representative = self.representatives.get(key)
+        if representative is not None:
+            if excluded is not None and representative in excluded:
+                return self.separate(product_name, tokens)
+            self.record(product_name, representative, key, 1.0, 'canonical')
+        elif tokens and self.fuzzy:
+            representative, similarity = self.find_similar(key, tokens, excluded)
+            if representative is not None:
+                self.representatives[key] = representative
+                self.record(product_name, representative, key, similarity, 'fuzzy')
+
+        if representative is None:
+            representative = product_name
+            self.add_representative(key, product_name, tokens)
+
+        self.resolved[product_name] = representative
+        return representative
+
+    def separate(self, product_name, tokens=None):
+        """Название, которое таблица отличила от представителя с тем же ключом,
+        становится отдельным продуктом и на следующих страницах.
+
+        Оно регистрируется под собственным ключом - исходным названием, чтобы
+        поиск по ключу и нечеткий поиск находили его отдельно от представителя.
+        """
+        if tokens is None:
+            tokens = canonical_tokens(product_name)
+        self.resolved[product_name] = product_name
+        if product_name not in self.representatives:
+            self.add_representative(product_name, product_name, tokens)
+        return product_name
+
+    def add_representative(self, key, product_name, tokens):
+        self.representatives[key] = product_name
+        self.key_tokens[key] = (frozenset(tokens), number_tokens(tokens))
+        for token in tokens:
+            self.index.setdefault(token, []).append(key)
+
+    def find_similar(self, key, tokens, excluded=None):
+        """Наиболее похожий представитель среди кандидатов из индекса или (None, 0).
+
+        Кандидат должен состоять из тех же токенов, кроме, возможно, одного
+        слова с опечаткой. Поэтому он обязательно содержит один из двух самых
+        редких токенов, и достаточно просмотреть только их списки в индексе.
+        """
+        index = self.index
+        candidates = set()
+        for token in sorted(tokens, key=lambda token: len(index.get(token, ())))[:2]:
+            postings = index.get(token, ())
+            if len(postings) <= self.max_block_size:
+                candidates.update(postings)
+
+        if not candidates:
+            return None, 0
+
+        token_set = frozenset(tokens)
+        numbers = number_tokens(tokens)
+
+        scored = []
+        key_tokens = self.key_tokens
+        for candidate in candidates:
+            candidate_tokens, candidate_numbers = key_tokens[candidate]
+            # Числа (жирность, номер сорта) должны совпадать точно
+            if candidate_numbers != numbers or len(candidate_tokens) != len(token_set):
+                continue
+            if excluded is not None and self.representatives[candidate] in excluded:
+                continue
+            # Наборы слов совпадают, кроме одной пары слов, отличающихся опечаткой
+            missing = token_set - candidate_tokens
+            extra = candidate_tokens - token_set
+            if len(missing) != 1 or not is_typo(next(iter(missing)), next(iter(extra))):
+                continue
+            scored.append((len(candidate), candidate))
+        if not scored:
+            return None, 0
+        scored.sort()
+
+        matcher = SequenceMatcher(None, b=key, autojunk=False)
+        best_key, best_similarity = None, 0
+        for _length, candidate in scored[:MAX_CANDIDATES]:
+            matcher.set_seq1(candidate)
+            if matcher.real_quick_ratio() < self.threshold or matcher.quick_ratio() < self.threshold:
+                continue
+            similarity = matcher.ratio()
+            if similarity >= self.threshold and similarity > best_similarity:
+                best_key, best_similarity = candidate, similarity
+
+        if best_key is None:
+            return None, 0
+        return self.representatives[best_key], best_similarity
+
+    def record(self, product_name, representative, key, similarity, method):
+        if product_name != representative:
+            self.merges.append({
+                'name': product_name,
+                'merged_into': representative,
+                'canonical': key,
+                'similarity': round(similarity, 4),
+                'method': method
+            })
+
+    def resolve_rows(self, rows_data):
+        """Строки (название, значение) одной таблицы с названиями-представителями.
+
+        Разные названия таблицы не объединяются ни между собой, ни с
+        представителем, который сам есть в таблице или уже выбран для
+        другого ее названия.
+        """
+        resolve = self.resolve
+        # Названия таблицы и представители, уже выбранные для ее названий
+        excluded = {product_name for product_name, _value in rows_data}
+        chosen = {}
+        rows = []
+        for product_name, nutrient_value in rows_data:
+            representative = chosen.get(product_name)
+            if representative is None:
+                excluded.discard(product_name)
+                representative = chosen[product_name] = resolve(product_name, excluded)
+                excluded.add(product_name)
+                excluded.add(representative)
+            rows.append((representative, nutrient_value))
+        return rows
+
+    def write_audit(self, output_file):
+        """Запись всех объединений названий в JSON-файл"""
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(self.merges, f, ensure_ascii=False, indent=2)
+        return output_file
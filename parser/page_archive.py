@@ -0,0 +1,175 @@
+import os
+import json
+import mmap
+import time
+import zlib
+import struct
+import logging
+
+# Заголовок записи архива: сигнатура и длина сжатых данных записи
+RECORD_MAGIC = b'PGA1'
+RECORD_HEADER = struct.Struct('<4sI')
+
+# Уровень сжатия zlib: страницы пишутся один раз, а читаются при каждом воспроизведении
+COMPRESSION_LEVEL = 6
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+class PageArchive:
+    """Архив сырых HTTP-ответов для воспроизведения разбора без сети.
+
+    Архив - файл только для дозаписи: каждая запись состоит из заголовка
+    RECORD_HEADER и сжатых zlib данных (строка JSON с URL, статусом и
+    заголовками ответа, затем тело страницы). Рядом лежит индекс
+    (файл .idx, строка JSON на запись) со смещениями записей, по которому
+    страница читается без просмотра архива. Для одного URL действует
+    последняя запись. Индекс, отставший от архива после сбоя, дополняется
+    просмотром архива, недописанная запись в конце архива отбрасывается.
+    """
+
+    def __init__(self, path, mode='r'):
+        if mode not in ('r', 'a'):
+            raise ValueError(f"Неизвестный режим архива: {mode}")
+        self.path = path
+        self.mode = mode
+        self.entries = {}
+        self.file = None
+        self.mmap = None
+        self.view = None
+
+        if mode == 'a':
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.file = open(path, 'ab+')
+        else:
+            self.file = open(path, 'rb')
+        end = self._load_index()
+        self._recover(end)
+
+        if mode == 'r' and os.path.getsize(path):
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.mmap)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, url):
+        return url in self.entries
+
+    def _load_index(self):
+        """Чтение индекса; возвращает конец последней проиндексированной записи"""
+        end = 0
+        archive_size = os.path.getsize(self.path)
+        if not os.path.exists(index_path(self.path)):
+            return end
+        with open(index_path(self.path), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Недописанная строка индекса: оставшиеся записи найдет просмотр архива
+                    break
+                if entry['offset'] + entry['size'] > archive_size:
+                    break
+                self.entries[entry['url']] = entry
+                end = max(end, entry['offset'] + entry['size'])
+        return end
+
+    def _recover(self, end):
+        """Дополнение индекса записями архива после end и отбрасывание недописанного хвоста"""
+        archive_size = os.path.getsize(self.path)
+        recovered = []
+        with open(self.path, 'rb') as f:
+            f.seek(end)
+            while end + RECORD_HEADER.size <= archive_size:
+                magic, length = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                if magic != RECORD_MAGIC or end + RECORD_HEADER.size + length > archive_size:
+                    break
+                try:
+                    meta = self._decode_meta(zlib.decompress(f.read(length)))
+                except (zlib.error, ValueError):
+                    break
+                recovered.append(dict(meta, offset=end, size=RECORD_HEADER.size + length))
+                end += RECORD_HEADER.size + length
+
+        for entry in recovered:
+            self.entries[entry['url']] = entry
+        if recovered:
+            logging.warning(f"Индекс архива {self.path} дополнен записями: {len(recovered)}")
+        if self.mode == 'a':
+            if end < archive_size:
+                logging.warning(f"Архив {self.path}: отброшен недописанный хвост {archive_size - end} байт")
+                self.file.truncate(end)
+            # Индекс переписывается целиком, если он отличался от архива
+            if recovered or end < archive_size or not os.path.exists(index_path(self.path)):
+                self._write_index()
+
+    @staticmethod
+    def _decode_meta(data):
+        meta_line = data[:data.index(b'\n')]
+        return json.loads(meta_line)
+
+    def _index_line(self, entry):
+        return json.dumps({key: entry[key] for key in ('url', 'key', 'status_code', 'recorded_at', 'offset', 'size')},
+                          ensure_ascii=False) + '\n'
+
+    def _write_index(self):
+        tmp_path = index_path(self.path) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in sorted(self.entries.values(), key=lambda entry: entry['offset']):
+                f.write(self._index_line(entry))
+        os.replace(tmp_path, index_path(self.path))
+
+    def append(self, url, status_code, headers, text, key=None):
+        """Дозапись ответа в архив"""
+        if self.mode != 'a':
+            raise ValueError("Архив открыт только для чтения")
+        meta = {'url': url, 'key': key, 'status_code': status_code, 'headers': headers or {}, 'recorded_at': time.time()}
+        data = zlib.compress(
+            json.dumps(meta, ensure_ascii=False).encode('utf-8') + b'\n' + (text or '').encode('utf-8'),
+            COMPRESSION_LEVEL
+        )
+        self.file.seek(0, os.SEEK_END)
+        offset = self.file.tell()
+        self.file.write(RECORD_HEADER.pack(RECORD_MAGIC, len(data)) + data)
+        self.file.flush()
+
+        entry = dict(meta, offset=offset, size=RECORD_HEADER.size + len(data))
+        # Запись индекса после записи данных: при сбое между ними индекс восстановится по архиву
+        with open(index_path(self.path), 'a', encoding='utf-8') as f:
+            f.write(self._index_line(entry))
+        self.entries[url] = entry
+
+    def get(self, url):
+        """Ответ из архива: (статус, заголовки, тело) или None, если URL нет в архиве"""
+        entry = self.entries.get(url)
+        if entry is None:
+            return None
+        if self.view is None:
+            raise ValueError("Чтение ответов доступно для архива, открытого в режиме 'r'")
+        start = entry['offset'] + RECORD_HEADER.size
+        data = zlib.decompress(self.view[start:entry['offset'] + entry['size']])
+        split = data.index(b'\n')
+        meta = json.loads(data[:split])
+        return meta['status_code'], meta['headers'], data[split + 1:].decode('utf-8')
+
+    def close(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
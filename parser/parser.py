@@ -1,25 +1,31 @@
-import requests
-from bs4 import BeautifulSoup
 import json
 import os
 import re
 import time
 import logging
+import argparse
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("parser.log"),
-        logging.StreamHandler()
-    ]
-)
+from fetcher import fetch_all, FetchResult
+from http_cache import HttpCache, body_hash
+from page_archive import PageArchive
+from columnar_file import COLUMNAR_FORMATS, write_columnar
+from delta_state import ScrapeState, split_tables
+import table_extract
+from table_extract import EXTRACTION_BACKENDS, parse_page
+from category_matcher import CategoryMatcher
+from name_matcher import NameReconciler, DEFAULT_THRESHOLD
+from instrumentation import parser_metrics, configure_logging
+from sql_writer import SQL_FORMATS, write_categories, write_products_copy, write_products_insert, write_products_values
+
+# Модуль можно импортировать как библиотеку: при импорте не настраивается логирование, не создаются
+# файлы и директории, а requests, NumPy и BeautifulSoup загружаются только при первом использовании.
+# Файл лога и директория данных создаются при запуске из командной строки или при сохранении результатов
+
+# Файл лога запуска из командной строки
+LOG_FILE = "parser.log"
 
 # Директория для сохранения данных
 output_dir = "parsed_data"
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
 
 # Настройки заголовков для запроса
 headers = {
@@ -35,6 +41,61 @@ urls = {
     'water': 'https://frs24.ru/st/soderzhanie-vody-v-produktah-tablica/'
 }
 
+# Параметры параллельной загрузки страниц по умолчанию
+DEFAULT_FETCH_CONFIG = {
+    'workers': 8,
+    'rate_limit': 2.0,  # запросов в секунду на один хост
+    'burst': 5,  # все страницы по умолчанию запрашиваются сразу, дальше не чаще rate_limit
+    'timeout': 30,
+    'session': None  # HTTP-сессия (fetcher.create_session), общая для нескольких запусков в одном процессе
+}
+
+# Бэкенд извлечения строк таблиц: 'stream' (потоковый html.parser) или 'bs4' (BeautifulSoup)
+DEFAULT_EXTRACTION_BACKEND = 'stream'
+
+# Количество процессов для разбора страниц (1 - разбор в основном процессе).
+# Потоковый бэкенд разбирает страницы источника за миллисекунды, а запуск пула процессов
+# занимает дольше, поэтому пул включается только явно (--parse-workers) для больших страниц
+DEFAULT_PARSE_WORKERS = 1
+
+# Формат SQL-скрипта и размер пачки для многострочных INSERT
+DEFAULT_SQL_FORMAT = 'copy'
+DEFAULT_SQL_BATCH_SIZE = 1000
+
+# Параметры HTTP-кэша по умолчанию
+DEFAULT_CACHE_CONFIG = {
+    'enabled': True,
+    'directory': os.path.join(output_dir, 'http_cache'),
+    'max_size_mb': 100,
+    'max_age_days': 30
+}
+
+# Архив сырых ответов: record - файл, в который дописываются загруженные страницы,
+# replay - файл, из которого страницы читаются вместо загрузки из сети
+DEFAULT_ARCHIVE_CONFIG = {
+    'record': None,
+    'replay': None
+}
+
+# Состояние прошлого запуска (хэши страниц и таблиц, отпечатки продуктов) для разбора
+# только изменившихся таблиц и выгрузки файла изменений каталога
+DEFAULT_STATE_CONFIG = {
+    'enabled': True,
+    'file': os.path.join(output_dir, 'scrape_state.json'),
+    'delta_file': os.path.join(output_dir, 'nutrition_delta.json')
+}
+
+# Параметры сопоставления вариантов названий продуктов на разных страницах по умолчанию
+DEFAULT_MATCHING_CONFIG = {
+    'enabled': True,
+    'fuzzy': False,  # объединять названия, отличающиеся опечаткой в одном слове
+    'threshold': DEFAULT_THRESHOLD,  # минимальное сходство канонических названий для нечеткого объединения
+    'audit_file': os.path.join(output_dir, 'name_merges.json')
+}
+
+# Питательные вещества в порядке хранения значений
+nutrient_types = list(urls)
+
 # Общий словарь для хранения данных о продуктах
 all_products = {}
 
@@ -57,142 +118,380 @@ category_keywords = {
     'beverages': ['напиток', 'сок', 'компот', 'чай', 'кофе', 'какао', 'вода', 'квас', 'морс', 'лимонад']
 }
 
-# Функция для определения категории продукта по его названию
+# Названия категорий для базы данных
+category_names = {
+    'meat': 'Мясо',
+    'poultry': 'Птица',
+    'fish': 'Рыба и морепродукты',
+    'dairy': 'Молочные продукты',
+    'eggs': 'Яйца',
+    'grains': 'Злаки и крупы',
+    'bread': 'Хлеб и выпечка',
+    'pasta': 'Макароны и паста',
+    'vegetables': 'Овощи',
+    'fruits': 'Фрукты',
+    'berries': 'Ягоды',
+    'nuts': 'Орехи и семена',
+    'legumes': 'Бобовые',
+    'sweets': 'Сладости',
+    'beverages': 'Напитки',
+    'other': 'Другое'
+}
+
+# Автомат для определения категории, строится один раз по category_keywords
+category_matcher = CategoryMatcher(category_keywords)
+
+# Функция для определения категории продукта по его названию.
+# Категории проверяются в порядке category_keywords, побеждает первая найденная
 def determine_category(product_name):
-    product_name_lower = product_name.lower()
-    
-    for category, keywords in category_keywords.items():
-        for keyword in keywords:
-            if keyword in product_name_lower:
-                return category
-    
-    return 'other'  # Если категория не определена
+    return category_matcher.classify(product_name)
 
-# Функция для извлечения данных из таблицы
-def extract_table_data(url, nutrient_type):
+# Функция для определения категорий списка продуктов
+def classify_many(product_names):
+    return category_matcher.classify_many(product_names)
+
+# Функция для добавления извлеченных строк в общий словарь продуктов
+def merge_rows(rows_data, nutrient_type):
+    for product_name, nutrient_value in rows_data:
+        # Добавляем или обновляем информацию о продукте
+        if product_name not in all_products:
+            # Определяем категорию продукта
+            category = determine_category(product_name)
+            
+            all_products[product_name] = {
+                'name': product_name,
+                'category': category,
+                'proteins': None,
+                'fats': None,
+                'carbs': None,
+                'calories': None,
+                'water': None
+            }
+        
+        # Обновляем значение нужного питательного вещества
+        try:
+            all_products[product_name][nutrient_type] = float(nutrient_value)
+        except ValueError:
+            logging.warning(f"Не удалось преобразовать значение '{nutrient_value}' в число для продукта '{product_name}'")
+
+# Функция для получения результата разбора страницы (parse_page) с записью в лог и метрики.
+# parse - функция без аргументов, возвращающая результат parse_page.
+# Возвращает извлеченные строки или None при ошибке
+def collect_parse_result(url, nutrient_type, parse):
     logging.info(f"Извлечение данных о {nutrient_type} из {url}")
     
     try:
-        response = requests.get(url, headers=headers)
+        rows_data, tables_count, rejected, elapsed = parse()
+    except Exception as e:
+        logging.error(f"Ошибка при обработке {url}: {e}")
+        parser_metrics.inc('pages_failed', nutrient=nutrient_type)
+        return None
+    
+    if not tables_count:
+        logging.warning("Таблицы не найдены на странице")
+    else:
+        logging.info(f"Обработано таблиц: {tables_count}, извлечено строк: {len(rows_data)}")
+    
+    parser_metrics.observe('stage_seconds', elapsed, stage='parse', nutrient=nutrient_type)
+    parser_metrics.inc('rows_parsed', len(rows_data), nutrient=nutrient_type)
+    for rule, count in (rejected or {}).items():
+        parser_metrics.inc('rows_rejected', count, nutrient=nutrient_type, rule=rule)
+    return rows_data
+
+# Функция для извлечения строк из страницы без добавления в общий словарь.
+# Возвращает извлеченные строки или None при ошибке
+def extract_rows(url, nutrient_type, html, backend=DEFAULT_EXTRACTION_BACKEND):
+    # Причины пропуска строк считаются только при включенном сборе метрик
+    return collect_parse_result(url, nutrient_type, lambda: parse_page(html, backend, parser_metrics.enabled))
+
+# Генератор строк разобранных страниц в порядке входного списка.
+# pages_to_parse - список (тип питательного вещества, url, html). При workers > 1
+# страницы разбираются в пуле процессов, результат не зависит от порядка завершения разбора
+def parse_pages(pages_to_parse, backend=DEFAULT_EXTRACTION_BACKEND, workers=DEFAULT_PARSE_WORKERS):
+    if workers <= 1 or len(pages_to_parse) <= 1:
+        for nutrient_type, url, html in pages_to_parse:
+            yield extract_rows(url, nutrient_type, html, backend)
+        return
+    
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=min(workers, len(pages_to_parse))) as executor:
+        futures = [
+            (nutrient_type, url, executor.submit(parse_page, html, backend, parser_metrics.enabled))
+            for nutrient_type, url, html in pages_to_parse
+        ]
+        for nutrient_type, url, future in futures:
+            yield collect_parse_result(url, nutrient_type, future.result)
+
+# Функция для извлечения данных из таблицы
+# Если html не передан, страница загружается отдельным запросом.
+# Возвращает извлеченные строки или None при ошибке
+def extract_table_data(url, nutrient_type, html=None, backend=DEFAULT_EXTRACTION_BACKEND):
+    if html is None:
+        import requests
+        try:
+            response = requests.get(url, headers=headers)
+        except Exception as e:
+            logging.error(f"Ошибка при обработке {url}: {e}")
+            return None
         if response.status_code != 200:
             logging.error(f"Ошибка при загрузке страницы: {response.status_code}")
-            return
+            return None
+        html = response.text
+    
+    rows_data = extract_rows(url, nutrient_type, html, backend)
+    if rows_data is not None:
+        merge_rows(rows_data, nutrient_type)
+    return rows_data
+
+# Функция для чтения страниц из архива вместо загрузки: словарь {ключ: FetchResult} в порядке urls.
+# Страницы, которых нет в архиве, возвращаются с ошибкой
+def replay_pages(archive_file):
+    pages = {}
+    with PageArchive(archive_file) as archive:
+        logging.info(f"Воспроизведение страниц из архива {archive_file}: записей {len(archive)}")
+        for nutrient_type, url in urls.items():
+            started = time.perf_counter()
+            response = archive.get(url)
+            elapsed = time.perf_counter() - started
+            if response is None:
+                error = LookupError(f"страницы нет в архиве {archive_file}")
+                logging.error(f"Ошибка при загрузке {url}: {error}")
+                pages[nutrient_type] = FetchResult(nutrient_type, url, None, None, None, elapsed, error)
+                continue
+            status_code, response_headers, text = response
+            pages[nutrient_type] = FetchResult(nutrient_type, url, status_code, text, response_headers, elapsed, None)
+    return pages
+
+# Функция для записи загруженных страниц в архив до разбора, чтобы при ошибке
+# разбора страницы можно было разобрать повторно без сети (--replay)
+def record_pages(pages, archive_file):
+    with PageArchive(archive_file, 'a') as archive:
+        for page in pages.values():
+            if page.error is None and page.text is not None:
+                archive.append(page.url, page.status_code, page.headers, page.text, page.key)
+    logging.info(f"Загруженные страницы записаны в архив {archive_file}")
+
+# Строки загруженной страницы из HTTP-кэша или None, если страница изменилась или ее нет в кэше
+def cached_rows(cache, page):
+    rows_data = cache.get_rows(page.url, page.status_code, page.text)
+    parser_metrics.inc('cache_lookups', result='hit' if rows_data is not None else 'miss')
+    return rows_data
+
+# Генератор строк всех страниц: (тип питательного вещества, строки страницы) в порядке urls.
+# Страницы разбираются в parse_workers процессах, порядок выдачи от этого не зависит
+def iter_page_rows(fetch_config=None, cache_config=None, backend=DEFAULT_EXTRACTION_BACKEND, parse_workers=DEFAULT_PARSE_WORKERS,
+                   archive_config=None, state=None):
+    config = dict(DEFAULT_FETCH_CONFIG, **(fetch_config or {}))
+    cache_config = dict(DEFAULT_CACHE_CONFIG, **(cache_config or {}))
+    archive_config = dict(DEFAULT_ARCHIVE_CONFIG, **(archive_config or {}))
+    
+    # При воспроизведении из архива страницы всегда разбираются заново: кэш строк не используется
+    cache = None
+    if cache_config['enabled'] and not archive_config['replay']:
+        cache = HttpCache(
+            cache_config['directory'],
+            max_size=int(cache_config['max_size_mb'] * 1024 * 1024),
+            max_age=cache_config['max_age_days'] * 24 * 3600,
+            rules_version=parse_rules_version(backend)
+        )
+    
+    # Загружаем страницы параллельно, ограничивая частоту запросов к каждому хосту,
+    # или читаем их из архива без обращения к сети
+    with parser_metrics.timer('stage_seconds', stage='fetch'):
+        if archive_config['replay']:
+            pages = replay_pages(archive_config['replay'])
+        else:
+            pages = fetch_all(
+                urls,
+                headers=headers,
+                max_workers=config['workers'],
+                rate=config['rate_limit'],
+                burst=config['burst'],
+                timeout=config['timeout'],
+                session=config['session'],
+                cache=cache
+            )
+    
+    if archive_config['record'] and not archive_config['replay']:
+        record_pages(pages, archive_config['record'])
+    
+    for page in pages.values():
+        parser_metrics.observe('fetch_latency_seconds', page.elapsed, url=page.url)
+        parser_metrics.inc('fetch_requests', status=str(page.status_code) if page.error is None else 'error')
+    
+    # Порядок выдачи - исходный порядок urls, чтобы результат не зависел от порядка загрузки и разбора.
+    # Для каждой страницы запоминаем строки из состояния или кэша или None, если страницу нужно разобрать
+    page_order = []
+    pages_to_parse = []
+    pending_pages = {}
+    for nutrient_type, url in urls.items():
+        page = pages.pop(nutrient_type)
+        if page.error is not None:
+            continue
+        if page.status_code not in (200, 304) or page.text is None:
+            logging.error(f"Ошибка при загрузке страницы: {page.status_code}")
+            continue
         
-        soup = BeautifulSoup(response.text, 'html.parser')
+        # Если страница не изменилась с прошлого запуска, берем ее строки из состояния
+        if state is not None:
+            rows_data = state.page_rows(url, page.text)
+            if rows_data is not None:
+                logging.info(f"Страница {url} не изменилась с прошлого запуска, разбор пропущен")
+                parser_metrics.inc('pages_unchanged', nutrient=nutrient_type)
+                # Кэш проверяется и здесь, чтобы статистика попаданий учитывала все страницы;
+                # при промахе строки из состояния сохраняются в кэш
+                if cache is not None and cached_rows(cache, page) is None:
+                    cache.store(page.url, page.text, page.headers, rows_data)
+                page_order.append((nutrient_type, rows_data))
+                continue
         
-        # Поиск всех таблиц на странице
-        tables = soup.find_all('table')
+        # Если страница не изменилась, берем строки из кэша без разбора HTML
+        if cache is not None:
+            rows_data = cached_rows(cache, page)
+            if rows_data is not None:
+                logging.info(f"Страница {url} не изменилась, используем данные из кэша")
+                if state is not None:
+                    state.store_page(url, page.text, [(body_hash(page.text), rows_data)])
+                page_order.append((nutrient_type, rows_data))
+                continue
         
-        if not tables:
-            logging.warning("Таблицы не найдены на странице")
-            return
+        # Страница делится на таблицы: неизменившиеся таблицы берутся из состояния,
+        # разбираются только новые и изменившиеся. Части - список (хэш таблицы, строки или None, HTML)
+        if state is not None:
+            fragments = split_tables(page.text)
+            if fragments is None:
+                fragments = [page.text]
+            parts = [(table_hash, state.table_rows(table_hash), fragment)
+                     for table_hash, fragment in ((body_hash(fragment), fragment) for fragment in fragments)]
+            skipped = sum(1 for _table_hash, rows_data, _fragment in parts if rows_data is not None)
+            if skipped:
+                logging.info(f"Страница {url}: без изменений {skipped} из {len(parts)} таблиц")
+                parser_metrics.inc('tables_skipped', skipped, nutrient=nutrient_type)
+        else:
+            parts = [(None, None, page.text)]
         
-        # Перебираем таблицы и извлекаем данные
-        for table_idx, table in enumerate(tables):
-            logging.info(f"Обработка таблицы {table_idx + 1} из {len(tables)}")
-            
-            # Получить заголовки таблицы (если есть)
-            headers_row = table.find('thead')
-            if headers_row:
-                headers = [header.text.strip() for header in headers_row.find_all('th')]
-            else:
-                # Если тега thead нет, ищем первую строку
-                first_row = table.find('tr')
-                if first_row:
-                    headers = [header.text.strip() for header in first_row.find_all(['th', 'td'])]
-                else:
-                    logging.warning("Не удалось найти заголовки таблицы")
-                    continue
-            
-            # Поиск строк с данными
-            rows = table.find_all('tr')
-            
-            # Пропускаем первую строку, если она содержит заголовки
-            start_idx = 1 if headers_row or (first_row and first_row.find('th')) else 0
-            
-            for row in rows[start_idx:]:
-                cells = row.find_all(['td', 'th'])
-                
-                # Если меньше 2 ячеек, пропускаем строку
-                if len(cells) < 2:
-                    continue
-                
-                # Первая ячейка обычно содержит название продукта
-                product_name = cells[0].text.strip()
-                
-                # Очистка названия продукта от лишних символов
-                product_name = re.sub(r'\s+', ' ', product_name)
-                
-                # Пропускаем строки с заголовками или разделителями
-                if len(product_name) <= 2 or product_name.isupper() or product_name.startswith('—'):
-                    continue
-                
-                # Пытаемся извлечь значение питательного вещества
-                nutrient_value = None
-                
-                # В зависимости от типа таблицы значение может быть в разных столбцах
-                if len(cells) >= 2:
-                    # Обычно значение находится во втором столбце
-                    value_text = cells[1].text.strip()
-                    
-                    # Извлекаем числовое значение
-                    value_match = re.search(r'(\d+[.,]?\d*)', value_text)
-                    if value_match:
-                        nutrient_value = value_match.group(1).replace(',', '.')
-                
-                # Если не удалось извлечь значение, пропускаем
-                if not nutrient_value:
-                    continue
-                
-                # Добавляем или обновляем информацию о продукте
-                if product_name not in all_products:
-                    # Определяем категорию продукта
-                    category = determine_category(product_name)
-                    
-                    all_products[product_name] = {
-                        'name': product_name,
-                        'category': category,
-                        'proteins': None,
-                        'fats': None,
-                        'carbs': None,
-                        'calories': None,
-                        'water': None
-                    }
-                
-                # Обновляем значение нужного питательного вещества
-                try:
-                    all_products[product_name][nutrient_type] = float(nutrient_value)
-                except ValueError:
-                    logging.warning(f"Не удалось преобразовать значение '{nutrient_value}' в число для продукта '{product_name}'")
+        page_order.append((nutrient_type, None))
+        for _table_hash, rows_data, fragment in parts:
+            if rows_data is None:
+                pages_to_parse.append((nutrient_type, url, fragment))
+        pending_pages[nutrient_type] = (page, parts)
     
-    except Exception as e:
-        logging.error(f"Ошибка при обработке {url}: {e}")
+    parsed_rows = parse_pages(pages_to_parse, backend, parse_workers)
+    for nutrient_type, rows_data in page_order:
+        if rows_data is None:
+            page, parts = pending_pages.pop(nutrient_type)
+            # Результаты разбора забираются для всех частей, даже если одна из них не разобралась,
+            # чтобы следующие страницы получили свои результаты
+            tables = [(table_hash, rows if rows is not None else next(parsed_rows)) for table_hash, rows, _fragment in parts]
+            if any(rows is None for _table_hash, rows in tables):
+                continue
+            rows_data = [row for _table_hash, rows in tables for row in rows]
+            if cache is not None:
+                cache.store(page.url, page.text, page.headers, rows_data)
+            if state is not None:
+                state.store_page(page.url, page.text, tables)
+        yield nutrient_type, rows_data
+    
+    if cache is not None:
+        cache.evict()
+        cache.log_stats()
 
-# Обработка всех URL и извлечение данных
-def parse_all_data():
-    for nutrient_type, url in urls.items():
-        extract_table_data(url, nutrient_type)
-        # Небольшая пауза между запросами
-        time.sleep(1.5)
+# Функция для объединения строк всех страниц в колоночную таблицу продуктов.
+# Варианты названия одного продукта сводятся к первому встреченному названию,
+# последнее значение для продукта и вещества побеждает, как и в merge_rows
+def merge_stage(page_rows, matching_config=None):
+    config = dict(DEFAULT_MATCHING_CONFIG, **(matching_config or {}))
+    reconciler = NameReconciler(config['threshold'], fuzzy=config['fuzzy']) if config['enabled'] else None
+    
+    from product_table import ProductTable
+    table = ProductTable(nutrient_types, category_keywords, category_matcher.default)
+    for nutrient_type, rows_data in page_rows:
+        if reconciler is not None:
+            with parser_metrics.timer('stage_seconds', stage='reconcile', nutrient=nutrient_type):
+                rows_data = reconciler.resolve_rows(rows_data)
+        
+        # Время объединения включает определение категорий новых продуктов
+        with parser_metrics.timer('stage_seconds', stage='merge', nutrient=nutrient_type):
+            invalid = table.merge_rows(rows_data, nutrient_type, determine_category)
+        for product_name, nutrient_value in invalid:
+            logging.warning(f"Не удалось преобразовать значение '{nutrient_value}' в число для продукта '{product_name}'")
+        if invalid:
+            parser_metrics.inc('rows_rejected', len(invalid), nutrient=nutrient_type, rule='invalid_number')
+    
+    if reconciler is not None:
+        save_name_merges(reconciler, config['audit_file'])
+    return table
+
+# Сохранение журнала объединенных названий продуктов
+def save_name_merges(reconciler, output_file):
+    try:
+        reconciler.write_audit(output_file)
+    except OSError as e:
+        logging.error(f"Не удалось сохранить журнал объединения названий {output_file}: {e}")
+        return None
+    
+    for merge in reconciler.merges:
+        parser_metrics.inc('names_merged', method=merge['method'])
+    logging.info(f"Объединено вариантов названий: {len(reconciler.merges)}, журнал сохранен в {output_file}")
+    return output_file
+
+# Функция для отбора продуктов хотя бы с 2 непустыми значениями в порядке названий.
+# Возвращает номера строк таблицы
+def select_products(table):
+    with parser_metrics.timer('stage_seconds', stage='filter'):
+        rows = table.sorted_rows(table.complete_mask(2))
+    
+    parser_metrics.inc('products_rejected', len(table) - len(rows), rule='incomplete')
+    parser_metrics.set('products', len(rows))
+    if parser_metrics.enabled:
+        for category, count in table.category_counts(rows).items():
+            parser_metrics.set('products_by_category', count, category=category)
+    return rows
 
-    # Фильтруем продукты с недостаточной информацией
-    filtered_products = {}
-    for name, product in all_products.items():
-        non_null_values = sum(1 for value in [product["proteins"], product["fats"], product["carbs"], product["calories"], product["water"]] if value is not None)
-        if non_null_values >= 2:  # Продукт должен иметь хотя бы 2 непустых значения
-            filtered_products[name] = product
+# Обработка всех URL и извлечение данных
+def parse_all_data(fetch_config=None, cache_config=None, backend=DEFAULT_EXTRACTION_BACKEND, parse_workers=DEFAULT_PARSE_WORKERS,
+                   matching_config=None, archive_config=None, state=None):
+    table = merge_stage(iter_page_rows(fetch_config, cache_config, backend, parse_workers, archive_config, state), matching_config)
     
-    # Преобразуем словарь в список
-    products_list = list(filtered_products.values())
+    # Фильтрация и сортировка выполняются над массивами таблицы, словари создаются только для результата
+    return table.to_list(select_products(table))
+
+# Потоковый парсинг: генератор отфильтрованных продуктов в порядке названий.
+# Словари продуктов создаются по одному при выгрузке из таблицы
+def stream_products(fetch_config=None, cache_config=None, backend=DEFAULT_EXTRACTION_BACKEND, parse_workers=DEFAULT_PARSE_WORKERS,
+                    matching_config=None, archive_config=None, state=None):
+    table = merge_stage(iter_page_rows(fetch_config, cache_config, backend, parse_workers, archive_config, state), matching_config)
+    return table.iter_products(select_products(table))
+
+# Путь к файлу результата; директория данных создается при первой записи
+def output_path(file_name):
+    os.makedirs(output_dir, exist_ok=True)
+    return os.path.join(output_dir, file_name)
+
+# Сохранение данных в NDJSON: по одному продукту в строке, запись по мере поступления
+def save_data_to_ndjson(products):
+    output_file = output_path('nutrition_data.ndjson')
     
-    # Сортируем продукты по названию
-    products_list.sort(key=lambda x: x['name'])
+    count = 0
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for product in products:
+            f.write(json.dumps(product, ensure_ascii=False))
+            f.write('\n')
+            count += 1
     
-    return products_list
+    logging.info(f"Данные успешно сохранены в {output_file}. Всего продуктов: {count}")
+    return output_file
+
+# Чтение продуктов из NDJSON-файла по одному
+def iter_ndjson(input_file):
+    with open(input_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
 
 # Сохранение данных в JSON
 def save_data_to_json(products_list):
-    output_file = os.path.join(output_dir, 'nutrition_data.json')
+    output_file = output_path('nutrition_data.json')
     
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(products_list, f, ensure_ascii=False, indent=2)
@@ -200,75 +499,218 @@ def save_data_to_json(products_list):
     logging.info(f"Данные успешно сохранены в {output_file}. Всего продуктов: {len(products_list)}")
     return output_file
 
-# Генерация SQL-скрипта для заполнения базы данных
-def generate_sql_script(products_list):
-    output_file = os.path.join(output_dir, 'insert_data.sql')
+# Сохранение бинарного снимка каталога для быстрого чтения другими сервисами (catalog_snapshot.CatalogSnapshot)
+def save_data_to_snapshot(products):
+    from catalog_snapshot import write_snapshot
+    output_file = output_path('nutrition_data.snapshot')
     
-    # Получаем уникальные категории
-    categories = set(product['category'] for product in products_list)
+    count = write_snapshot(products, output_file)
+    
+    logging.info(f"Снимок каталога сохранен в {output_file}. Всего продуктов: {count}")
+    return output_file
+
+# Сохранение продуктов в столбцовом формате Arrow IPC или Parquet (нужен pyarrow)
+def save_data_to_columnar(products, fmt):
+    output_file = output_path('nutrition_data' + COLUMNAR_FORMATS[fmt])
+    
+    count = write_columnar(products, output_file, fmt)
+    
+    logging.info(f"Данные успешно сохранены в {output_file}. Всего продуктов: {count}")
+    return output_file
+
+# Версия правил разбора для состояния парсера: при изменении кода извлечения или бэкенда
+# сохраненные строки таблиц становятся недействительными
+def parse_rules_version(backend=DEFAULT_EXTRACTION_BACKEND):
+    with open(table_extract.__file__, 'r', encoding='utf-8') as f:
+        return f"{backend}:{body_hash(f.read())}"
+
+# Сохранение файла изменений каталога относительно прошлого запуска:
+# добавленные, измененные и удаленные продукты для загрузки через db_init.py --delta
+def save_delta(state, products, output_file):
+    delta = state.diff(products)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(delta, f, ensure_ascii=False, indent=2)
+    
+    for change in ('added', 'changed', 'removed'):
+        parser_metrics.set('products_delta', len(delta[change]), change=change)
+    logging.info(
+        f"Изменения каталога сохранены в {output_file}: добавлено {len(delta['added'])}, "
+        f"изменено {len(delta['changed'])}, удалено {len(delta['removed'])}"
+    )
+    return output_file
+
+# Запись SQL-скрипта по набору категорий и итерируемым продуктам.
+# Форматы: 'copy' - блок COPY FROM stdin, 'values' - многострочные INSERT пачками по batch_size,
+# 'insert' - отдельный INSERT на каждый продукт
+def write_sql_script(categories, products, sql_format=DEFAULT_SQL_FORMAT, batch_size=DEFAULT_SQL_BATCH_SIZE):
+    output_file = output_path('insert_data.sql')
     
     with open(output_file, 'w', encoding='utf-8') as f:
         # Запись комментария
         f.write("-- Скрипт для заполнения базы данных данными о пищевой ценности продуктов\n\n")
         
         # Запись категорий
-        f.write("-- Вставка категорий продуктов\n")
-        
-        for category in sorted(categories):
-            category_name = {
-                'meat': 'Мясо',
-                'poultry': 'Птица',
-                'fish': 'Рыба и морепродукты',
-                'dairy': 'Молочные продукты',
-                'eggs': 'Яйца',
-                'grains': 'Злаки и крупы',
-                'bread': 'Хлеб и выпечка',
-                'pasta': 'Макароны и паста',
-                'vegetables': 'Овощи',
-                'fruits': 'Фрукты',
-                'berries': 'Ягоды',
-                'nuts': 'Орехи и семена',
-                'legumes': 'Бобовые',
-                'sweets': 'Сладости',
-                'beverages': 'Напитки',
-                'other': 'Другое'
-            }.get(category, 'Другое')
-            
-            f.write(f"INSERT INTO product_categories (name, slug, description) VALUES ('{category_name}', '{category}', '{category_name}');\n")
+        write_categories(f, categories, category_names)
         
         f.write("\n-- Вставка продуктов\n")
         
         # Запись продуктов
-        for product in products_list:
-            proteins = product['proteins'] if product['proteins'] is not None else 'NULL'
-            fats = product['fats'] if product['fats'] is not None else 'NULL'
-            carbs = product['carbs'] if product['carbs'] is not None else 'NULL'
-            calories = product['calories'] if product['calories'] is not None else 'NULL'
-            water = product['water'] if product['water'] is not None else 'NULL'
-            
-            # Экранирование одинарных кавычек в названии продукта
-            name = product['name'].replace("'", "''")
-            
-            f.write(f"INSERT INTO products (name, category_id, proteins, fats, carbs, calories, water, serving_size) \n")
-            f.write(f"VALUES ('{name}', (SELECT id FROM product_categories WHERE slug = '{product['category']}'), {proteins}, {fats}, {carbs}, {calories}, {water}, 100);\n\n")
+        if categories:
+            if sql_format == 'copy':
+                write_products_copy(f, products)
+            elif sql_format == 'values':
+                write_products_values(f, products, batch_size)
+            else:
+                write_products_insert(f, products)
     
-    logging.info(f"SQL-скрипт успешно создан: {output_file}")
+    logging.info(f"SQL-скрипт успешно создан: {output_file} (формат {sql_format})")
     return output_file
 
-# Основная функция
-def main():
+# Генерация SQL-скрипта для заполнения базы данных
+def generate_sql_script(products_list, sql_format=DEFAULT_SQL_FORMAT, batch_size=DEFAULT_SQL_BATCH_SIZE):
+    # Получаем уникальные категории
+    categories = set(product['category'] for product in products_list)
+    
+    return write_sql_script(categories, products_list, sql_format, batch_size)
+
+# Генерация SQL-скрипта из NDJSON-файла в два прохода: категории, затем продукты
+def generate_sql_script_from_ndjson(input_file, sql_format=DEFAULT_SQL_FORMAT, batch_size=DEFAULT_SQL_BATCH_SIZE):
+    categories = set(product['category'] for product in iter_ndjson(input_file))
+    
+    return write_sql_script(categories, iter_ndjson(input_file), sql_format, batch_size)
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Парсинг данных о пищевой ценности продуктов')
+    parser.add_argument('--workers', type=int, default=DEFAULT_FETCH_CONFIG['workers'], help='Количество параллельных загрузок')
+    parser.add_argument('--rate-limit', type=float, default=DEFAULT_FETCH_CONFIG['rate_limit'], help='Максимум запросов в секунду к одному хосту (0 - без ограничения)')
+    parser.add_argument('--burst', type=int, default=DEFAULT_FETCH_CONFIG['burst'], help='Допустимое количество запросов подряд без ожидания')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_FETCH_CONFIG['timeout'], help='Таймаут запроса в секундах')
+    parser.add_argument('--backend', choices=sorted(EXTRACTION_BACKENDS), default=DEFAULT_EXTRACTION_BACKEND, help='Бэкенд извлечения строк таблиц')
+    parser.add_argument('--parse-workers', type=int, default=DEFAULT_PARSE_WORKERS, help='Количество процессов для разбора страниц (1 - без пула процессов)')
+    parser.add_argument('--sql-format', choices=SQL_FORMATS, default=DEFAULT_SQL_FORMAT, help='Формат вставки продуктов в SQL-скрипте')
+    parser.add_argument('--sql-batch-size', type=int, default=DEFAULT_SQL_BATCH_SIZE, help='Количество продуктов в одном INSERT для формата values')
+    parser.add_argument('--ndjson', action='store_true', help='Потоковый режим: запись продуктов в nutrition_data.ndjson по мере обработки')
+    parser.add_argument('--snapshot', action='store_true', help='Дополнительно записать бинарный снимок каталога nutrition_data.snapshot')
+    parser.add_argument('--columnar', choices=sorted(COLUMNAR_FORMATS), default=None, help='Дополнительно записать продукты в столбцовом формате (nutrition_data.arrow или .parquet)')
+    parser.add_argument('--no-name-matching', action='store_true', help='Объединять продукты только по точному совпадению названия')
+    parser.add_argument('--fuzzy-names', action='store_true', help='Объединять также названия, отличающиеся опечаткой в одном слове')
+    parser.add_argument('--name-threshold', type=float, default=DEFAULT_MATCHING_CONFIG['threshold'], help='Минимальное сходство названий для нечеткого объединения (0..1)')
+    parser.add_argument('--name-audit-file', default=DEFAULT_MATCHING_CONFIG['audit_file'], help='Файл журнала объединенных названий')
+    parser.add_argument('--no-cache', action='store_true', help='Не использовать HTTP-кэш')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_CONFIG['directory'], help='Директория HTTP-кэша')
+    parser.add_argument('--cache-max-size', type=float, default=DEFAULT_CACHE_CONFIG['max_size_mb'], help='Максимальный размер HTTP-кэша в МБ')
+    parser.add_argument('--cache-max-age', type=float, default=DEFAULT_CACHE_CONFIG['max_age_days'], help='Максимальный возраст записей HTTP-кэша в днях')
+    parser.add_argument('--no-state', action='store_true', help='Не использовать состояние прошлого запуска: разобрать все таблицы и не создавать файл изменений')
+    parser.add_argument('--state-file', default=DEFAULT_STATE_CONFIG['file'], help='Файл состояния прошлого запуска (хэши страниц и таблиц, отпечатки продуктов)')
+    parser.add_argument('--delta-file', default=DEFAULT_STATE_CONFIG['delta_file'], help='Файл изменений каталога относительно прошлого запуска')
+    parser.add_argument('--archive', default=DEFAULT_ARCHIVE_CONFIG['record'], help='Дописывать загруженные страницы в архив сырых ответов')
+    parser.add_argument('--replay', default=DEFAULT_ARCHIVE_CONFIG['replay'], help='Разобрать страницы из архива сырых ответов без обращения к сети')
+    parser.add_argument('--metrics-file', default=None, help='Записать отчет о запуске с метриками этапов в JSON-файл')
+    parser.add_argument('--prometheus-file', default=None, help='Записать метрики запуска в текстовом формате Prometheus')
+    
+    args = parser.parse_args(argv)
+    if args.archive and args.replay:
+        parser.error('--archive и --replay нельзя использовать вместе')
+    if args.replay and not os.path.exists(args.replay):
+        parser.error(f"Архив {args.replay} не найден")
+    return args
+
+# Парсинг, сохранение JSON и генерация SQL-скрипта по аргументам командной строки.
+# Для запуска из другого процесса аргументы получаются через parse_arguments([...]),
+# session - HTTP-сессия, которая переиспользуется между запусками.
+# Возвращает пути к файлу данных и SQL-скрипту
+def run_parser(args, session=None):
     logging.info("Начинаем парсинг данных о пищевой ценности продуктов")
+    os.makedirs(output_dir, exist_ok=True)
     
-    # Парсинг данных
-    products_list = parse_all_data()
+    fetch_config = {
+        'workers': args.workers,
+        'rate_limit': args.rate_limit,
+        'burst': args.burst,
+        'timeout': args.timeout,
+        'session': session
+    }
+    cache_config = {
+        'enabled': not args.no_cache,
+        'directory': args.cache_dir,
+        'max_size_mb': args.cache_max_size,
+        'max_age_days': args.cache_max_age
+    }
+    matching_config = {
+        'enabled': not args.no_name_matching,
+        'fuzzy': args.fuzzy_names,
+        'threshold': args.name_threshold,
+        'audit_file': args.name_audit_file
+    }
+    archive_config = {
+        'record': args.archive,
+        'replay': args.replay
+    }
     
-    # Сохранение данных в JSON
-    json_file = save_data_to_json(products_list)
+    # Воспроизведение из архива разбирает все страницы заново и не меняет состояние
+    state = None
+    if not args.no_state and not args.replay:
+        state = ScrapeState(args.state_file, parse_rules_version(args.backend))
     
-    # Генерация SQL-скрипта
-    sql_file = generate_sql_script(products_list)
+    if args.ndjson:
+        # Потоковый режим: продукты записываются в NDJSON по мере прохождения этапов
+        products = stream_products(fetch_config, cache_config, args.backend, args.parse_workers, matching_config, archive_config, state)
+        with parser_metrics.timer('stage_seconds', stage='save_json'):
+            json_file = save_data_to_ndjson(products)
+        with parser_metrics.timer('stage_seconds', stage='sql'):
+            sql_file = generate_sql_script_from_ndjson(json_file, args.sql_format, args.sql_batch_size)
+        products_list = iter_ndjson(json_file)
+        if args.snapshot:
+            with parser_metrics.timer('stage_seconds', stage='snapshot'):
+                save_data_to_snapshot(iter_ndjson(json_file))
+        if args.columnar:
+            with parser_metrics.timer('stage_seconds', stage='columnar'):
+                save_data_to_columnar(iter_ndjson(json_file), args.columnar)
+    else:
+        # Парсинг данных
+        products_list = parse_all_data(fetch_config, cache_config, args.backend, args.parse_workers, matching_config, archive_config, state)
+        
+        # Сохранение данных в JSON
+        with parser_metrics.timer('stage_seconds', stage='save_json'):
+            json_file = save_data_to_json(products_list)
+        
+        if args.snapshot:
+            with parser_metrics.timer('stage_seconds', stage='snapshot'):
+                save_data_to_snapshot(products_list)
+        
+        if args.columnar:
+            with parser_metrics.timer('stage_seconds', stage='columnar'):
+                save_data_to_columnar(products_list, args.columnar)
+        
+        # Генерация SQL-скрипта
+        with parser_metrics.timer('stage_seconds', stage='sql'):
+            sql_file = generate_sql_script(products_list, args.sql_format, args.sql_batch_size)
+    
+    # Файл изменений и состояние записываются последними: при ошибке на предыдущих этапах
+    # следующий запуск сравнивается с последним успешным
+    if state is not None:
+        with parser_metrics.timer('stage_seconds', stage='delta'):
+            save_delta(state, products_list, args.delta_file)
+            state.save()
     
     logging.info(f"Парсинг завершен. Результаты сохранены в {json_file} и {sql_file}")
+    return json_file, sql_file
+
+# Запуск из командной строки: логирование настраивается только здесь
+def main(argv=None):
+    args = parse_arguments(argv)
+    configure_logging(LOG_FILE)
+    
+    # Метрики собираются, только если запрошен хотя бы один отчет
+    if args.metrics_file or args.prometheus_file:
+        parser_metrics.enable()
+    
+    success = False
+    try:
+        run_parser(args)
+        success = True
+    finally:
+        parser_metrics.write_reports(args.metrics_file, args.prometheus_file, success=success)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,297 @@
+import io
+import sys
+import time
+import logging
+import argparse
+
+import numpy as np
+
+from instrumentation import configure_logging
+
+# Длительность плейлиста по умолчанию, с
+DEFAULT_DURATION = 3600
+
+# Темп разминки, пика и заминки по умолчанию (BPM) и доли разминки и заминки в длительности
+DEFAULT_WARMUP_BPM = 100
+DEFAULT_PEAK_BPM = 150
+DEFAULT_COOLDOWN_BPM = 90
+DEFAULT_WARMUP_SHARE = 0.15
+DEFAULT_COOLDOWN_SHARE = 0.15
+
+# Начальное и максимальное отклонение темпа трека от кривой (BPM); окно расширяется вдвое,
+# пока в нем не найдется подходящий трек
+BPM_TOLERANCE = 2
+MAX_BPM_TOLERANCE = 64
+
+# Сколько случайных треков из окна темпа сравнивается при выборе очередного трека
+CANDIDATES_PER_SLOT = 32
+
+# Допустимое отличие итоговой длительности плейлиста от заданной, с
+DURATION_TOLERANCE = 30
+
+# Треки с известным темпом и длительностью, отсортированные по темпу
+SELECT_TRACKS_SQL = """
+COPY (
+    SELECT id, bpm, duration
+    FROM tracks
+    WHERE bpm > 0 AND duration > 0
+    ORDER BY bpm, id
+) TO STDOUT WITH (FORMAT csv)
+"""
+
+# Позиции треков записываются одним запросом из массивов
+INSERT_PLAYLIST_TRACKS_SQL = """
+INSERT INTO playlist_tracks (playlist_id, track_id, position)
+SELECT %s, t.track_id, t.position
+FROM unnest(%s::int[], %s::int[]) AS t(track_id, position)
+"""
+
+
+class TrackIndex:
+    """Библиотека треков, отсортированная по темпу.
+
+    Треки с темпом в заданном интервале занимают непрерывный диапазон
+    массивов, границы которого находятся двоичным поиском.
+    """
+
+    def __init__(self, ids, bpms, durations):
+        order = np.lexsort((ids, bpms))
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.bpms = np.asarray(bpms, dtype=np.int32)[order]
+        self.durations = np.asarray(durations, dtype=np.int32)[order]
+        # Типичная длительность трека и порог, короче которого остаток сложно заполнить одним треком
+        self.typical_duration, self.short_duration = (
+            np.percentile(self.durations, [50, 5]).tolist() if len(self.durations) else (0.0, 0.0)
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_database(cls, cursor):
+        buffer = io.StringIO()
+        cursor.copy_expert(SELECT_TRACKS_SQL, buffer)
+        buffer.seek(0)
+        data = np.loadtxt(buffer, delimiter=',', dtype=np.int64, ndmin=2).reshape(-1, 3)
+        return cls(data[:, 0], data[:, 1], data[:, 2])
+
+    def window(self, low, high):
+        """Диапазон позиций треков с темпом от low до high включительно"""
+        # Границы приводятся к типу массива: иначе NumPy копирует весь массив для сравнения
+        bounds = np.array([low, high], dtype=self.bpms.dtype)
+        return (int(self.bpms.searchsorted(bounds[0], side='left')),
+                int(self.bpms.searchsorted(bounds[1], side='right')))
+
+
+def bpm_curve(duration, warmup_bpm=DEFAULT_WARMUP_BPM, peak_bpm=DEFAULT_PEAK_BPM,
+              cooldown_bpm=DEFAULT_COOLDOWN_BPM, warmup_share=DEFAULT_WARMUP_SHARE,
+              cooldown_share=DEFAULT_COOLDOWN_SHARE):
+    """Кривая темпа разминка - пик - заминка в виде опорных точек (секунда, BPM)"""
+    if warmup_share < 0 or cooldown_share < 0 or warmup_share + cooldown_share > 1:
+        raise ValueError("Доли разминки и заминки должны быть неотрицательными и в сумме не больше 1")
+    return [
+        (0, warmup_bpm),
+        (duration * warmup_share, peak_bpm),
+        (duration * (1 - cooldown_share), peak_bpm),
+        (duration, cooldown_bpm)
+    ]
+
+
+def parse_curve(text):
+    """Кривая темпа из строки вида '0:100,600:150,3000:150,3600:90'"""
+    try:
+        points = [tuple(float(value) for value in point.split(':')) for point in text.split(',')]
+    except ValueError:
+        raise ValueError(f"Некорректная кривая темпа: {text}")
+    if any(len(point) != 2 for point in points) or len(points) < 2:
+        raise ValueError(f"Некорректная кривая темпа: {text}")
+    if any(b[0] <= a[0] for a, b in zip(points, points[1:])):
+        raise ValueError("Секунды опорных точек кривой темпа должны возрастать")
+    return points
+
+
+def pick_track(index, target, remaining, used, rng):
+    """Позиция трека в индексе, ближайшего по темпу к target и подходящего по длительности.
+
+    Трек не должен выходить за конец плейлиста больше чем на DURATION_TOLERANCE
+    и оставлять после себя остаток, который не заполнить одним треком.
+    Возвращает None, если подходящего трека нет даже в самом широком окне.
+    """
+    fallback = None
+    tolerance = BPM_TOLERANCE
+    while True:
+        start, stop = index.window(target - tolerance, target + tolerance)
+        if stop - start > CANDIDATES_PER_SLOT:
+            positions = np.unique(rng.integers(start, stop, CANDIDATES_PER_SLOT))
+        else:
+            positions = np.arange(start, stop)
+        positions = np.array([position for position in positions.tolist() if position not in used], dtype=np.int64)
+
+        if len(positions):
+            gaps = remaining - index.durations[positions]
+            fits = gaps >= -DURATION_TOLERANCE
+            dead_end = (gaps > DURATION_TOLERANCE) & (gaps < index.short_duration)
+            errors = np.abs(index.bpms[positions] - target)
+            good = fits & ~dead_end
+            if good.any():
+                return int(positions[good][np.argmin(errors[good])])
+            if fallback is None and fits.any():
+                fallback = int(positions[fits][np.argmin(errors[fits])])
+
+        if tolerance >= MAX_BPM_TOLERANCE or (start == 0 and stop == len(index)):
+            return fallback
+        tolerance *= 2
+
+
+def generate_playlist(index, curve, duration=None, seed=None):
+    """Треки плейлиста по кривой темпа.
+
+    Треки подбираются по очереди: темп очередного трека ближе всего к кривой
+    в середине отрезка, который он займет. Возвращает позиции треков в индексе.
+    """
+    times, bpms = (np.array(values, dtype=np.float64) for values in zip(*curve))
+    if duration is None:
+        duration = times[-1]
+    rng = np.random.default_rng(seed)
+
+    selected = []
+    used = set()
+    elapsed = 0
+    while duration - elapsed > DURATION_TOLERANCE:
+        remaining = duration - elapsed
+        midpoint = elapsed + min(remaining, index.typical_duration) / 2
+        target = int(round(float(np.interp(midpoint, times, bpms))))
+        position = pick_track(index, target, remaining, used, rng)
+        if position is None:
+            break
+        selected.append(position)
+        used.add(position)
+        elapsed += int(index.durations[position])
+
+    if abs(duration - elapsed) > DURATION_TOLERANCE:
+        logging.warning(f"Длительность плейлиста {elapsed} с вместо {duration} с: не хватило подходящих треков")
+    return np.array(selected, dtype=np.int64)
+
+
+def save_playlist(cursor, index, positions, name=None, playlist_id=None, bpm=None,
+                  workout_type=None, intensity=None, description=None):
+    """Запись треков и вычисленной длительности плейлиста.
+
+    Если playlist_id задан, треки существующего плейлиста заменяются,
+    иначе создается новый плейлист. Возвращает идентификатор плейлиста.
+    """
+    duration = int(index.durations[positions].sum())
+    if playlist_id is None:
+        cursor.execute(
+            "INSERT INTO playlists (name, description, bpm, duration, workout_type, intensity) "
+            "VALUES (%s, %s, %s, %s, %s, %s) RETURNING id",
+            (name, description, bpm, duration, workout_type, intensity)
+        )
+        playlist_id = cursor.fetchone()[0]
+    else:
+        cursor.execute(
+            "UPDATE playlists SET duration = %s, bpm = coalesce(%s, bpm) WHERE id = %s",
+            (duration, bpm, playlist_id)
+        )
+        if cursor.rowcount == 0:
+            raise ValueError(f"Плейлист {playlist_id} не найден")
+        cursor.execute("DELETE FROM playlist_tracks WHERE playlist_id = %s", (playlist_id,))
+
+    cursor.execute(INSERT_PLAYLIST_TRACKS_SQL, (
+        playlist_id, index.ids[positions].tolist(), list(range(1, len(positions) + 1))
+    ))
+    return playlist_id
+
+
+# Синтетическая библиотека для замера скорости без базы данных
+def synthetic_index(size, seed=0):
+    rng = np.random.default_rng(seed)
+    bpms = np.clip(rng.normal(120, 25, size), 60, 200).astype(np.int32)
+    durations = np.clip(rng.normal(210, 45, size), 90, 600).astype(np.int32)
+    return TrackIndex(np.arange(1, size + 1), bpms, durations)
+
+
+def build_playlist(cursor, args, curve):
+    started = time.perf_counter()
+    index = TrackIndex.from_database(cursor)
+    loaded = time.perf_counter()
+    positions = generate_playlist(index, curve, args.duration, args.seed)
+    generated = time.perf_counter()
+    if not len(positions):
+        raise ValueError("В библиотеке нет треков с известным темпом и длительностью")
+    playlist_id = save_playlist(
+        cursor, index, positions, args.name, args.playlist_id, int(max(bpm for _second, bpm in curve)),
+        args.workout_type, args.intensity
+    )
+    logging.info(
+        f"Плейлист {playlist_id}: {len(positions)} треков, {int(index.durations[positions].sum())} с; "
+        f"загрузка {len(index)} треков {loaded - started:.2f} с, подбор {(generated - loaded) * 1000:.1f} мс, "
+        f"запись {time.perf_counter() - generated:.2f} с"
+    )
+    return playlist_id
+
+
+# Плейлист на час с разминкой 100 BPM, пиком 150 BPM и заминкой 90 BPM:
+#   python playlist_generator.py --name "Кардио 60 минут" --duration 3600
+def main(argv=None):
+    import db_init
+
+    parser = argparse.ArgumentParser(description='Подбор треков плейлиста по кривой темпа')
+    parser.add_argument('--host', default=db_init.DEFAULT_DB_CONFIG['host'], help='Хост базы данных')
+    parser.add_argument('--port', type=int, default=db_init.DEFAULT_DB_CONFIG['port'], help='Порт базы данных')
+    parser.add_argument('--user', default=db_init.DEFAULT_DB_CONFIG['user'], help='Имя пользователя базы данных')
+    parser.add_argument('--password', default=db_init.DEFAULT_DB_CONFIG['password'], help='Пароль пользователя базы данных')
+    parser.add_argument('--database', default=db_init.DEFAULT_DB_CONFIG['database'], help='Имя базы данных')
+    parser.add_argument('--name', default=None, help='Название нового плейлиста')
+    parser.add_argument('--playlist-id', type=int, default=None, help='Заменить треки существующего плейлиста')
+    parser.add_argument('--workout-type', default=None, help='Тип тренировки нового плейлиста')
+    parser.add_argument('--intensity', default=None, help='Интенсивность нового плейлиста')
+    parser.add_argument('--duration', type=int, default=DEFAULT_DURATION, help='Длительность плейлиста, с')
+    parser.add_argument('--warmup-bpm', type=int, default=DEFAULT_WARMUP_BPM, help='Темп в начале разминки')
+    parser.add_argument('--peak-bpm', type=int, default=DEFAULT_PEAK_BPM, help='Темп основной части')
+    parser.add_argument('--cooldown-bpm', type=int, default=DEFAULT_COOLDOWN_BPM, help='Темп в конце заминки')
+    parser.add_argument('--warmup-share', type=float, default=DEFAULT_WARMUP_SHARE, help='Доля разминки в длительности')
+    parser.add_argument('--cooldown-share', type=float, default=DEFAULT_COOLDOWN_SHARE, help='Доля заминки в длительности')
+    parser.add_argument('--curve', default=None, help="Произвольная кривая темпа: 'секунда:BPM,...' (заменяет параметры разминки и пика)")
+    parser.add_argument('--seed', type=int, default=None, help='Зерно случайного выбора среди равноценных треков')
+    parser.add_argument('--synthetic', type=int, default=None, help='Замер подбора на синтетической библиотеке указанного размера без базы данных')
+    args = parser.parse_args(argv)
+    configure_logging()
+    if args.duration <= 0:
+        parser.error('--duration должен быть положительным')
+    if args.playlist_id is None and not args.name and not args.synthetic:
+        parser.error('Нужно указать --name для нового плейлиста или --playlist-id для существующего')
+
+    try:
+        if args.curve:
+            curve = parse_curve(args.curve)
+        else:
+            curve = bpm_curve(args.duration, args.warmup_bpm, args.peak_bpm, args.cooldown_bpm,
+                              args.warmup_share, args.cooldown_share)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.synthetic:
+        index = synthetic_index(args.synthetic)
+        started = time.perf_counter()
+        positions = generate_playlist(index, curve, args.duration, args.seed)
+        elapsed = (time.perf_counter() - started) * 1000
+        for position in positions.tolist():
+            print(f"{index.ids[position]}\t{index.bpms[position]} BPM\t{index.durations[position]} с")
+        print(f"Треков в библиотеке: {len(index)}, в плейлисте: {len(positions)}, "
+              f"длительность {int(index.durations[positions].sum())} с, подбор {elapsed:.1f} мс")
+        return 0
+
+    try:
+        db_init.run_in_transaction(
+            args.host, args.port, args.user, args.password, args.database,
+            build_playlist, args, curve
+        )
+    except Exception as e:
+        logging.error(f"Ошибка при создании плейлиста: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
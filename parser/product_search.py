@@ -0,0 +1,344 @@
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+
+from instrumentation import configure_logging
+
+# Слова поискового запроса
+QUERY_TOKEN_RE = re.compile(r'\w+')
+
+# Символы, которые в шаблоне LIKE нужно экранировать
+LIKE_SPECIAL_RE = re.compile(r'([\\%_])')
+
+# Стоимость случайного чтения для SSD: со значением по умолчанию (4) планировщик выбирает
+# полный просмотр products вместо GIN-индексов для поиска по префиксам, хотя проверка
+# search_vector @@ tsquery для каждой строки на порядок дороже. На сервере задается
+# в postgresql.conf (см. docker-compose.yml), бенчмарки выставляют ее для своей сессии
+DEFAULT_RANDOM_PAGE_COST = 1.1
+
+# Поля продукта в результатах поиска (как в ответе backend)
+SEARCH_COLUMNS = """
+    p.id, p.name, p.proteins, p.fats, p.carbs, p.calories, p.water,
+    p.serving_size, p.image_url, p.description,
+    c.id AS category_id, c.name AS category_name, c.slug AS category_slug
+"""
+
+# Полнотекстовый поиск по хранимому вектору с ранжированием: продукты с совпадением
+# в названии (веса A и B) идут раньше продуктов с совпадением только в описании (вес C).
+# Выражение tsquery подставляется в условие, а не в подзапрос: тогда планировщик
+# вычисляет его заранее и оценивает число совпадений по статистике индекса
+FULL_TEXT_SEARCH_SQL = """
+SELECT {columns}, ts_rank(p.search_vector, {tsquery}) AS rank
+FROM products p
+JOIN product_categories c ON p.category_id = c.id
+WHERE p.is_active = true AND p.search_vector @@ {tsquery}
+ORDER BY ts_filter(p.search_vector, '{{a,b}}') @@ {tsquery} DESC, rank DESC, p.name
+LIMIT %s OFFSET %s
+"""
+
+# Поиск с опечатками и по подстроке через триграммный индекс idx_products_name_trgm
+TRIGRAM_SEARCH_SQL = """
+SELECT {columns}, word_similarity(%s, lower(p.name)) AS rank
+FROM products p
+JOIN product_categories c ON p.category_id = c.id
+WHERE p.is_active = true AND (%s <%% lower(p.name) OR lower(p.name) LIKE %s)
+ORDER BY rank DESC, p.name
+LIMIT %s OFFSET %s
+"""
+
+# Поиск по подстроке без расширения pg_trgm (полный просмотр таблицы).
+# Короткие названия, в которых подстрока занимает большую часть, идут первыми.
+# Сортировка не по p.name еще и не дает планировщику обходить индекс названий
+# в поисках редкой подстроки
+SUBSTRING_SEARCH_SQL = """
+SELECT {columns}, 0.0 AS rank
+FROM products p
+JOIN product_categories c ON p.category_id = c.id
+WHERE p.is_active = true AND lower(p.name) LIKE %s
+ORDER BY length(p.name), p.name
+LIMIT %s OFFSET %s
+"""
+
+# Количество найденных продуктов для пагинации (backend выполняет вместе со страницей результатов)
+FULL_TEXT_COUNT_SQL = "SELECT COUNT(*) AS total FROM products p WHERE p.is_active = true AND p.search_vector @@ {tsquery}"
+TRIGRAM_COUNT_SQL = "SELECT COUNT(*) AS total FROM products p WHERE p.is_active = true AND (%s <%% lower(p.name) OR lower(p.name) LIKE %s)"
+SUBSTRING_COUNT_SQL = "SELECT COUNT(*) AS total FROM products p WHERE p.is_active = true AND lower(p.name) LIKE %s"
+
+# Запрос backend до переноса вектора в таблицу: to_tsvector вычисляется для каждой строки
+LEGACY_SEARCH_SQL = """
+SELECT {columns}, ts_rank(to_tsvector('russian', p.name), plainto_tsquery('russian', %s)) AS rank
+FROM products p
+JOIN product_categories c ON p.category_id = c.id
+WHERE to_tsvector('russian', p.name) @@ plainto_tsquery('russian', %s) AND p.is_active = true
+ORDER BY rank DESC, p.name
+LIMIT %s OFFSET %s
+"""
+
+
+def query_tokens(text):
+    return QUERY_TOKEN_RE.findall(text.lower())
+
+
+def build_tsquery(tokens):
+    """SQL-выражение tsquery и его параметры для поиска по префиксам всех слов.
+
+    Каждое слово ищется как префикс и без стемминга ('simple'), и после
+    русского стеммера: "кур" находит "курица", "курицы" - "курица".
+    """
+    parts = []
+    params = []
+    for token in tokens:
+        parts.append("(to_tsquery('simple', %s) || to_tsquery('russian', %s))")
+        params.extend([token + ':*', token + ':*'])
+    return '(' + ' && '.join(parts) + ')', params
+
+
+def like_pattern(text):
+    return '%' + LIKE_SPECIAL_RE.sub(r'\\\1', text.lower()) + '%'
+
+
+def has_trigram(cursor):
+    """Установлено ли расширение pg_trgm в текущей базе данных"""
+    cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+    return cursor.fetchone() is not None
+
+
+def search_query(text, limit=20, offset=0, strategy='full_text'):
+    """SQL-запрос и параметры одной стратегии поиска"""
+    if strategy == 'full_text':
+        tsquery, params = build_tsquery(query_tokens(text))
+        return FULL_TEXT_SEARCH_SQL.format(columns=SEARCH_COLUMNS, tsquery=tsquery), params * 3 + [limit, offset]
+    if strategy == 'trigram':
+        normalized = text.lower().strip()
+        return TRIGRAM_SEARCH_SQL.format(columns=SEARCH_COLUMNS), [normalized, normalized, like_pattern(normalized), limit, offset]
+    if strategy == 'substring':
+        return SUBSTRING_SEARCH_SQL.format(columns=SEARCH_COLUMNS), [like_pattern(text.strip()), limit, offset]
+    if strategy == 'legacy':
+        return LEGACY_SEARCH_SQL.format(columns=SEARCH_COLUMNS), [text, text, limit, offset]
+    raise ValueError(f"Неизвестная стратегия поиска: {strategy}")
+
+
+def search_count_query(text, strategy='full_text'):
+    """SQL-запрос и параметры подсчета найденных продуктов одной стратегии"""
+    if strategy == 'full_text':
+        tsquery, params = build_tsquery(query_tokens(text))
+        return FULL_TEXT_COUNT_SQL.format(tsquery=tsquery), params
+    if strategy == 'trigram':
+        normalized = text.lower().strip()
+        return TRIGRAM_COUNT_SQL, [normalized, like_pattern(normalized)]
+    if strategy == 'substring':
+        return SUBSTRING_COUNT_SQL, [like_pattern(text.strip())]
+    raise ValueError(f"Неизвестная стратегия поиска: {strategy}")
+
+
+def fetch_products(cursor, sql, params, strategy):
+    cursor.execute(sql, params)
+    columns = [column[0] for column in cursor.description]
+    products = []
+    for row in cursor.fetchall():
+        product = dict(zip(columns, row))
+        product['match'] = strategy
+        products.append(product)
+    return products
+
+
+def search_products(cursor, text, limit=20, offset=0, trigram=True):
+    """Поиск активных продуктов по названию и описанию.
+
+    Сначала выполняется ранжированный полнотекстовый поиск по префиксам слов.
+    Если он ничего не нашел, запрос считается опечаткой или частью слова и
+    выполняется поиск по сходству триграмм (trigram=True, нужен pg_trgm)
+    или по подстроке. Каждый продукт результата содержит rank и match -
+    стратегию, которой он найден.
+    """
+    if not query_tokens(text):
+        return []
+
+    products = fetch_products(cursor, *search_query(text, limit, offset, 'full_text'), 'full_text')
+    if products or offset:
+        return products
+
+    strategy = 'trigram' if trigram else 'substring'
+    return fetch_products(cursor, *search_query(text, limit, offset, strategy), strategy)
+
+
+# Слова синтетических названий: основа и уточнение
+SYNTHETIC_NOUNS = [
+    'курица', 'говядина', 'свинина', 'индейка', 'молоко', 'кефир', 'творог', 'сыр', 'йогурт', 'яйцо',
+    'рис', 'гречка', 'овсянка', 'хлеб', 'батон', 'макароны', 'картофель', 'морковь', 'капуста', 'томат',
+    'яблоко', 'банан', 'апельсин', 'клубника', 'малина', 'миндаль', 'фундук', 'фасоль', 'чечевица', 'горох',
+    'шоколад', 'печенье', 'сок', 'лосось', 'треска', 'креветки', 'тунец', 'колбаса', 'сосиски', 'масло'
+]
+SYNTHETIC_ADJECTIVES = [
+    'отварной', 'жареный', 'запеченный', 'тушеный', 'сырой', 'копченый', 'обезжиренный', 'цельный',
+    'домашний', 'деревенский', 'классический', 'диетический', 'замороженный', 'сушеный', 'консервированный'
+]
+
+# Синтетический каталог генерируется на стороне сервера одним запросом
+GENERATE_PRODUCTS_SQL = """
+INSERT INTO products (name, category_id, proteins, fats, carbs, calories, serving_size, description, is_active)
+SELECT
+    initcap(nouns[1 + floor(random() * array_length(nouns, 1))::int]) || ' ' ||
+        adjectives[1 + floor(random() * array_length(adjectives, 1))::int] || ' ' || i,
+    categories[1 + floor(random() * array_length(categories, 1))::int],
+    round((random() * 40)::numeric, 1),
+    round((random() * 40)::numeric, 1),
+    round((random() * 80)::numeric, 1),
+    round((random() * 900)::numeric, 1),
+    100,
+    CASE WHEN random() < 0.1 THEN 'Продукт ' || adjectives[1 + floor(random() * array_length(adjectives, 1))::int] END,
+    random() > 0.05
+FROM generate_series(1, %s) AS i,
+     (SELECT %s::text[] AS nouns, %s::text[] AS adjectives,
+             (SELECT array_agg(id) FROM product_categories) AS categories) AS w
+"""
+
+# Запросы бенчмарка: (описание, текст запроса, стратегии)
+BENCHMARK_QUERIES = [
+    ('слово', 'курица', ['legacy', 'full_text']),
+    ('префикс', 'кур', ['legacy', 'full_text']),
+    ('два слова', 'молоко обезжир', ['legacy', 'full_text']),
+    ('опечатка', 'курнца', ['legacy', 'full_text', 'trigram', 'substring']),
+    ('подстрока', 'олоко', ['legacy', 'full_text', 'trigram', 'substring'])
+]
+
+
+def generate_catalog(cursor, rows, seed):
+    """Заполнение пустой базы синтетическим каталогом из rows продуктов"""
+    import db_init
+
+    db_init.ensure_categories(cursor, db_init.CATEGORY_NAMES)
+    cursor.execute("SELECT setseed(%s)", (seed,))
+    cursor.execute(GENERATE_PRODUCTS_SQL, (rows, SYNTHETIC_NOUNS, SYNTHETIC_ADJECTIVES))
+    # Индекс по выражению, которым пользовался прежний запрос, - для честного сравнения
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_products_name_legacy ON products USING gin(to_tsvector('russian', name))")
+    cursor.execute("ANALYZE products")
+
+
+def explain(cursor, sql, params):
+    """План запроса с фактическим временем и чтениями буферов"""
+    cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+    plan = cursor.fetchone()[0]
+    return plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+
+
+def plan_summary(plan):
+    """Узлы доступа к таблицам и использованные индексы"""
+    scans = []
+    indexes = set()
+
+    def walk(node):
+        node_type = node['Node Type']
+        if node_type.endswith('Scan'):
+            scans.append(node_type)
+        if 'Index Name' in node:
+            indexes.add(node['Index Name'])
+        for child in node.get('Plans', []):
+            walk(child)
+
+    root = plan['Plan']
+    walk(root)
+    return {
+        'execution_ms': plan['Execution Time'],
+        'scans': scans,
+        'indexes': sorted(indexes),
+        'shared_hit_blocks': root.get('Shared Hit Blocks', 0),
+        'shared_read_blocks': root.get('Shared Read Blocks', 0)
+    }
+
+
+def measure_latency(cursor, sql, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'rows': len(rows),
+        'p50_ms': statistics.median(timings),
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'max_ms': timings[-1]
+    }
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк планов и задержек поиска продуктов на синтетическом каталоге')
+    parser.add_argument('--host', default='localhost', help='Хост PostgreSQL')
+    parser.add_argument('--port', type=int, default=5432, help='Порт PostgreSQL')
+    parser.add_argument('--user', default='postgres', help='Имя пользователя PostgreSQL')
+    parser.add_argument('--password', default='postgres', help='Пароль пользователя PostgreSQL')
+    parser.add_argument('--database', default='fitbeast_search_benchmark', help='База данных для бенчмарка (пересоздается)')
+    parser.add_argument('--rows', type=int, default=1000000, help='Количество продуктов в синтетическом каталоге')
+    parser.add_argument('--seed', type=float, default=0.42, help='Начальное значение генератора случайных чисел PostgreSQL')
+    parser.add_argument('--reuse', action='store_true', help='Использовать уже сгенерированный каталог')
+    parser.add_argument('--repeat', type=int, default=20, help='Количество повторов каждого запроса')
+    parser.add_argument('--limit', type=int, default=20, help='Размер страницы результатов')
+    parser.add_argument('--plans', action='store_true', help='Выводить полные планы EXPLAIN (ANALYZE, BUFFERS)')
+    parser.add_argument('--random-page-cost', type=float, default=DEFAULT_RANDOM_PAGE_COST,
+                        help='random_page_cost для сессии бенчмарка (как в postgresql.conf сервера)')
+    parser.add_argument('--output', default='search_benchmark.json', help='Файл с результатами в формате JSON')
+    args = parser.parse_args(argv)
+    if args.rows < 1 or args.repeat < 1:
+        parser.error('--rows и --repeat должны быть положительными')
+    return args
+
+
+# Сравнение прежнего и нового поиска на синтетическом каталоге:
+#   python product_search.py --rows 1000000
+def main(argv=None):
+    args = parse_arguments(argv)
+    configure_logging()
+    import db_init
+
+    connection = (args.host, args.port, args.user, args.password, args.database)
+    if not args.reuse:
+        if not db_init.create_database(*connection, recreate=True) or not db_init.create_tables(*connection):
+            return 1
+        started = time.perf_counter()
+        db_init.run_in_transaction(*connection, generate_catalog, args.rows, args.seed)
+        logging.info(f"Синтетический каталог из {args.rows} продуктов создан за {time.perf_counter() - started:.1f} с")
+
+    conn = db_init.connect_to_postgres(*connection)
+    if not conn:
+        return 1
+    cursor = conn.cursor()
+    cursor.execute("SET random_page_cost = %s", (args.random_page_cost,))
+    trigram = has_trigram(cursor)
+    if not trigram:
+        logging.warning("Расширение pg_trgm не установлено, стратегия trigram пропущена")
+
+    results = []
+    for title, text, strategies in BENCHMARK_QUERIES:
+        for strategy in strategies:
+            if strategy == 'trigram' and not trigram:
+                continue
+            sql, params = search_query(text, args.limit, 0, strategy)
+            plan = explain(cursor, sql, params)
+            result = dict(query=text, title=title, strategy=strategy, **plan_summary(plan), **measure_latency(cursor, sql, params, args.repeat))
+            results.append(result)
+            print(f"{title:10} {text!r:18} {strategy:10} найдено {result['rows']:3}  "
+                  f"p50 {result['p50_ms']:8.2f} мс  p95 {result['p95_ms']:8.2f} мс  "
+                  f"буферов {result['shared_hit_blocks'] + result['shared_read_blocks']:7}  "
+                  f"{', '.join(result['indexes']) or ', '.join(result['scans'])}")
+            if args.plans:
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql, params)
+                print('\n'.join(line for line, in cursor.fetchall()))
+
+    cursor.execute("SELECT count(*) FROM products")
+    report = {'products': cursor.fetchone()[0], 'trigram': trigram, 'repeat': args.repeat, 'results': results}
+    conn.close()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
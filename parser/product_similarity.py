@@ -0,0 +1,344 @@
+import io
+import sys
+import time
+import logging
+import argparse
+from itertools import product
+
+import numpy as np
+
+from instrumentation import configure_logging
+
+# Количество похожих продуктов для каждого продукта по умолчанию
+DEFAULT_NEIGHBOURS = 10
+
+# Признаки продукта на 100 г. Калории делятся на 9 (ккал в грамме жира),
+# чтобы энергия и граммы макронутриентов были в одной шкале
+FEATURES = ['proteins', 'fats', 'carbs', 'calories', 'water']
+FEATURE_SCALES = np.array([1.0, 1.0, 1.0, 9.0, 1.0])
+
+# Среднее число продуктов в ячейке сетки, по которой ищутся кандидаты в соседи
+TARGET_CELL_SIZE = 16
+
+# Максимальный размер блока матрицы расстояний (элементов)
+BLOCK_ELEMENTS = 4 * 1024 * 1024
+
+# Если изменилась большая доля каталога, пересчет выполняется целиком
+INCREMENTAL_MAX_SHARE = 0.1
+
+# Активные продукты с известными белками, жирами и углеводами; пропуски в калориях
+# и воде заменяются на NaN и восстанавливаются в load_features
+SELECT_FEATURES_SQL = """
+COPY (
+    SELECT id, proteins::float8, fats::float8, carbs::float8,
+           coalesce(calories::float8, 'NaN'), coalesce(water::float8, 'NaN'),
+           coalesce(nullif(serving_size, 0), 100)
+    FROM products
+    WHERE is_active = true AND proteins IS NOT NULL AND fats IS NOT NULL AND carbs IS NOT NULL
+    ORDER BY id
+) TO STDOUT WITH (FORMAT csv)
+"""
+
+# Отметка времени обновления: начало самой старой из других открытых транзакций,
+# чтобы изменения, зафиксированные после чтения каталога, попали в следующий пересчет
+REFRESH_WATERMARK_SQL = """
+SELECT least(now(), min(xact_start))
+FROM pg_stat_activity
+WHERE datname = current_database() AND pid <> pg_backend_pid() AND xact_start IS NOT NULL
+"""
+
+UPSERT_STATE_SQL = """
+INSERT INTO product_similar_state (id, neighbours, refreshed_at) VALUES (TRUE, %s, %s)
+ON CONFLICT (id) DO UPDATE SET neighbours = EXCLUDED.neighbours, refreshed_at = EXCLUDED.refreshed_at
+"""
+
+
+def load_features(cursor):
+    """Идентификаторы продуктов и матрица признаков на 100 г в шкале FEATURE_SCALES"""
+    buffer = io.StringIO()
+    cursor.copy_expert(SELECT_FEATURES_SQL, buffer)
+    buffer.seek(0)
+    data = np.loadtxt(buffer, delimiter=',', dtype=np.float64, ndmin=2)
+    if not len(data):
+        return np.empty(0, dtype=np.int64), np.empty((0, len(FEATURES)))
+
+    ids = data[:, 0].astype(np.int64)
+    values = data[:, 1:6] * (100 / data[:, 6])[:, None]
+    proteins, fats, carbs, calories, water = values.T
+    # Калорийность по коэффициентам Этуотера, вода - остаток массы
+    missing = np.isnan(calories)
+    calories[missing] = 4 * proteins[missing] + 9 * fats[missing] + 4 * carbs[missing]
+    missing = np.isnan(water)
+    water[missing] = np.clip(100 - proteins[missing] - fats[missing] - carbs[missing], 0, None)
+    return ids, values / FEATURE_SCALES
+
+
+def grid_cell_size(points):
+    """Размер ячейки, при котором в ячейке в среднем TARGET_CELL_SIZE продуктов"""
+    extent = points.max(axis=0) - points.min(axis=0)
+    extent = extent[extent > 0]
+    if not len(extent):
+        return 1.0
+    cells = max(1.0, len(points) / TARGET_CELL_SIZE)
+    return float(np.exp((np.log(extent).sum() - np.log(cells)) / len(extent)))
+
+
+def top_k(distances, candidate_ids, k):
+    """Номера k ближайших кандидатов в каждой строке, по возрастанию расстояния"""
+    nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+    # При равных расстояниях порядок определяется номером продукта
+    order = np.lexsort((candidate_ids[nearest], nearest_distances), axis=1)
+    return np.take_along_axis(nearest, order, axis=1)
+
+
+def block_neighbours(points, query_rows, candidate_rows, k):
+    """Точные k соседей строк query_rows среди candidate_rows (без самой строки)"""
+    queries = points[query_rows]
+    candidates = points[candidate_rows]
+    candidate_norms = (candidates ** 2).sum(axis=1)
+    neighbours = np.empty((len(query_rows), k), dtype=np.int64)
+    distances = np.empty((len(query_rows), k))
+
+    block = max(1, BLOCK_ELEMENTS // max(1, len(candidate_rows)))
+    for start in range(0, len(query_rows), block):
+        rows = query_rows[start:start + block]
+        block_queries = queries[start:start + block]
+        squared = (block_queries ** 2).sum(axis=1)[:, None] + candidate_norms[None, :] - 2 * block_queries @ candidates.T
+        np.maximum(squared, 0, out=squared)
+        # Берется k + 1 ближайших, затем исключается сама строка (или последний, если ее среди них нет)
+        nearest = top_k(squared, candidate_rows, k + 1)
+        nearest_rows = candidate_rows[nearest]
+        nearest_squared = np.take_along_axis(squared, nearest, axis=1)
+        itself = nearest_rows == rows[:, None]
+        itself[~itself.any(axis=1), -1] = True
+        neighbours[start:start + block] = nearest_rows[~itself].reshape(len(rows), k)
+        distances[start:start + block] = np.sqrt(nearest_squared[~itself].reshape(len(rows), k))
+    return neighbours, distances
+
+
+def nearest_neighbours(points, k, query_rows=None):
+    """k ближайших соседей (номера строк и расстояния) для строк query_rows.
+
+    Пространство признаков делится на ячейки; кандидаты для продукта берутся
+    из его ячейки и соседних с ней (3 ** d ячеек). Результат точный: если
+    k-й сосед дальше границы просмотренных ячеек, продукт пересчитывается
+    полным перебором. Расстояния вычисляются блоками через умножение матриц.
+    """
+    n, dims = points.shape
+    query_rows = np.arange(n) if query_rows is None else np.asarray(query_rows, dtype=np.int64)
+    k = min(k, n - 1)
+    if k <= 0 or not len(query_rows):
+        return np.empty((len(query_rows), 0), dtype=np.int64), np.empty((len(query_rows), 0))
+
+    cell_size = grid_cell_size(points)
+    origin = points.min(axis=0)
+    position = (points - origin) / cell_size
+    # Сдвиг на одну ячейку: у крайних ячеек тоже есть соседи с неотрицательными координатами
+    coords = np.floor(position).astype(np.int64) + 1
+    shape = coords.max(axis=0) + 2
+    keys = np.ravel_multi_index(coords.T, shape)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    # Соседние ячейки с одинаковыми координатами, кроме последней, идут в порядке ключей подряд,
+    # поэтому кандидаты одной ячейки - это 3 ** (d - 1) непрерывных диапазонов
+    strides = np.array([int(np.prod(shape[i + 1:])) for i in range(dims)], dtype=np.int64)
+    offsets = np.array([np.dot(offset, strides[:-1]) for offset in product((-1, 0, 1), repeat=dims - 1)], dtype=np.int64)
+
+    query_keys = keys[query_rows]
+    query_order = np.argsort(query_keys, kind='stable')
+    cells, starts = np.unique(query_keys[query_order], return_index=True)
+    ends = np.append(starts[1:], len(query_rows))
+    centers = cells[:, None] + offsets[None, :]
+    lows = np.searchsorted(sorted_keys, centers - 1, side='left')
+    highs = np.searchsorted(sorted_keys, centers + 1, side='right')
+
+    neighbours = np.empty((len(query_rows), k), dtype=np.int64)
+    distances = np.empty((len(query_rows), k))
+    unresolved = []
+
+    for cell in range(len(cells)):
+        positions = query_order[starts[cell]:ends[cell]]
+        rows = query_rows[positions]
+        ranges = [order[low:high] for low, high in zip(lows[cell], highs[cell]) if high > low]
+        candidate_rows = np.concatenate(ranges)
+        if len(candidate_rows) <= k:
+            unresolved.append(positions)
+            continue
+
+        cell_neighbours, cell_distances = block_neighbours(points, rows, candidate_rows, k)
+        neighbours[positions] = cell_neighbours
+        distances[positions] = cell_distances
+
+        # Расстояние до границы просмотренных ячеек: не меньше одной ячейки
+        inside = position[rows] - (coords[rows] - 1)
+        boundary = cell_size * (1 + np.minimum(inside, 1 - inside).min(axis=1))
+        outside = cell_distances[:, -1] > boundary
+        if outside.any():
+            unresolved.append(positions[outside])
+
+    if unresolved:
+        positions = np.concatenate(unresolved)
+        neighbours[positions], distances[positions] = block_neighbours(points, query_rows[positions], np.arange(n), k)
+    return neighbours, distances
+
+
+def load_state(cursor):
+    cursor.execute("SELECT neighbours, refreshed_at FROM product_similar_state WHERE id")
+    return cursor.fetchone()
+
+
+def rows_by_id(ids, product_ids):
+    """Номера строк матрицы признаков для идентификаторов; отсутствующие отбрасываются"""
+    product_ids = np.asarray(product_ids, dtype=np.int64)
+    positions = np.searchsorted(ids, product_ids)
+    positions = np.minimum(positions, max(len(ids) - 1, 0))
+    found = ids[positions] == product_ids if len(ids) else np.zeros(len(product_ids), dtype=bool)
+    return positions[found]
+
+
+def affected_rows(cursor, ids, points, k, refreshed_at):
+    """Строки, списки соседей которых нужно пересчитать после изменений каталога.
+
+    Возвращает (строки, идентификаторы со списками на удаление). Пересчитываются
+    измененные и новые продукты, продукты, в списках которых есть измененные
+    или выбывшие продукты, и продукты, к которым измененный продукт стал ближе
+    их k-го соседа.
+    """
+    cursor.execute("SELECT id FROM products WHERE updated_at >= %s", (refreshed_at,))
+    changed_ids = np.array([product_id for product_id, in cursor.fetchall()], dtype=np.int64)
+
+    # Выбывшие продукты: удаленные, деактивированные или потерявшие значения БЖУ
+    cursor.execute("SELECT DISTINCT product_id FROM product_similar")
+    listed = np.array([product_id for product_id, in cursor.fetchall()], dtype=np.int64)
+    removed_ids = listed[~np.isin(listed, ids)]
+    unlisted_ids = ids[~np.isin(ids, listed)]
+
+    cursor.execute(
+        "SELECT DISTINCT product_id FROM product_similar WHERE similar_id = ANY(%s)",
+        (np.concatenate([changed_ids, removed_ids]).tolist(),)
+    )
+    stale_ids = [product_id for product_id, in cursor.fetchall()]
+
+    changed_rows = np.unique(np.concatenate([rows_by_id(ids, changed_ids), rows_by_id(ids, unlisted_ids)]))
+    recompute = np.zeros(len(ids), dtype=bool)
+    recompute[changed_rows] = True
+    recompute[rows_by_id(ids, stale_ids)] = True
+
+    # Измененный продукт мог стать ближе k-го соседа любого продукта.
+    # У продуктов с неполным списком (каталог был меньше k + 1) k-го соседа нет
+    if len(changed_rows):
+        kth = np.full(len(ids), np.inf)
+        cursor.execute("SELECT product_id, distance FROM product_similar WHERE rank = %s", (k,))
+        listed_kth = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, 2)
+        present = np.isin(listed_kth[:, 0].astype(np.int64), ids)
+        kth[rows_by_id(ids, listed_kth[:, 0].astype(np.int64))] = listed_kth[present, 1]
+
+        changed_points = points[changed_rows]
+        changed_norms = (changed_points ** 2).sum(axis=1)
+        block = max(1, BLOCK_ELEMENTS // len(changed_rows))
+        for start in range(0, len(ids), block):
+            block_points = points[start:start + block]
+            squared = (block_points ** 2).sum(axis=1)[:, None] + changed_norms[None, :] - 2 * block_points @ changed_points.T
+            closest = np.sqrt(np.maximum(squared, 0).min(axis=1))
+            recompute[start:start + block] |= closest < kth[start:start + block]
+
+    delete_ids = np.unique(np.concatenate([changed_ids, removed_ids, ids[recompute]]))
+    return np.flatnonzero(recompute), delete_ids.tolist()
+
+
+def copy_neighbours(cursor, ids, rows, neighbours, distances, chunk_size=100000):
+    """Запись списков соседей через COPY"""
+    k = neighbours.shape[1]
+    ranks = [str(rank) for rank in range(1, k + 1)]
+    for start in range(0, len(rows), chunk_size):
+        owner_ids = ids[rows[start:start + chunk_size]].tolist()
+        similar_ids = ids[neighbours[start:start + chunk_size]].tolist()
+        chunk_distances = np.round(distances[start:start + chunk_size], 4).tolist()
+        lines = [
+            f"{owner}\t{similar}\t{rank}\t{distance}\n"
+            for owner, similar_row, distance_row in zip(owner_ids, similar_ids, chunk_distances)
+            for similar, rank, distance in zip(similar_row, ranks, distance_row)
+        ]
+        cursor.copy_expert("COPY product_similar (product_id, similar_id, rank, distance) FROM STDIN", io.StringIO(''.join(lines)))
+
+
+def refresh_similar_products(cursor, k=DEFAULT_NEIGHBOURS, full=False):
+    """Обновление таблицы product_similar.
+
+    Первый запуск, смена k, флаг full или изменение большой доли каталога
+    приводят к полному пересчету, иначе пересчитываются только затронутые
+    изменениями продукты (изменения определяются по updated_at).
+    """
+    started = time.perf_counter()
+    cursor.execute(REFRESH_WATERMARK_SQL)
+    watermark = cursor.fetchone()[0]
+    state = load_state(cursor)
+
+    ids, points = load_features(cursor)
+    loaded = time.perf_counter()
+
+    rows = None
+    if not full and state is not None and state[0] == k:
+        rows, delete_ids = affected_rows(cursor, ids, points, k, state[1])
+        if len(delete_ids) > INCREMENTAL_MAX_SHARE * max(len(ids), 1):
+            rows = None
+
+    if rows is None:
+        neighbours, distances = nearest_neighbours(points, k)
+        computed = time.perf_counter()
+        # Индекс по similar_id быстрее построить заново, чем обновлять при вставке
+        cursor.execute("TRUNCATE product_similar")
+        cursor.execute("DROP INDEX IF EXISTS idx_product_similar_similar_id")
+        rows = np.arange(len(ids))
+        copy_neighbours(cursor, ids, rows, neighbours, distances)
+        cursor.execute("CREATE INDEX idx_product_similar_similar_id ON product_similar (similar_id)")
+        mode = 'полный'
+    else:
+        neighbours, distances = nearest_neighbours(points, k, rows)
+        computed = time.perf_counter()
+        cursor.execute("DELETE FROM product_similar WHERE product_id = ANY(%s)", (delete_ids,))
+        copy_neighbours(cursor, ids, rows, neighbours, distances)
+        mode = 'инкрементальный'
+
+    cursor.execute(UPSERT_STATE_SQL, (k, watermark))
+    logging.info(
+        f"Похожие продукты ({mode} пересчет): {len(rows)} из {len(ids)} продуктов, "
+        f"загрузка {loaded - started:.2f} с, поиск соседей {computed - loaded:.2f} с, "
+        f"запись {time.perf_counter() - computed:.2f} с"
+    )
+    return len(rows)
+
+
+# Пересчет похожих продуктов по расписанию или после загрузки каталога:
+#   python product_similarity.py --neighbours 10
+def main(argv=None):
+    import db_init
+
+    parser = argparse.ArgumentParser(description='Пересчет похожих по составу продуктов')
+    parser.add_argument('--host', default=db_init.DEFAULT_DB_CONFIG['host'], help='Хост базы данных')
+    parser.add_argument('--port', type=int, default=db_init.DEFAULT_DB_CONFIG['port'], help='Порт базы данных')
+    parser.add_argument('--user', default=db_init.DEFAULT_DB_CONFIG['user'], help='Имя пользователя базы данных')
+    parser.add_argument('--password', default=db_init.DEFAULT_DB_CONFIG['password'], help='Пароль пользователя базы данных')
+    parser.add_argument('--database', default=db_init.DEFAULT_DB_CONFIG['database'], help='Имя базы данных')
+    parser.add_argument('--neighbours', type=int, default=DEFAULT_NEIGHBOURS, help='Количество похожих продуктов для каждого продукта')
+    parser.add_argument('--full', action='store_true', help='Пересчитать все списки, а не только затронутые изменениями')
+    args = parser.parse_args(argv)
+    configure_logging()
+    if args.neighbours < 1:
+        parser.error('--neighbours должен быть положительным')
+
+    try:
+        db_init.run_in_transaction(
+            args.host, args.port, args.user, args.password, args.database,
+            refresh_similar_products, args.neighbours, args.full
+        )
+    except Exception as e:
+        logging.error(f"Ошибка при пересчете похожих продуктов: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
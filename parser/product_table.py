@@ -0,0 +1,249 @@
+import sys
+import math
+import time
+import random
+import argparse
+import tracemalloc
+from array import array
+
+import numpy as np
+
+# Размер пачки строк при выгрузке продуктов в словари
+EXPORT_CHUNK_SIZE = 10000
+
+# Максимальный размер массива названий фиксированной ширины для сортировки в NumPy
+SORT_BUFFER_LIMIT = 256 * 1024 * 1024
+
+
+class ProductTable:
+    """Компактная колоночная таблица продуктов.
+
+    Названия хранятся списком, по одному объекту строки на продукт (словарь
+    index служит таблицей интернирования), категории - кодами
+    в типизированном массиве, значения каждого питательного вещества - в
+    отдельном array('d'), отсутствующее значение - NaN. Фильтрация по полноте
+    и выгрузка выполняются векторно через NumPy-представления этих массивов.
+    """
+
+    def __init__(self, nutrient_types, categories, default_category='other'):
+        self.nutrient_types = list(nutrient_types)
+        self.categories = list(categories)
+        if default_category not in self.categories:
+            self.categories.append(default_category)
+        self.category_codes = {category: code for code, category in enumerate(self.categories)}
+        self.names = []
+        self.index = {}
+        self.category = array('H')
+        self.columns = [array('d') for _ in self.nutrient_types]
+
+    def __len__(self):
+        return len(self.names)
+
+    def add_product(self, product_name, category):
+        """Номер строки продукта; новый продукт добавляется без значений"""
+        row = self.index.get(product_name)
+        if row is None:
+            row = len(self.names)
+            self.names.append(product_name)
+            self.index[product_name] = row
+            self.category.append(self.category_codes[category])
+            for column in self.columns:
+                column.append(math.nan)
+        return row
+
+    def merge_rows(self, rows_data, nutrient_type, classify):
+        """Добавление строк (название, значение) одной страницы.
+
+        Категория определяется функцией classify при первом появлении продукта,
+        последнее значение для продукта и вещества побеждает.
+        """
+        column = self.columns[self.nutrient_types.index(nutrient_type)]
+        index = self.index
+        invalid = []
+        for product_name, nutrient_value in rows_data:
+            try:
+                value = float(nutrient_value)
+            except ValueError:
+                invalid.append((product_name, nutrient_value))
+                continue
+            row = index.get(product_name)
+            if row is None:
+                row = self.add_product(product_name, classify(product_name))
+            column[row] = value
+        return invalid
+
+    def complete_mask(self, min_values=2):
+        """Маска продуктов, у которых не меньше min_values непустых значений"""
+        counts = np.zeros(len(self.names), dtype=np.int8)
+        for column in self.columns:
+            if len(column):
+                counts += ~np.isnan(np.frombuffer(column, dtype=np.float64))
+        return counts >= min_values
+
+    def sorted_rows(self, mask=None):
+        """Номера строк (с учетом маски) в порядке названий продуктов"""
+        rows = np.flatnonzero(mask) if mask is not None else np.arange(len(self.names), dtype=np.intp)
+        if not len(rows):
+            return rows
+        names = self.names
+        selected = [names[row] for row in rows.tolist()]
+
+        # Строки фиксированной ширины сортируются в NumPy без вызова Python на каждое сравнение.
+        # Если одно длинное название раздувает такой массив, сортируем средствами Python
+        width = max(map(len, selected))
+        if width * len(selected) * 4 <= SORT_BUFFER_LIMIT:
+            order = np.argsort(np.array(selected, dtype=f'U{width}'))
+        else:
+            order = np.array(sorted(range(len(selected)), key=selected.__getitem__), dtype=np.intp)
+        return rows[order]
+
+    def category_counts(self, rows=None):
+        """Количество продуктов по категориям для строк rows (по умолчанию - всех строк)"""
+        codes = np.frombuffer(self.category, dtype=np.uint16) if len(self.category) else np.empty(0, dtype=np.uint16)
+        if rows is not None:
+            codes = codes[rows]
+        counts = np.bincount(codes, minlength=len(self.categories))
+        return {category: int(count) for category, count in zip(self.categories, counts) if count}
+
+    def iter_products(self, rows=None):
+        """Словари продуктов для строк rows (по умолчанию - все строки по порядку)"""
+        if rows is None:
+            rows = np.arange(len(self.names), dtype=np.intp)
+        names = self.names
+        categories = self.categories
+        category = np.frombuffer(self.category, dtype=np.uint16) if len(self.category) else np.empty(0, dtype=np.uint16)
+        columns = [np.frombuffer(column, dtype=np.float64) if len(column) else np.empty(0) for column in self.columns]
+
+        for start in range(0, len(rows), EXPORT_CHUNK_SIZE):
+            chunk = rows[start:start + EXPORT_CHUNK_SIZE]
+            chunk_categories = category[chunk].tolist()
+            # NaN заменяется на None, как в исходных словарях продуктов
+            chunk_values = [
+                [value if value == value else None for value in column[chunk].tolist()]
+                for column in columns
+            ]
+            for offset, row in enumerate(chunk.tolist()):
+                product = {'name': names[row], 'category': categories[chunk_categories[offset]]}
+                for nutrient_type, values in zip(self.nutrient_types, chunk_values):
+                    product[nutrient_type] = values[offset]
+                yield product
+
+    def to_list(self, rows=None):
+        return list(self.iter_products(rows))
+
+
+# Синтетический каталог: строки (название, значение) для каждого питательного вещества.
+# Около трети значений отсутствует, чтобы фильтр по полноте отбрасывал часть продуктов
+def synthetic_pages(rows_count, nutrient_types, seed=0):
+    rng = random.Random(seed)
+    words = ['молоко', 'сыр', 'курица', 'рис', 'хлеб', 'яблоко', 'орех', 'фасоль', 'сок', 'рыба', 'суп', 'каша']
+    names = [f"{rng.choice(words).capitalize()} {rng.choice(words)} №{i}" for i in range(rows_count)]
+    rng.shuffle(names)
+    pages = []
+    for _ in nutrient_types:
+        pages.append([(name, f"{rng.uniform(0, 900):.1f}") for name in names if rng.random() > 0.35])
+    return pages
+
+
+# Исходное представление: словарь словарей, фильтрация и сортировка циклами Python
+def build_dicts(pages, nutrient_types, classify):
+    products = {}
+    for nutrient_type, rows_data in zip(nutrient_types, pages):
+        for product_name, nutrient_value in rows_data:
+            if product_name not in products:
+                product = {'name': product_name, 'category': classify(product_name)}
+                product.update((name, None) for name in nutrient_types)
+                products[product_name] = product
+            products[product_name][nutrient_type] = float(nutrient_value)
+    return products
+
+
+def filter_sort_dicts(products, nutrient_types):
+    products_list = [
+        product for product in products.values()
+        if sum(1 for name in nutrient_types if product[name] is not None) >= 2
+    ]
+    products_list.sort(key=lambda x: x['name'])
+    return products_list
+
+
+def build_table(pages, nutrient_types, categories, classify):
+    table = ProductTable(nutrient_types, categories)
+    for nutrient_type, rows_data in zip(nutrient_types, pages):
+        table.merge_rows(rows_data, nutrient_type, classify)
+    return table
+
+
+def filter_sort_table(table):
+    return table.sorted_rows(table.complete_mask(2))
+
+
+def measure_memory(build):
+    tracemalloc.start()
+    try:
+        result = build()
+        current, _peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current
+
+
+def measure_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+# Сравнение словарей продуктов и колоночной таблицы на синтетическом каталоге:
+#   python product_table.py --rows 1000000
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Сравнение памяти и скорости хранения продуктов')
+    arg_parser.add_argument('--rows', type=int, default=1000000, help='Количество продуктов в синтетическом каталоге')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='Количество повторов замера времени')
+    args = arg_parser.parse_args(argv)
+    if args.rows < 1 or args.repeat < 1:
+        arg_parser.error('--rows и --repeat должны быть положительными')
+
+    nutrient_types = ['proteins', 'fats', 'carbs', 'calories', 'water']
+    categories = ['dairy', 'meat', 'grains', 'fruits']
+    classify = lambda name: categories[len(name) % len(categories)]
+
+    pages = synthetic_pages(args.rows, nutrient_types)
+
+    products, dicts_memory = measure_memory(lambda: build_dicts(pages, nutrient_types, classify))
+    products_count = len(products)
+    dicts_list, dicts_filter_sort = measure_time(lambda: filter_sort_dicts(products, nutrient_types), args.repeat)
+    _, dicts_filter = measure_time(
+        lambda: [p for p in products.values() if sum(1 for name in nutrient_types if p[name] is not None) >= 2],
+        args.repeat
+    )
+    del products
+
+    table, table_memory = measure_memory(lambda: build_table(pages, nutrient_types, categories, classify))
+    table_rows, table_filter_sort = measure_time(lambda: filter_sort_table(table), args.repeat)
+    _, table_filter = measure_time(lambda: table.complete_mask(2), args.repeat)
+
+    # Результат обоих представлений должен совпадать
+    equal = len(dicts_list) == len(table_rows) and all(
+        left == right for left, right in zip(dicts_list, table.iter_products(table_rows))
+    )
+
+    print(f"Продуктов: {products_count}, после фильтра: {len(table_rows)}")
+    # Строки названий общие для обоих представлений и в замер памяти не входят
+    print(f"Память:               словари {dicts_memory / products_count:8.1f} Б/продукт, "
+          f"таблица {table_memory / products_count:8.1f} Б/продукт ({dicts_memory / table_memory:.1f}x)")
+    print(f"Фильтр:               словари {dicts_filter * 1000:8.1f} мс, "
+          f"таблица {table_filter * 1000:8.1f} мс ({dicts_filter / table_filter:.1f}x)")
+    print(f"Фильтр и сортировка:  словари {dicts_filter_sort * 1000:8.1f} мс, "
+          f"таблица {table_filter_sort * 1000:8.1f} мс ({dicts_filter_sort / table_filter_sort:.1f}x)")
+    print(f"Результаты {'совпадают' if equal else 'РАЗЛИЧАЮТСЯ'}")
+
+    return 0 if equal else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
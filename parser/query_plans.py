@@ -0,0 +1,412 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+
+import db_init
+from product_search import (SYNTHETIC_NOUNS, SYNTHETIC_ADJECTIVES, DEFAULT_RANDOM_PAGE_COST, explain, has_trigram,
+                            search_query, search_count_query)
+from instrumentation import configure_logging
+
+# Столбцы, по которым backend сортирует списки продуктов
+SORT_COLUMNS = ['name', 'proteins', 'fats', 'carbs', 'calories', 'water']
+
+# Бюджет задержки запроса по умолчанию (p99 по повторам), мс
+DEFAULT_BUDGET_MS = 50
+
+# Полный просмотр таблицы меньше этого числа строк не считается нарушением
+DEFAULT_SEQ_SCAN_MIN_ROWS = 10000
+
+# Доля неактивных продуктов в синтетическом каталоге
+INACTIVE_SHARE = 0.05
+
+# Запросы backend/controllers/products.js (параметры $1, $2 заменены на %s).
+# Запросы поиска строит product_search: backend выполняет те же запросы
+PRODUCTS_LIST_SQL = """
+SELECT
+    p.id, p.name, p.proteins, p.fats, p.carbs, p.calories, p.water,
+    p.serving_size, p.image_url, p.description,
+    c.id as category_id, c.name as category_name, c.slug as category_slug
+FROM products p
+JOIN product_categories c ON p.category_id = c.id
+WHERE p.is_active = true
+ORDER BY p.{column} {order}
+LIMIT %s OFFSET %s
+"""
+
+PRODUCTS_COUNT_SQL = """
+SELECT COUNT(*) as total
+FROM products
+WHERE is_active = true
+"""
+
+CATEGORY_PRODUCTS_SQL = """
+SELECT
+    p.id, p.name, p.proteins, p.fats, p.carbs, p.calories, p.water,
+    p.serving_size, p.image_url, p.description
+FROM products p
+JOIN product_categories c ON p.category_id = c.id
+WHERE c.slug = %s AND p.is_active = true
+ORDER BY p.{column} {order}
+LIMIT %s OFFSET %s
+"""
+
+CATEGORY_COUNT_SQL = """
+SELECT COUNT(*) as total
+FROM products p
+JOIN product_categories c ON p.category_id = c.id
+WHERE c.slug = %s AND p.is_active = true
+"""
+
+# Похожие продукты (getSimilarProducts); списки рассчитывает product_similarity.py
+SIMILAR_PRODUCTS_SQL = """
+SELECT
+    p.id, p.name, p.proteins, p.fats, p.carbs, p.calories, p.water,
+    p.serving_size, p.image_url, p.description,
+    c.id as category_id, c.name as category_name, c.slug as category_slug,
+    s.distance
+FROM product_similar s
+JOIN products p ON s.similar_id = p.id
+JOIN product_categories c ON p.category_id = c.id
+WHERE s.product_id = %s AND p.is_active = true
+ORDER BY s.rank
+"""
+
+PRODUCT_BY_ID_SQL = "SELECT id FROM products WHERE id = %s AND is_active = true"
+
+# Индексы, которые рекомендуются по плану запроса: B-tree по столбцам products
+# (частичный, если запрос отбирает только активные продукты) и GIN по поисковому вектору
+BTREE_INDEX_SQL = "CREATE INDEX IF NOT EXISTS {name} ON products ({columns}){where}"
+ACTIVE_PREDICATE_SQL = " WHERE is_active = true"
+SEARCH_VECTOR_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_products_search_vector ON products USING gin(search_vector)"
+NAME_TRIGRAM_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING gin(lower(name) gin_trgm_ops)"
+
+# Сравнение на равенство в условии узла плана: "category_id = 3", "(p.category_id = c.id)"
+PLAN_EQUALITY_RE = re.compile(r'(?:(\w+)\.)?(\w+) = (?:(\w+)\.)?(\w+)')
+
+# Ключ сортировки по столбцу: "p.proteins", "p.proteins DESC"; выражения (ts_rank) не подходят
+PLAN_SORT_KEY_RE = re.compile(r'^(?:(\w+)\.)?(\w+)(?: DESC)?(?: NULLS (?:FIRST|LAST))?$')
+
+# Условия узлов плана, по которым отбираются строки products и соединяются таблицы
+PLAN_CONDITION_KEYS = ('Filter', 'Index Cond', 'Recheck Cond')
+PLAN_JOIN_KEYS = ('Hash Cond', 'Merge Cond', 'Join Filter')
+
+
+def query_catalog(category_slug, search_text, fallback_text, trigram=True, page_size=20, deep_offset=2000):
+    """Запросы приложения: имя, SQL и параметры.
+
+    Запасной поиск (fallback_text - запрос, который полнотекстовый поиск не
+    находит) проверяется в той стратегии, которую выберет backend: trigram
+    при установленном pg_trgm, иначе substring.
+    """
+    catalog = []
+    for column in SORT_COLUMNS:
+        for order in ('ASC', 'DESC'):
+            for offset in (0, deep_offset):
+                catalog.append({
+                    'name': f"products_list[{column} {order}, offset {offset}]",
+                    'sql': PRODUCTS_LIST_SQL.format(column=column, order=order),
+                    'params': [page_size, offset]
+                })
+            catalog.append({
+                'name': f"category_products[{column} {order}]",
+                'sql': CATEGORY_PRODUCTS_SQL.format(column=column, order=order),
+                'params': [category_slug, page_size, 0]
+            })
+    fallback = 'trigram' if trigram else 'substring'
+    for name, text, strategy in (('search', search_text, 'full_text'), (f'search_fallback[{fallback}]', fallback_text, fallback)):
+        sql, params = search_query(text, page_size, 0, strategy)
+        catalog.append({'name': name, 'sql': sql, 'params': params})
+        sql, params = search_count_query(text, strategy)
+        catalog.append({'name': name.replace('search', 'search_count', 1), 'sql': sql, 'params': params})
+    catalog.extend([
+        # Точный подсчет всех активных продуктов линеен по размеру каталога даже при
+        # index-only scan узкого частичного индекса, поэтому бюджет у него втрое больше
+        {'name': 'products_count', 'sql': PRODUCTS_COUNT_SQL, 'params': [], 'budget_factor': 3},
+        {'name': 'category_count', 'sql': CATEGORY_COUNT_SQL, 'params': [category_slug]},
+        {'name': 'similar_products', 'sql': SIMILAR_PRODUCTS_SQL, 'params': [1]},
+        {'name': 'product_by_id', 'sql': PRODUCT_BY_ID_SQL, 'params': [1]}
+    ])
+    return catalog
+
+
+# Синтетический каталог в формате результата парсера (NDJSON, читается загрузчиком построчно)
+def write_synthetic_catalog(path, rows, seed=0):
+    rng = random.Random(seed)
+    categories = list(db_init.CATEGORY_NAMES)
+    with open(path, 'w', encoding='utf-8') as f:
+        for idx in range(rows):
+            product = {
+                'name': f"{rng.choice(SYNTHETIC_NOUNS).capitalize()} {rng.choice(SYNTHETIC_ADJECTIVES)} {idx}",
+                'category': rng.choice(categories)
+            }
+            for nutrient_type in ('proteins', 'fats', 'carbs', 'calories', 'water'):
+                product[nutrient_type] = round(rng.uniform(0, 900), 1) if rng.random() > 0.2 else None
+            f.write(json.dumps(product, ensure_ascii=False) + '\n')
+
+
+def deactivate_products(cursor, share):
+    cursor.execute("UPDATE products SET is_active = false WHERE id %% %s = 0", (round(1 / share),))
+
+
+def load_dataset(connection, rows, seed):
+    """Пересоздание базы данных и загрузка синтетического каталога через db_init"""
+    if not db_init.create_database(*connection, recreate=True) or not db_init.create_tables(*connection):
+        raise RuntimeError(f"Не удалось подготовить базу данных {connection[-1]}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        data_file = os.path.join(work_dir, 'catalog.ndjson')
+        write_synthetic_catalog(data_file, rows, seed)
+        if not db_init.bulk_insert_data_from_json(*connection, data_file):
+            raise RuntimeError("Не удалось загрузить синтетический каталог")
+
+    db_init.run_in_transaction(*connection, deactivate_products, INACTIVE_SHARE)
+    # Списки похожих продуктов для запроса similar_products
+    from product_similarity import refresh_similar_products, DEFAULT_NEIGHBOURS
+    db_init.run_in_transaction(*connection, refresh_similar_products, DEFAULT_NEIGHBOURS)
+    vacuum_analyze(connection)
+
+
+def vacuum_analyze(connection):
+    # VACUUM нельзя выполнять в транзакции; он же заполняет карту видимости для index-only scan
+    conn = db_init.connect_to_postgres(*connection)
+    try:
+        conn.cursor().execute("VACUUM ANALYZE")
+    finally:
+        conn.close()
+
+
+def table_sizes(cursor):
+    cursor.execute("SELECT relname, reltuples FROM pg_class WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace")
+    return {name: rows for name, rows in cursor.fetchall()}
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def equality_columns(condition, aliases, other_aliases=None):
+    """Столбцы products, которые сравниваются на равенство в условии узла плана.
+
+    Если задан other_aliases, учитываются только сравнения со столбцами этих таблиц.
+    """
+    columns = []
+    for left_alias, left, right_alias, right in PLAN_EQUALITY_RE.findall(condition):
+        for alias, column, other_alias in ((left_alias, left, right_alias), (right_alias, right, left_alias)):
+            if alias in aliases and not column.isdigit() and (other_aliases is None or other_alias in other_aliases):
+                columns.append(column)
+    return columns
+
+
+def recommend_index(nodes):
+    """Индекс по узлам плана, которые его требуют, или None.
+
+    Рекомендация делается только для плана с полным просмотром products или
+    с узлом Sort. Полный просмотр с проверкой поискового вектора требует
+    GIN-индекса. Иначе индекс составляется из столбцов, по которым строки
+    products отбираются на равенство (условия просмотра и соединения с
+    отфильтрованной таблицей, например category_id для списка категории),
+    и столбцов ключа сортировки; если запрос отбирает только активные
+    продукты, индекс частичный.
+    """
+    scans = [node for node in nodes if node.get('Relation Name') == 'products']
+    seq_scan = any(node['Node Type'] in ('Seq Scan', 'Parallel Seq Scan') for node in scans)
+    sorts = [node for node in nodes if node['Node Type'] in ('Sort', 'Incremental Sort')]
+    if not scans or not (seq_scan or sorts):
+        return None
+    # Условие просмотра ссылается на столбцы без псевдонима, условия соединения - с ним
+    aliases = {''} | {node.get('Alias', 'products') for node in scans}
+    conditions = [node[key] for node in scans for key in PLAN_CONDITION_KEYS if key in node]
+
+    if seq_scan and any('search_vector @@' in condition for condition in conditions):
+        return SEARCH_VECTOR_INDEX_SQL
+    # Поиск по сходству или подстроке названия (<%, LIKE) обслуживает только триграммный индекс
+    if seq_scan and any('lower((name)' in condition and ('<%' in condition or '~~' in condition) for condition in conditions):
+        return NAME_TRIGRAM_INDEX_SQL
+
+    columns = []
+    for condition in conditions:
+        columns.extend(column for column in equality_columns(condition, aliases) if column != 'is_active')
+    # Соединение сужает выборку, только если строки другой таблицы отобраны условием (c.slug = ...)
+    filtered_aliases = {node['Alias'] for node in nodes
+                        if 'Alias' in node and node.get('Relation Name') != 'products'
+                        and any(key in node for key in PLAN_CONDITION_KEYS)}
+    for node in nodes:
+        for key in PLAN_JOIN_KEYS:
+            if key in node:
+                columns.extend(equality_columns(node[key], aliases - {''}, filtered_aliases))
+    # Индекс заменяет сортировку, только если все ключи - столбцы products (не rank, length(name))
+    for node in sorts:
+        matches = [PLAN_SORT_KEY_RE.match(key) for key in node.get('Sort Key', [])]
+        if all(match and (match.group(1) or '') in aliases for match in matches):
+            columns.extend(match.group(2) for match in matches)
+    columns = list(dict.fromkeys(columns))
+    if not columns:
+        return None
+
+    active = any(re.search(r'\bis_active\b', condition) for condition in conditions)
+    name = 'idx_products_' + ('active_' if active else '') + '_'.join(column.replace('_id', '') for column in columns)
+    return BTREE_INDEX_SQL.format(name=name, columns=', '.join(columns), where=ACTIVE_PREDICATE_SQL if active else '')
+
+
+def percentile(sorted_values, share):
+    # Ближайший ранг: при 20 повторах p99 равен максимуму
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(share * len(sorted_values))) - 1))]
+
+
+def check_query(cursor, query, sizes, budget_ms, repeat, seq_scan_min_rows):
+    """Проверка одного запроса: план, задержка и нарушения"""
+    budget_ms *= query.get('budget_factor', 1)
+    plan = explain(cursor, query['sql'], query['params'])
+    nodes = list(plan_nodes(plan['Plan']))
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute(query['sql'], query['params'])
+        cursor.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+
+    result = {
+        'name': query['name'],
+        'budget_ms': budget_ms,
+        'p50_ms': percentile(timings, 0.5),
+        'p99_ms': percentile(timings, 0.99),
+        'execution_ms': plan['Execution Time'],
+        'shared_hit_blocks': plan['Plan'].get('Shared Hit Blocks', 0),
+        'shared_read_blocks': plan['Plan'].get('Shared Read Blocks', 0),
+        'indexes': sorted({node['Index Name'] for node in nodes if 'Index Name' in node}),
+        'violations': []
+    }
+
+    for node in nodes:
+        relation = node.get('Relation Name')
+        if node['Node Type'] in ('Seq Scan', 'Parallel Seq Scan') and sizes.get(relation, 0) >= seq_scan_min_rows:
+            result['violations'].append(f"полный просмотр таблицы {relation} ({int(sizes[relation])} строк)")
+    if result['p99_ms'] > budget_ms:
+        result['violations'].append(f"p99 {result['p99_ms']:.1f} мс больше бюджета {budget_ms} мс")
+
+    if result['violations']:
+        recommended = recommend_index(nodes)
+        if recommended and not any(f" {index} " in recommended for index in result['indexes']):
+            result['recommended_index'] = recommended
+    return result
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Проверка планов и задержек запросов приложения на синтетическом каталоге')
+    parser.add_argument('--host', default='localhost', help='Хост PostgreSQL')
+    parser.add_argument('--port', type=int, default=5432, help='Порт PostgreSQL')
+    parser.add_argument('--user', default='postgres', help='Имя пользователя PostgreSQL')
+    parser.add_argument('--password', default='postgres', help='Пароль пользователя PostgreSQL')
+    parser.add_argument('--database', default='fitbeast_query_plans', help='База данных для проверки (пересоздается)')
+    parser.add_argument('--rows', type=int, default=1000000, help='Количество продуктов в синтетическом каталоге')
+    parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора синтетического каталога')
+    parser.add_argument('--reuse', action='store_true', help='Использовать уже загруженный каталог')
+    parser.add_argument('--repeat', type=int, default=20, help='Количество повторов каждого запроса')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS, help='Бюджет задержки запроса (p99), мс')
+    parser.add_argument('--seq-scan-min-rows', type=int, default=DEFAULT_SEQ_SCAN_MIN_ROWS,
+                        help='Полный просмотр таблиц меньшего размера не считается нарушением')
+    parser.add_argument('--category', default='dairy', help='Категория для запросов по категории')
+    parser.add_argument('--search', default='курица', help='Текст поискового запроса')
+    parser.add_argument('--fallback-search', default='урица',
+                        help='Текст запроса для запасного поиска (часть слова или опечатка, которую не находит полнотекстовый поиск)')
+    parser.add_argument('--only', default=None, help='Проверять только запросы, имя которых содержит эту строку')
+    parser.add_argument('--random-page-cost', type=float, default=DEFAULT_RANDOM_PAGE_COST,
+                        help='random_page_cost для сессии проверки (как в postgresql.conf сервера)')
+    parser.add_argument('--create-indexes', action='store_true', help='Создать рекомендованные индексы и повторить проверку')
+    parser.add_argument('--plans', action='store_true', help='Выводить полные планы EXPLAIN (ANALYZE, BUFFERS) запросов с нарушениями')
+    parser.add_argument('--output', default='query_plans.json', help='Файл с результатами в формате JSON')
+    args = parser.parse_args(argv)
+    if args.rows < 1 or args.repeat < 1:
+        parser.error('--rows и --repeat должны быть положительными')
+    return args
+
+
+def run_checks(cursor, catalog, args):
+    sizes = table_sizes(cursor)
+    results = []
+    for query in catalog:
+        result = check_query(cursor, query, sizes, args.budget_ms, args.repeat, args.seq_scan_min_rows)
+        results.append(result)
+        status = 'ОК' if not result['violations'] else 'НАРУШЕНИЕ'
+        print(f"{status:10} {result['name']:42} p50 {result['p50_ms']:8.2f} мс  p99 {result['p99_ms']:8.2f} мс  "
+              f"{', '.join(result['indexes']) or '-'}")
+        for violation in result['violations']:
+            print(f"{'':10} {violation}")
+        if result['violations'] and args.plans:
+            cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + query['sql'], query['params'])
+            print('\n'.join(line for line, in cursor.fetchall()))
+    return results
+
+
+# Проверка запросов приложения на синтетическом каталоге:
+#   python query_plans.py --rows 1000000
+# Код возврата 1, если хотя бы один запрос просматривает большую таблицу целиком или не укладывается в бюджет
+def main(argv=None):
+    args = parse_arguments(argv)
+    configure_logging()
+    connection = (args.host, args.port, args.user, args.password, args.database)
+
+    if not args.reuse:
+        started = time.perf_counter()
+        load_dataset(connection, args.rows, args.seed)
+        logging.info(f"Синтетический каталог из {args.rows} продуктов загружен за {time.perf_counter() - started:.1f} с")
+
+    conn = db_init.connect_to_postgres(*connection)
+    if not conn:
+        return 1
+    cursor = conn.cursor()
+    cursor.execute("SET random_page_cost = %s", (args.random_page_cost,))
+
+    trigram = has_trigram(cursor)
+    catalog = [query for query in query_catalog(args.category, args.search, args.fallback_search, trigram)
+               if not args.only or args.only in query['name']]
+    results = run_checks(cursor, catalog, args)
+
+    recommended = sorted({result['recommended_index'] for result in results if 'recommended_index' in result})
+    if recommended:
+        print("Рекомендуемые индексы:")
+        for statement in recommended:
+            print(f"  {statement};")
+
+    created = []
+    if recommended and args.create_indexes:
+        for statement in recommended:
+            if statement == NAME_TRIGRAM_INDEX_SQL and not trigram:
+                logging.warning("Триграммный индекс по названию не создан: нужно расширение pg_trgm")
+                continue
+            cursor.execute(statement)
+            created.append(statement)
+        cursor.execute("ANALYZE products")
+        logging.info(f"Создано индексов: {len(created)}, повторная проверка")
+        results = run_checks(cursor, catalog, args)
+
+    cursor.execute("SELECT count(*) FROM products")
+    failed = [result['name'] for result in results if result['violations']]
+    report = {
+        'products': cursor.fetchone()[0],
+        'repeat': args.repeat,
+        'budget_ms': args.budget_ms,
+        'created_indexes': created,
+        'results': results,
+        'failed': failed
+    }
+    conn.close()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Запросов с нарушениями: {len(failed)} из {len(results)}. Результаты сохранены в {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import math
+from itertools import islice
+
+# Столбцы продукта в порядке записи в SQL-скрипт
+PRODUCT_COLUMNS = ['name', 'category', 'proteins', 'fats', 'carbs', 'calories', 'water']
+
+
+def quote_literal(value):
+    """SQL-литерал для значения (аналог quote_literal в PostgreSQL)"""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and not math.isfinite(value):
+            return 'NULL'
+        return repr(value)
+
+    # Символ NUL недопустим в строках PostgreSQL
+    text = str(value).replace('\x00', '')
+    quoted = text.replace("'", "''")
+    if '\\' in quoted:
+        # Обратная косая черта экранируется и строка записывается в E'' форме
+        return "E'" + quoted.replace('\\', '\\\\') + "'"
+    return "'" + quoted + "'"
+
+
+def copy_field(value):
+    """Значение поля в текстовом формате COPY"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, float) and not math.isfinite(value):
+        return '\\N'
+    return (
+        str(value)
+        .replace('\x00', '')
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def write_categories(f, categories, category_names):
+    """Вставка всех категорий одним запросом"""
+    f.write("-- Вставка категорий продуктов\n")
+    if not categories:
+        return
+    f.write("INSERT INTO product_categories (name, slug, description) VALUES\n")
+    values = []
+    for category in sorted(categories):
+        category_name = category_names.get(category, 'Другое')
+        values.append(f"({quote_literal(category_name)}, {quote_literal(category)}, {quote_literal(category_name)})")
+    f.write(",\n".join(values))
+    f.write("\nON CONFLICT (slug) DO NOTHING;\n")
+
+
+def write_products_insert(f, products):
+    """Отдельный INSERT для каждого продукта (исходный формат)"""
+    for product in products:
+        values = ', '.join(quote_literal(product[column]) for column in PRODUCT_COLUMNS[2:])
+        f.write("INSERT INTO products (name, category_id, proteins, fats, carbs, calories, water, serving_size) \n")
+        f.write(
+            f"VALUES ({quote_literal(product['name'])}, (SELECT id FROM product_categories WHERE slug = {quote_literal(product['category'])}), "
+            f"{values}, 100) ON CONFLICT (name) DO NOTHING;\n\n"
+        )
+
+
+def write_products_values(f, products, batch_size=1000):
+    """Многострочные INSERT ... VALUES пачками по batch_size продуктов.
+
+    id категории определяется одним JOIN на пачку вместо подзапроса на каждую строку.
+    """
+    batch_size = max(1, batch_size)
+    products = iter(products)
+    while True:
+        batch = list(islice(products, batch_size))
+        if not batch:
+            break
+        f.write(
+            "INSERT INTO products (name, category_id, proteins, fats, carbs, calories, water, serving_size)\n"
+            "SELECT v.name, c.id, v.proteins::numeric, v.fats::numeric, v.carbs::numeric, v.calories::numeric, v.water::numeric, 100\n"
+            "FROM (VALUES\n"
+        )
+        f.write(",\n".join(
+            "(" + ", ".join(quote_literal(product[column]) for column in PRODUCT_COLUMNS) + ")"
+            for product in batch
+        ))
+        f.write(
+            "\n) AS v (name, category_slug, proteins, fats, carbs, calories, water)\n"
+            "JOIN product_categories c ON c.slug = v.category_slug\n"
+            "ON CONFLICT (name) DO NOTHING;\n\n"
+        )
+
+
+def write_products_copy(f, products):
+    """Блок COPY ... FROM stdin во временную таблицу и один INSERT ... SELECT с JOIN категорий"""
+    f.write(
+        "CREATE TEMP TABLE products_import (\n"
+        "    name VARCHAR(255),\n"
+        "    category_slug VARCHAR(100),\n"
+        "    proteins DECIMAL(5,1),\n"
+        "    fats DECIMAL(5,1),\n"
+        "    carbs DECIMAL(5,1),\n"
+        "    calories DECIMAL(6,1),\n"
+        "    water DECIMAL(5,1)\n"
+        ");\n"
+        "COPY products_import (name, category_slug, proteins, fats, carbs, calories, water) FROM stdin;\n"
+    )
+    for product in products:
+        f.write("\t".join(copy_field(product[column]) for column in PRODUCT_COLUMNS))
+        f.write("\n")
+    f.write(
+        "\\.\n"
+        "INSERT INTO products (name, category_id, proteins, fats, carbs, calories, water, serving_size)\n"
+        "SELECT i.name, c.id, i.proteins, i.fats, i.carbs, i.calories, i.water, 100\n"
+        "FROM products_import i\n"
+        "JOIN product_categories c ON c.slug = i.category_slug\n"
+        "ON CONFLICT (name) DO NOTHING;\n"
+        "DROP TABLE products_import;\n"
+    )
+
+
+# Доступные форматы записи продуктов
+SQL_FORMATS = ['copy', 'values', 'insert']
@@ -0,0 +1,310 @@
+import io
+import time
+import logging
+from math import gcd
+from multiprocessing import Pool
+
+import numpy as np
+
+from product_search import SYNTHETIC_NOUNS, SYNTHETIC_ADJECTIVES
+
+# Строк в одной порции COPY. Сгенерированные данные зависят от зерна и размера порции,
+# но не от числа процессов
+CHUNK_ROWS = 100000
+
+# Среднее число избранных продуктов и плейлистов у пользователя (геометрическое распределение:
+# у большинства пользователей мало избранного, у немногих - много) и верхняя граница
+FAVORITE_PRODUCTS_PER_USER = 5
+FAVORITE_PLAYLISTS_PER_USER = 2
+MAX_FAVORITES_PER_USER = 200
+
+# Показатель распределения Ципфа для популярности продуктов, плейлистов, треков и исполнителей
+ZIPF_EXPONENT = 0.9
+
+# Количество треков в плейлисте (от и до включительно)
+MIN_PLAYLIST_TRACKS = 10
+MAX_PLAYLIST_TRACKS = 25
+
+# Доля неактивных продуктов
+INACTIVE_SHARE = 0.05
+
+WORKOUT_TYPES = ['кардио', 'силовая', 'растяжка', 'интервальная', 'йога', 'бег', 'функциональная', 'восстановление']
+
+# Хеш пароля синтетических пользователей (вход под ними не предполагается)
+SYNTHETIC_PASSWORD_HASH = '$2b$10$' + 'S' * 53
+
+# Таблицы строк (таблица, столбцы COPY) и таблицы связей (таблица, столбцы COPY, таблица
+# владельцев, по строке которой генерируется группа связей, таблица, на которую ссылаются связи).
+# Связи ссылаются на строки первой группы и загружаются после нее
+ENTITY_TABLES = [
+    ('users', 'id, username, email, password_hash, first_name, is_active'),
+    ('products', 'id, name, category_id, proteins, fats, carbs, calories, water, serving_size, is_active'),
+    ('tracks', 'id, title, artist, duration, bpm, audio_url'),
+    ('playlists', 'id, name, genre_id, bpm, workout_type, intensity')
+]
+LINK_TABLES = [
+    ('playlist_tracks', 'playlist_id, track_id, position', 'playlists', 'tracks'),
+    ('user_favorite_products', 'user_id, product_id', 'users', 'products'),
+    ('user_favorite_playlists', 'user_id, playlist_id', 'users', 'playlists')
+]
+TABLE_COLUMNS = dict(ENTITY_TABLES + [(table, columns) for table, columns, _owner, _target in LINK_TABLES])
+TABLE_NUMBERS = {table: number for number, table in enumerate(TABLE_COLUMNS)}
+
+# Длительность синтетических плейлистов - сумма длительностей их треков
+UPDATE_PLAYLIST_DURATIONS_SQL = """
+UPDATE playlists p SET duration = s.duration
+FROM (
+    SELECT pt.playlist_id, sum(t.duration) AS duration
+    FROM playlist_tracks pt JOIN tracks t ON t.id = pt.track_id
+    WHERE pt.playlist_id > %s
+    GROUP BY pt.playlist_id
+) s
+WHERE p.id = s.playlist_id
+"""
+
+# Подключение процесса-загрузчика
+_worker_conn = None
+
+
+def zipf_ranks(rng, size, count):
+    """Ранги популярности от 1 до count, распределенные по закону Ципфа.
+
+    Ранги получаются обращением непрерывной функции распределения, поэтому
+    показатель может быть меньше 1 (numpy.random.zipf требует больше 1).
+    """
+    power = 1 - ZIPF_EXPONENT
+    values = ((count + 1) ** power - 1) * rng.random(size) + 1
+    return np.clip(np.floor(values ** (1 / power)).astype(np.int64), 1, count)
+
+
+def rank_ids(ranks, first_id, count):
+    """Идентификаторы по рангам популярности.
+
+    Ранги перемешиваются умножением на взаимно простое с count число, чтобы
+    популярные строки не были сосредоточены в начале таблицы.
+    """
+    step = 7919
+    while gcd(step, count) != 1:
+        step += 2
+    return first_id + ((ranks - 1) * step + count // 2) % count
+
+
+def group_links(rng, owners, first_owner, per_owner, target_first_id, target_count):
+    """Связи владельцев (пользователей, плейлистов) со строками другой таблицы.
+
+    per_owner - количество связей у каждого владельца, цели выбираются по закону
+    Ципфа, повторы у одного владельца удаляются. Связи упорядочены по владельцу.
+    """
+    owner_ids = np.repeat(np.arange(owners), per_owner)
+    targets = rank_ids(zipf_ranks(rng, len(owner_ids), target_count), target_first_id, target_count)
+    keys = np.unique(owner_ids * (target_first_id + target_count) + targets)
+    return first_owner + keys // (target_first_id + target_count), keys % (target_first_id + target_count)
+
+
+def favorite_counts(rng, size, mean):
+    return np.minimum(rng.geometric(1 / (mean + 1), size) - 1, MAX_FAVORITES_PER_USER)
+
+
+def users_chunk(rng, plan, start, count):
+    ids = plan['base']['users'] + 1 + np.arange(start, start + count)
+    names = rng.choice(['Алексей', 'Мария', 'Иван', 'Анна', 'Дмитрий', 'Елена', 'Сергей', 'Ольга'], count)
+    return ''.join(
+        f"{user_id},loadtest_user{user_id},loadtest_user{user_id}@example.com,{SYNTHETIC_PASSWORD_HASH},{name},t\n"
+        for user_id, name in zip(ids.tolist(), names.tolist())
+    )
+
+
+def products_chunk(rng, plan, start, count):
+    ids = plan['base']['products'] + 1 + np.arange(start, start + count)
+    nouns = rng.choice(SYNTHETIC_NOUNS, count)
+    adjectives = rng.choice(SYNTHETIC_ADJECTIVES, count)
+    categories = rng.choice(plan['category_ids'], count)
+    # Доли белков, жиров, углеводов и воды в 100 г, остаток - клетчатка и зола
+    proteins, fats, carbs, water = (rng.dirichlet([0.8, 0.5, 1.0, 2.5, 0.3], count)[:, :4] * 100).round(1).T
+    calories = (4 * proteins + 9 * fats + 4 * carbs).round(1)
+    active = np.where(rng.random(count) < INACTIVE_SHARE, 'f', 't')
+    return ''.join(
+        f"{row[0]},{row[1].capitalize()} {row[2]} №{row[0]},{row[3]},{row[4]:.1f},{row[5]:.1f},{row[6]:.1f},{row[7]:.1f},{row[8]:.1f},100,{row[9]}\n"
+        for row in zip(ids.tolist(), nouns.tolist(), adjectives.tolist(), categories.tolist(), proteins.tolist(),
+                       fats.tolist(), carbs.tolist(), calories.tolist(), water.tolist(), active.tolist())
+    )
+
+
+def tracks_chunk(rng, plan, start, count):
+    ids = plan['base']['tracks'] + 1 + np.arange(start, start + count)
+    artists = zipf_ranks(rng, count, max(plan['counts']['tracks'] // 20, 1))
+    durations = np.clip(rng.normal(210, 45, count), 60, 900).astype(np.int64)
+    bpms = np.clip(rng.normal(125, 22, count), 60, 200).astype(np.int64)
+    return ''.join(
+        f"{track_id},Трек {track_id},Исполнитель {artist},{duration},{bpm},/audio/synthetic/{track_id}.mp3\n"
+        for track_id, artist, duration, bpm in zip(ids.tolist(), artists.tolist(), durations.tolist(), bpms.tolist())
+    )
+
+
+def playlists_chunk(rng, plan, start, count):
+    ids = plan['base']['playlists'] + 1 + np.arange(start, start + count)
+    genres = rng.choice(plan['genre_ids'], count) if plan['genre_ids'] else np.zeros(count, dtype=np.int64)
+    bpms = rng.integers(60, 181, count)
+    workout_types = rng.choice(WORKOUT_TYPES, count)
+    intensities = np.where(bpms < 100, 'низкая', np.where(bpms < 140, 'средняя', 'высокая'))
+    return ''.join(
+        f"{playlist_id},Плейлист {playlist_id},{genre or ''},{bpm},{workout_type},{intensity}\n"
+        for playlist_id, genre, bpm, workout_type, intensity in zip(
+            ids.tolist(), genres.tolist(), bpms.tolist(), workout_types.tolist(), intensities.tolist())
+    )
+
+
+def playlist_tracks_chunk(rng, plan, start, count):
+    per_playlist = rng.integers(MIN_PLAYLIST_TRACKS, MAX_PLAYLIST_TRACKS + 1, count)
+    playlists, tracks = group_links(
+        rng, count, plan['base']['playlists'] + 1 + start, per_playlist,
+        plan['base']['tracks'] + 1, plan['counts']['tracks']
+    )
+    # Позиция - номер трека внутри своего плейлиста, начиная с 1
+    first = np.r_[0, np.flatnonzero(np.diff(playlists)) + 1]
+    positions = np.arange(len(playlists)) - np.repeat(first, np.diff(np.r_[first, len(playlists)])) + 1
+    return ''.join(f"{p},{t},{n}\n" for p, t, n in zip(playlists.tolist(), tracks.tolist(), positions.tolist()))
+
+
+def favorites_chunk(target, mean):
+    def generate(rng, plan, start, count):
+        users, targets = group_links(
+            rng, count, plan['base']['users'] + 1 + start, favorite_counts(rng, count, mean),
+            plan['base'][target] + 1, plan['counts'][target]
+        )
+        return ''.join(f"{u},{t}\n" for u, t in zip(users.tolist(), targets.tolist()))
+    return generate
+
+
+CHUNK_GENERATORS = {
+    'users': users_chunk,
+    'products': products_chunk,
+    'tracks': tracks_chunk,
+    'playlists': playlists_chunk,
+    'playlist_tracks': playlist_tracks_chunk,
+    'user_favorite_products': favorites_chunk('products', FAVORITE_PRODUCTS_PER_USER),
+    'user_favorite_playlists': favorites_chunk('playlists', FAVORITE_PLAYLISTS_PER_USER)
+}
+
+
+def init_worker(connection, skip_foreign_keys):
+    import db_init
+
+    global _worker_conn
+    _worker_conn = db_init.connect_to_postgres(*connection)
+    if _worker_conn is None:
+        raise RuntimeError("Не удалось подключиться к базе данных")
+    _worker_conn.autocommit = True
+    cursor = _worker_conn.cursor()
+    cursor.execute("SET synchronous_commit = off")
+    if skip_foreign_keys:
+        # Ссылки синтетических строк корректны по построению: проверка внешних ключей
+        # (и триггеры) отключается на время загрузки
+        cursor.execute("SET session_replication_role = replica")
+
+
+def load_chunk(task):
+    """Генерация и загрузка одной порции строк через COPY в процессе-загрузчике"""
+    table, chunk, start, count, plan = task
+    rng = np.random.default_rng([plan['seed'], TABLE_NUMBERS[table], chunk])
+    text = CHUNK_GENERATORS[table](rng, plan, start, count)
+    _worker_conn.cursor().copy_expert(
+        f"COPY {table} ({TABLE_COLUMNS[table]}) FROM STDIN WITH (FORMAT csv)", io.StringIO(text)
+    )
+    return table, text.count('\n')
+
+
+def chunk_tasks(tables, plan):
+    links = {table: (owner, target) for table, _columns, owner, target in LINK_TABLES}
+    for table in tables:
+        owner, target = links.get(table, (table, table))
+        total = plan['counts'][owner]
+        if not plan['counts'][target]:
+            continue
+        for chunk, start in enumerate(range(0, total, CHUNK_ROWS)):
+            yield table, chunk, start, min(CHUNK_ROWS, total - start), plan
+
+
+def prepare_plan(cursor, counts, seed):
+    """Справочники, начальные идентификаторы таблиц и параметры генерации"""
+    import db_init
+
+    cursor.execute(db_init.INSERT_MUSIC_GENRES_SQL)
+    db_init.ensure_categories(cursor, db_init.CATEGORY_NAMES)
+    cursor.execute("SELECT id FROM product_categories ORDER BY id")
+    category_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT id FROM music_genres ORDER BY id")
+    genre_ids = [row[0] for row in cursor.fetchall()]
+
+    base = {}
+    for table, _columns in ENTITY_TABLES:
+        cursor.execute(f"SELECT coalesce(max(id), 0) FROM {table}")
+        base[table] = cursor.fetchone()[0]
+    cursor.execute("SELECT current_setting('is_superuser') = 'on'")
+    superuser = cursor.fetchone()[0]
+    return {
+        'seed': seed, 'counts': counts, 'base': base,
+        'category_ids': category_ids, 'genre_ids': genre_ids
+    }, superuser
+
+
+def run_tasks(tasks, connection, skip_foreign_keys, workers, loaded):
+    if workers > 1:
+        with Pool(workers, init_worker, (connection, skip_foreign_keys)) as pool:
+            results = list(pool.imap_unordered(load_chunk, tasks))
+    else:
+        init_worker(connection, skip_foreign_keys)
+        try:
+            results = [load_chunk(task) for task in tasks]
+        finally:
+            _worker_conn.close()
+    for table, rows in results:
+        loaded[table] = loaded.get(table, 0) + rows
+
+
+def generate_synthetic_data(connection, counts, seed=0, workers=1):
+    """Генерация синтетических данных для нагрузочного тестирования.
+
+    counts - количество пользователей, продуктов, треков и плейлистов; треки
+    плейлистов и избранное генерируются для созданных строк. Данные
+    воспроизводимы при одинаковом зерне и пустых таблицах. Порции загружаются
+    через COPY параллельно из workers процессов, каждый в своем подключении.
+    Возвращает количество загруженных строк по таблицам.
+    """
+    import db_init
+
+    conn = db_init.connect_to_postgres(*connection)
+    if conn is None:
+        raise RuntimeError("Не удалось подключиться к базе данных")
+    try:
+        conn.autocommit = False
+        cursor = conn.cursor()
+        plan, superuser = prepare_plan(cursor, counts, seed)
+        conn.commit()
+
+        loaded = {}
+        started = time.perf_counter()
+        run_tasks(list(chunk_tasks([table for table, _columns in ENTITY_TABLES], plan)), connection, superuser, workers, loaded)
+        # Связи ссылаются на загруженные строки, поэтому загружаются вторыми
+        run_tasks(list(chunk_tasks([table for table, _columns, _owner, _target in LINK_TABLES], plan)), connection, superuser, workers, loaded)
+        elapsed = time.perf_counter() - started
+
+        for table, _columns in ENTITY_TABLES:
+            cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), greatest(max(id), 1)) FROM {table}")
+        cursor.execute(UPDATE_PLAYLIST_DURATIONS_SQL, (plan['base']['playlists'],))
+        if superuser:
+            # Триггеры не срабатывали при загрузке: версия каталога обновляется явно
+            cursor.execute("UPDATE products_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id")
+        conn.commit()
+
+        conn.autocommit = True
+        cursor.execute(f"ANALYZE {', '.join(TABLE_COLUMNS)}")
+    finally:
+        conn.close()
+
+    total = sum(loaded.values())
+    logging.info(
+        f"Синтетические данные загружены за {elapsed:.2f} с ({total / elapsed if elapsed else 0:.0f} строк/с, "
+        f"процессов: {workers}): " + ', '.join(f"{table} {loaded.get(table, 0)}" for table in TABLE_COLUMNS)
+    )
+    return loaded
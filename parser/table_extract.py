@@ -0,0 +1,272 @@
+import re
+import sys
+import time
+from html.entities import html5, name2codepoint
+from html.parser import HTMLParser
+
+# Теги без закрывающего тега (как в html.parser-сборщике BeautifulSoup)
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem',
+    'meta', 'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame',
+    'image', 'isindex', 'nextid', 'spacer'
+}
+
+# Теги, текст внутри которых BeautifulSoup не включает в .text ячейки
+STRING_CONTAINERS = {'script', 'style', 'template', 'rt', 'rp'}
+
+# Функция для извлечения названия продукта и значения из текста первых двух ячеек.
+# Возвращает (название, значение) или None, если строку нужно пропустить.
+# Если передан словарь rejected, в нем считаются пропущенные строки по правилам
+def extract_row(name_text, value_text, rejected=None):
+    # Очистка названия продукта от лишних символов
+    product_name = re.sub(r'\s+', ' ', name_text.strip())
+
+    # Пропускаем строки с заголовками или разделителями
+    if len(product_name) <= 2 or product_name.isupper() or product_name.startswith('—'):
+        if rejected is not None:
+            rule = 'short_name' if len(product_name) <= 2 else 'uppercase' if product_name.isupper() else 'separator'
+            rejected[rule] = rejected.get(rule, 0) + 1
+        return None
+
+    # Извлекаем числовое значение
+    value_match = re.search(r'(\d+[.,]?\d*)', value_text.strip())
+    if not value_match:
+        if rejected is not None:
+            rejected['no_value'] = rejected.get('no_value', 0) + 1
+        return None
+
+    return product_name, value_match.group(1).replace(',', '.')
+
+
+class TableRowParser(HTMLParser):
+    """Потоковый извлекатель строк таблиц на событиях html.parser.
+
+    Дерево документа не строится: отслеживается только стек имен открытых
+    тегов и таблицы, строки и ячейки, которые открыты в данный момент.
+    Вложенность обрабатывается так же, как find_all в BeautifulSoup:
+    строка относится ко всем открытым таблицам, ячейка - ко всем открытым
+    строкам, текст - ко всем открытым ячейкам.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.stack = []
+        self.open_tables = []
+        self.open_rows = []
+        self.open_cells = []
+        self.containers = 0
+        self.tables = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_ELEMENTS:
+            return
+
+        kind = None
+        if tag == 'table':
+            table = {'rows': [], 'has_thead': False, 'first_row': None}
+            self.tables.append(table)
+            self.open_tables.append(table)
+            kind = 'table'
+        elif self.open_tables:
+            if tag == 'thead':
+                for table in self.open_tables:
+                    table['has_thead'] = True
+            elif tag == 'tr':
+                row = {'cells': [], 'has_th': False}
+                for table in self.open_tables:
+                    table['rows'].append(row)
+                    if table['first_row'] is None:
+                        table['first_row'] = row
+                self.open_rows.append(row)
+                kind = 'row'
+            elif tag == 'td' or tag == 'th':
+                if tag == 'th':
+                    for row in self.open_rows:
+                        row['has_th'] = True
+                if self.open_rows:
+                    cell = []
+                    for row in self.open_rows:
+                        row['cells'].append(cell)
+                    self.open_cells.append(cell)
+                    kind = 'cell'
+
+        if tag in STRING_CONTAINERS:
+            self.containers += 1
+        self.stack.append((tag, kind))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        # Закрываем все теги до последнего открытого с таким именем
+        for idx in range(len(self.stack) - 1, -1, -1):
+            if self.stack[idx][0] == tag:
+                break
+        else:
+            return
+
+        while len(self.stack) > idx:
+            name, kind = self.stack.pop()
+            if kind == 'table':
+                self.open_tables.pop()
+            elif kind == 'row':
+                self.open_rows.pop()
+            elif kind == 'cell':
+                self.open_cells.pop()
+            if name in STRING_CONTAINERS:
+                self.containers -= 1
+
+    def handle_data(self, data):
+        if self.open_cells and not self.containers:
+            for cell in self.open_cells:
+                cell.append(data)
+
+    def handle_charref(self, name):
+        if name.startswith(('x', 'X')):
+            code = int(name[1:], 16)
+        else:
+            code = int(name)
+
+        data = None
+        # Как и BeautifulSoup, трактуем коды < 256 как windows-1252
+        if code < 256:
+            try:
+                data = bytearray([code]).decode('windows-1252')
+            except UnicodeDecodeError:
+                pass
+        if not data:
+            try:
+                data = chr(code)
+            except (ValueError, OverflowError):
+                pass
+        self.handle_data(data or '\N{REPLACEMENT CHARACTER}')
+
+    def handle_entityref(self, name):
+        character = html5.get(name + ';')
+        if character is None and name in name2codepoint:
+            character = chr(name2codepoint[name])
+        self.handle_data(character if character is not None else '&' + name)
+
+    def unknown_decl(self, data):
+        if data.upper().startswith('CDATA['):
+            self.handle_data(data[len('CDATA['):])
+
+
+# Потоковое извлечение строк (название продукта, значение) из HTML-страницы
+def parse_table_rows_stream(html, rejected=None):
+    table_parser = TableRowParser()
+    table_parser.feed(html)
+    table_parser.close()
+
+    rows_data = []
+    for table in table_parser.tables:
+        # Таблица без thead и без строк пропускается, как и в разборе через BeautifulSoup
+        if not table['has_thead'] and table['first_row'] is None:
+            continue
+
+        # Пропускаем первую строку, если она содержит заголовки
+        start_idx = 1 if table['has_thead'] or table['first_row']['has_th'] else 0
+
+        for row in table['rows'][start_idx:]:
+            cells = row['cells']
+
+            # Если меньше 2 ячеек, пропускаем строку
+            if len(cells) < 2:
+                if rejected is not None:
+                    rejected['few_cells'] = rejected.get('few_cells', 0) + 1
+                continue
+
+            row_data = extract_row(''.join(cells[0]), ''.join(cells[1]), rejected)
+            if row_data is not None:
+                rows_data.append(row_data)
+
+    return rows_data, len(table_parser.tables)
+
+
+# Извлечение строк через полное дерево BeautifulSoup (исходный алгоритм)
+def parse_table_rows_bs4(html, rejected=None):
+    from bs4 import BeautifulSoup
+
+    rows_data = []
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Поиск всех таблиц на странице
+    tables = soup.find_all('table')
+
+    for table in tables:
+        # Получить заголовки таблицы (если есть)
+        headers_row = table.find('thead')
+        if not headers_row:
+            # Если тега thead нет, ищем первую строку
+            first_row = table.find('tr')
+            if not first_row:
+                continue
+
+        # Поиск строк с данными
+        rows = table.find_all('tr')
+
+        # Пропускаем первую строку, если она содержит заголовки
+        start_idx = 1 if headers_row or (first_row and first_row.find('th')) else 0
+
+        for row in rows[start_idx:]:
+            cells = row.find_all(['td', 'th'])
+
+            # Если меньше 2 ячеек, пропускаем строку
+            if len(cells) < 2:
+                if rejected is not None:
+                    rejected['few_cells'] = rejected.get('few_cells', 0) + 1
+                continue
+
+            # Первая ячейка обычно содержит название продукта, вторая - значение
+            row_data = extract_row(cells[0].text, cells[1].text, rejected)
+            if row_data is not None:
+                rows_data.append(row_data)
+
+    return rows_data, len(tables)
+
+
+# Доступные бэкенды извлечения строк таблиц
+EXTRACTION_BACKENDS = {
+    'stream': parse_table_rows_stream,
+    'bs4': parse_table_rows_bs4
+}
+
+
+# Чистая функция разбора страницы, пригодная для выполнения в отдельном процессе.
+# Возвращает (строки, количество таблиц, пропуски по правилам или None, время разбора в секундах)
+def parse_page(html, backend='stream', count_rejected=False):
+    rejected = {} if count_rejected else None
+    started = time.perf_counter()
+    rows_data, tables_count = EXTRACTION_BACKENDS[backend](html, rejected)
+    return rows_data, tables_count, rejected, time.perf_counter() - started
+
+
+# Сравнение результатов и скорости бэкендов извлечения на сохраненных страницах:
+#   python table_extract.py page1.html [page2.html ...]
+def main(paths, repeat=5):
+    all_equal = True
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            html = f.read()
+
+        results = {}
+        for name, backend in EXTRACTION_BACKENDS.items():
+            started = time.perf_counter()
+            for _ in range(repeat):
+                rows_data, _tables_count = backend(html)
+            elapsed = (time.perf_counter() - started) / repeat
+            results[name] = rows_data
+            rate = len(rows_data) / elapsed if elapsed else 0
+            print(f"{path}: {name:6} {len(rows_data)} строк, {elapsed * 1000:.1f} мс, {rate:.0f} строк/с")
+
+        equal = results['stream'] == results['bs4']
+        all_equal = all_equal and equal
+        print(f"{path}: результаты {'совпадают' if equal else 'РАЗЛИЧАЮТСЯ'}")
+
+    return 0 if all_equal else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
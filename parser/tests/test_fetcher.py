@@ -0,0 +1,114 @@
+import time
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+from fetcher import fetch_all
+
+# Время ответа тестового сервера, секунд
+RESPONSE_DELAY = 0.2
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """Отвечает на GET с задержкой и запоминает время начала каждого запроса"""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.started.append(time.monotonic())
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        time.sleep(RESPONSE_DELAY)
+        body = f"<table><tr><td>{self.path}</td><td>1</td></tr></table>".encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with server.lock:
+            server.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.started = []
+    server.active = 0
+    server.max_active = 0
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+    return server
+
+
+def server_urls(server, count, prefix):
+    host, port = server.server_address
+    return {f'{prefix}{i}': f'http://{host}:{port}/{prefix}{i}' for i in range(count)}
+
+
+@unittest.skipUnless(requests, "нужен пакет requests")
+class FetchAllTest(unittest.TestCase):
+    def setUp(self):
+        self.servers = [start_server(), start_server()]
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def test_pages_are_fetched_concurrently(self):
+        urls = server_urls(self.servers[0], 4, 'page')
+        started = time.perf_counter()
+        results = fetch_all(urls, max_workers=4, rate=0)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(list(results), list(urls))
+        for key, result in results.items():
+            self.assertIsNone(result.error)
+            self.assertEqual(result.status_code, 200)
+            self.assertIn(f'/{key}<', result.text)
+        self.assertGreater(self.servers[0].max_active, 1)
+        self.assertLess(elapsed, len(urls) * RESPONSE_DELAY)
+
+    def test_rate_is_limited_per_host(self):
+        rate = 5.0
+        urls = dict(server_urls(self.servers[0], 3, 'a'), **server_urls(self.servers[1], 3, 'b'))
+        fetch_all(urls, max_workers=6, rate=rate, burst=1)
+
+        for server in self.servers:
+            started = sorted(server.started)
+            self.assertEqual(len(started), 3)
+            for previous, current in zip(started, started[1:]):
+                self.assertGreaterEqual(current - previous, 1 / rate * 0.9)
+        # Хосты ограничиваются независимо: первые запросы к обоим уходят без ожидания
+        first_requests = [min(server.started) for server in self.servers]
+        self.assertLess(abs(first_requests[0] - first_requests[1]), 1 / rate)
+
+    def test_latency_is_reported_per_url(self):
+        urls = server_urls(self.servers[0], 2, 'page')
+        host, port = self.servers[1].server_address
+        self.servers[1].shutdown()
+        self.servers[1].server_close()
+        self.servers.pop()
+        urls['down'] = f'http://{host}:{port}/down'
+
+        with self.assertLogs(level='INFO') as logs:
+            results = fetch_all(urls, max_workers=3, rate=0, timeout=5)
+
+        for key in ('page0', 'page1'):
+            self.assertGreaterEqual(results[key].elapsed, RESPONSE_DELAY)
+            self.assertTrue(any(f"Загружено {urls[key]}: статус 200, {results[key].elapsed:.3f} с" in line
+                                for line in logs.output))
+        self.assertIsNotNone(results['down'].error)
+        self.assertTrue(any(line.startswith('ERROR') and urls['down'] in line for line in logs.output))
+
+
+if __name__ == '__main__':
+    unittest.main()
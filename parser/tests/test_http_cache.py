@@ -0,0 +1,38 @@
+import shutil
+import tempfile
+import unittest
+
+from http_cache import HttpCache
+
+PAGE = "<table><tr><td>Гречка</td><td>12.6</td></tr></table>"
+ROWS = [('Гречка', '12.6')]
+
+
+class HttpCacheRowsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_unchanged_page_is_a_hit(self):
+        cache = HttpCache(self.directory, rules_version='stream:1')
+        cache.store('http://example.com/a', PAGE, {'ETag': '"1"'}, ROWS)
+
+        self.assertEqual(cache.get_rows('http://example.com/a', 200, PAGE), ROWS)
+        self.assertEqual(cache.get_rows('http://example.com/a', 304, None), ROWS)
+        self.assertIsNone(cache.get_rows('http://example.com/a', 200, PAGE + ' '))
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_rows_of_other_rules_version_are_a_miss(self):
+        HttpCache(self.directory, rules_version='stream:1').store('http://example.com/a', PAGE, {}, ROWS)
+
+        cache = HttpCache(self.directory, rules_version='bs4:1')
+        self.assertIsNone(cache.get_rows('http://example.com/a', 200, PAGE))
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        # Тело страницы для ответа 304 от версии правил не зависит
+        self.assertEqual(cache.get_body('http://example.com/a'), PAGE)
+
+
+if __name__ == '__main__':
+    unittest.main()
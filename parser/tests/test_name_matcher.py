@@ -0,0 +1,94 @@
+import unittest
+
+from name_matcher import NameReconciler, canonical_tokens, is_typo
+
+# Разные продукты, которые нельзя объединять ни на одной странице, ни на разных
+DISTINCT_PAIRS = [
+    ("Яйцо куриное (белок)", "Яйцо куриное (желток)"),
+    ("Молоко (сухое)", "Молоко"),
+    ("Фасоль (консервированная)", "Фасоль (сушеная)"),
+    ("Сыр 100 г", "Сыр 30 г"),
+    ("Свинина жирная", "Свинина нежирная"),
+    ("Творог жирный", "Творог нежирный"),
+    ("Курица вареная", "Курица жареная"),
+]
+
+
+class CanonicalTokensTest(unittest.TestCase):
+    def test_unit_parentheses_are_removed(self):
+        self.assertEqual(canonical_tokens("Яйцо куриное (1 шт.)"), canonical_tokens("яйцо куриное"))
+        self.assertEqual(canonical_tokens("Хлеб ржаной [на 100 г]"), canonical_tokens("Хлеб ржаной"))
+
+    def test_qualifiers_and_quantities_are_kept(self):
+        for first, second in DISTINCT_PAIRS:
+            with self.subTest(first=first, second=second):
+                self.assertNotEqual(canonical_tokens(first), canonical_tokens(second))
+
+
+class IsTypoTest(unittest.TestCase):
+    def test_typos(self):
+        self.assertTrue(is_typo("вареная", "варенная"))
+        self.assertTrue(is_typo("говядина", "говдяина"))
+
+    def test_distinct_words(self):
+        self.assertFalse(is_typo("вареная", "жареная"))
+        self.assertFalse(is_typo("жирная", "нежирная"))
+        self.assertFalse(is_typo("сырой", "сухой"))
+
+
+class NameReconcilerTest(unittest.TestCase):
+    def test_distinct_pairs_on_different_pages(self):
+        for fuzzy in (False, True):
+            for first, second in DISTINCT_PAIRS:
+                with self.subTest(fuzzy=fuzzy, first=first, second=second):
+                    reconciler = NameReconciler(fuzzy=fuzzy)
+                    reconciler.resolve_rows([(first, '1')])
+                    self.assertEqual(reconciler.resolve_rows([(second, '2')]), [(second, '2')])
+                    self.assertEqual(reconciler.merges, [])
+
+    def test_distinct_pairs_on_same_page(self):
+        for first, second in DISTINCT_PAIRS:
+            with self.subTest(first=first, second=second):
+                reconciler = NameReconciler(fuzzy=True)
+                rows = [(first, '1'), (second, '2')]
+                self.assertEqual(reconciler.resolve_rows(rows), rows)
+
+    def test_same_table_names_are_never_merged(self):
+        reconciler = NameReconciler(fuzzy=True)
+        reconciler.resolve_rows([("Курица вареная", '1')])
+        rows = [("Курица варенная", '2'), ("Курица вареная", '3'), ("курица  вареная", '4')]
+        self.assertEqual(reconciler.resolve_rows(rows), rows)
+
+    def test_names_separated_by_a_table_stay_separate_on_later_pages(self):
+        for fuzzy in (False, True):
+            with self.subTest(fuzzy=fuzzy):
+                reconciler = NameReconciler(fuzzy=fuzzy)
+                rows = [("Сыр", 1), ("Сыр (100 г)", 2)]
+                self.assertEqual(reconciler.resolve_rows(rows), rows)
+                self.assertEqual(reconciler.resolve_rows([("Сыр (100 г)", 3)]), [("Сыр (100 г)", 3)])
+                self.assertEqual(reconciler.resolve_rows([("Сыр", 4)]), [("Сыр", 4)])
+
+    def test_merged_name_separated_by_a_later_table(self):
+        reconciler = NameReconciler()
+        reconciler.resolve_rows([("Сыр", 1)])
+        self.assertEqual(reconciler.resolve_rows([("Сыр (100 г)", 2)]), [("Сыр", 2)])
+        rows = [("Сыр", 3), ("Сыр (100 г)", 4)]
+        self.assertEqual(reconciler.resolve_rows(rows), rows)
+        self.assertEqual(reconciler.resolve_rows([("Сыр (100 г)", 5)]), [("Сыр (100 г)", 5)])
+
+    def test_variants_on_different_pages_are_merged(self):
+        reconciler = NameReconciler()
+        reconciler.resolve_rows([("Яйцо куриное (1 шт.)", '1')])
+        self.assertEqual(reconciler.resolve_rows([("яйцо Куриное", '2')]), [("Яйцо куриное (1 шт.)", '2')])
+        self.assertEqual(reconciler.resolve_rows([("Курица вареная", '3')]), [("Курица вареная", '3')])
+        self.assertEqual(reconciler.resolve_rows([("Курица варенная", '4')]), [("Курица варенная", '4')])
+
+    def test_fuzzy_merges_typo(self):
+        reconciler = NameReconciler(fuzzy=True)
+        reconciler.resolve_rows([("Курица вареная", '1')])
+        self.assertEqual(reconciler.resolve_rows([("Курица варенная", '2')]), [("Курица вареная", '2')])
+        self.assertEqual(reconciler.merges[0]['method'], 'fuzzy')
+
+
+if __name__ == '__main__':
+    unittest.main()
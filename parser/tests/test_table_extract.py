@@ -0,0 +1,46 @@
+import os
+import unittest
+
+from table_extract import parse_table_rows_stream
+
+try:
+    import bs4
+except ImportError:
+    bs4 = None
+else:
+    from table_extract import parse_table_rows_bs4
+
+# Сохраненные страницы с трудными для разбора местами: вложенные таблицы, <br> в ячейках,
+# сущности HTML и незакрытые или лишние </td>
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+FIXTURE_PAGES = sorted(name for name in os.listdir(FIXTURES_DIR) if name.endswith('.html'))
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+class FixturePagesTest(unittest.TestCase):
+    def test_fixture_pages_have_rows(self):
+        self.assertTrue(FIXTURE_PAGES)
+        for name in FIXTURE_PAGES:
+            with self.subTest(page=name):
+                rows_data, tables_count = parse_table_rows_stream(read_fixture(name))
+                self.assertTrue(rows_data)
+                self.assertTrue(tables_count)
+
+
+@unittest.skipUnless(bs4, "нужен пакет beautifulsoup4")
+class StreamParityTest(unittest.TestCase):
+    def test_stream_matches_bs4(self):
+        for name in FIXTURE_PAGES:
+            with self.subTest(page=name):
+                html = read_fixture(name)
+                stream_rejected, bs4_rejected = {}, {}
+                self.assertEqual(parse_table_rows_stream(html, stream_rejected), parse_table_rows_bs4(html, bs4_rejected))
+                self.assertEqual(stream_rejected, bs4_rejected)
+
+
+if __name__ == '__main__':
+    unittest.main()